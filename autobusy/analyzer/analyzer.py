@@ -1,10 +1,27 @@
 import pandas as pd
 import numpy as np
 import autobusy.analyzer.util as util
-import plotly.graph_objects as go
-import folium
-from datetime import datetime
-import branca.colormap as cm
+import autobusy.analyzer.kernels as kernels
+import autobusy.analyzer.jit as jit
+import autobusy.analyzer.parallel as parallel
+import autobusy.analyzer.linref as linref
+import autobusy.analyzer.grid as grid
+import autobusy.analyzer.incremental as incremental
+import autobusy.analyzer.stages as stages
+import autobusy.analyzer.histogram as histogram
+import autobusy.analyzer.instrumentation as instrumentation
+import autobusy.analyzer.arrivals as arrivals
+import autobusy.analyzer.cube as cube
+import autobusy.analyzer.sketch as sketch
+import autobusy.analyzer.columnar as columnar
+from autobusy.analyzer.cache import ResultsCache
+from typing import TYPE_CHECKING
+import hashlib
+import json
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+    import folium
 
 
 class RouteData:
@@ -17,6 +34,19 @@ class RouteData:
         self.stop_info = stop_info
         self.line_route_info = line_route_info
         self.line_timetable_info = line_timetable_info
+        self._fingerprint = None
+
+    def fingerprint(self) -> str:
+        """
+        Gets a fingerprint of the route data. Route data is treated as immutable,
+        so the fingerprint is calculated only once.
+        :return: hex digest.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha1(stages.fingerprint(self.stop_info).encode())
+            digest.update(json.dumps([self.line_route_info, self.line_timetable_info], sort_keys=True).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
 
 
 class Analyzer:
@@ -24,64 +54,295 @@ class Analyzer:
     Class for analyzing live bus data and timetable data.
     """
 
-    def __init__(self, hour: int):
+    # stage name -> attributes of Results filled with the result of the stage
+    RESULT_ATTRIBUTES = {
+        'speed': ('speed_data',),
+        'places_speed': ('places_speed_data', 'places_grid'),
+        'places_speed_pyramid': ('places_speed_pyramid',),
+        'arrivals': ('arrival_data',),
+        'punctuality': ('punctuality_data', 'boundary_inaccuracy_count'),
+        'punctuality_cube': ('punctuality_cube',),
+        'stop_punctuality': ('stop_punctuality_data', 'stop_info'),
+        'speed_sketches': ('speed_sketches',),
+        'delay_sketches': ('delay_sketches',),
+        'distance': ('distance_data',),
+        'filtered_distance': ('filtered_distance_data',),
+        'longest_routes': ('longest_routes',),
+        'filtered_longest_routes': ('filtered_longest_routes',),
+    }
+
+    def __init__(self, hour: int, results_cache: ResultsCache = None, backend: str = 'auto',
+                 trace: bool = False, trace_memory: bool = True):
         """
         Constructor for the Analyzer class.
         :param hour: hour of the day to be analyzed.
+        :param results_cache: optional persistent cache of results, shared between runs.
+        :param backend: backend of the hot loops of the punctuality pipeline, 'numpy', 'numba' or 'auto'
+                        (numba if installed, see jit.get_backend). Results do not depend on the backend.
+        :param trace: whether to record the wall time, CPU time, peak memory and row counts of the stages
+                      in the trace of the results (see instrumentation.Tracer).
+        :param trace_memory: whether the trace includes peak memory, which slows allocations down.
         """
         self.hour = hour
+        self.backend = jit.get_backend(backend)
+        self.tracer = instrumentation.Tracer(trace_memory) if trace else None
         self.results = Results()
+        self.results.trace = self.tracer
+        self.executor = stages.StageExecutor({
+            'speed': stages.Stage(self.speed_data, ('live',), options=('workers',)),
+            'places_speed': stages.Stage(self.places_speed_data, ('speed',), ('resolution', 'hexagonal', 'fast_speed'),
+                                         defaults={'resolution': 0.01, 'hexagonal': False, 'fast_speed': 50}),
+            'places_speed_pyramid': stages.Stage(self.places_speed_pyramid, ('speed',),
+                                                 ('resolutions', 'hexagonal', 'fast_speed'),
+                                                 defaults={'hexagonal': False, 'fast_speed': 50}),
+            'arrivals': stages.Stage(self.arrival_data, ('live', 'route'), options=('workers',)),
+            'punctuality': stages.Stage(self.punctuality_data, ('arrivals', 'route')),
+            'punctuality_cube': stages.Stage(self.punctuality_cube, ('punctuality',)),
+            'stop_punctuality': stages.Stage(self.stop_punctuality_data, ('punctuality_cube', 'route'), ('tol',)),
+            'speed_sketches': stages.Stage(self.speed_sketches, ('live', 'speed'), ('k', 'resolution'),
+                                           defaults={'k': 200, 'resolution': 0.01}),
+            'delay_sketches': stages.Stage(self.delay_sketches, ('punctuality', 'route'), ('k', 'resolution'),
+                                           defaults={'k': 200, 'resolution': 0.01}),
+            'distance': stages.Stage(self.distance_data, ('live',), options=('workers',)),
+            'filtered_distance': stages.Stage(self.filtered_distance_data, ('live', 'speed'), options=('workers',)),
+            'longest_routes': stages.Stage(self.longest_routes, ('live', 'distance'), ('count',)),
+            'filtered_longest_routes': stages.Stage(self.longest_routes, ('live', 'filtered_distance'), ('count',)),
+        }, {'hour': hour}, results_cache)
+        self.incremental_state = None
+        self.incremental_route_data = None
+
+    @instrumentation.traced
+    def require(self, stage: str, live_bus_df: pd.DataFrame, route_data: RouteData = None, **params):
+        """
+        Computes a stage (and only the stages it depends on) and adds its result and the results
+        of the stages it depends on to the results.
+        Results are memoised, so repeated calls with the same data and parameters do not recompute anything.
+        :param stage: stage name, one of RESULT_ATTRIBUTES.
+        :param live_bus_df: dataframe with live bus data.
+        :param route_data: route data, needed only by punctuality stages.
+        :param params: parameters of the stage and the stages it depends on (e.g. tol, count, workers).
+        :return: result of the stage.
+        """
+        sources = {'live': self.partition(live_bus_df)}
+        if route_data is not None:
+            sources['route'] = route_data
+        source_fingerprints = {}
+        for name in self.executor.dependencies(stage):
+            result = self.executor.run(name, sources, params, source_fingerprints)
+            attributes = self.RESULT_ATTRIBUTES[name]
+            values = result if len(attributes) > 1 else (result,)
+            for attribute, value in zip(attributes, values):
+                setattr(self.results, attribute, value)
+        return result
+
+    def partition(self, live_bus_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Gets the part of live bus data used by the stages, i.e. pings with the analyzed hour in their time
+        or request time. Stages are keyed by this part only, so data appended for other hours
+        does not invalidate memoised or cached results.
+        :param live_bus_df: dataframe with live bus data.
+        :return: filtered dataframe.
+        """
+        return live_bus_df[(live_bus_df['RequestTime'].dt.hour == self.hour) |
+                           (live_bus_df['Time'].dt.hour == self.hour)]
+
+    def plot(self, plot_name: str, live_bus_df: pd.DataFrame, route_data: RouteData = None,
+             stage_params: dict = None, **plot_params):
+        """
+        Computes the results needed by a plot of the Results class and creates the plot.
+        :param plot_name: name of the plot method of the Results class, one of Results.PLOT_STAGES.
+        :param live_bus_df: dataframe with live bus data.
+        :param route_data: route data, needed only by punctuality plots.
+        :param stage_params: parameters of the stages (e.g. tol, count).
+        :param plot_params: parameters of the plot method.
+        :return: plot created by the plot method.
+        """
+        stage = Results.PLOT_STAGES[plot_name]
+        if plot_name == 'plot_longest_routes' and plot_params.get('filtered'):
+            stage = 'filtered_longest_routes'
+        self.require(stage, live_bus_df, route_data, **(stage_params or {}))
+        return getattr(self.results, plot_name)(**plot_params)
+
+    @instrumentation.traced
+    def speed_data(self, live_bus_df: pd.DataFrame, workers: int = 1) -> pd.DataFrame:
+        """
+        Calculates the speed of each bus between consecutive pings.
+        :param live_bus_df: dataframe with live bus data.
+        :param workers: number of worker processes, vehicles are processed in parallel if greater than 1.
+        :return: dataframe with speed data.
+        """
+        if workers > 1:
+            return self.parallel_vehicle_stage('speed_data', live_bus_df, workers)
+        live_bus_df, distance = self.vehicle_pings(live_bus_df)
+        hours = live_bus_df['Time'].diff().dt.total_seconds() / 3600
+        return pd.concat([
+            live_bus_df['VehicleNumber'], live_bus_df['Time'], live_bus_df['Lon'], live_bus_df['Lat'],
+            live_bus_df['Time'], util.speed(distance, hours.where(distance.notna())).rename('Speed')
+        ], axis=1).dropna().reset_index(drop=True)
 
-    def create_speed_data(self, live_bus_df: pd.DataFrame):
+    @instrumentation.traced
+    def vehicle_pings(self, live_bus_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
+        """
+        Gets the pings of the analyzed hour sorted by vehicle and time, with distances between consecutive pings.
+        Pings of different days are not paired, so archives of several days give the sums of the days.
+        :param live_bus_df: dataframe with live bus data.
+        :return: tuple of sorted dataframe and series of distances in km from the previous ping of the same vehicle
+                 on the same day (NaN for the first ping of each vehicle on each day).
+        """
+        live_bus_df = live_bus_df[(live_bus_df['RequestTime'].dt.hour == self.hour) &
+                                  (live_bus_df['Time'].dt.hour == self.hour)]
+        live_bus_df = live_bus_df.sort_values(['VehicleNumber', 'Time'], kind='stable')
+        vehicles = live_bus_df['VehicleNumber'].to_numpy()
+        days = service_days(live_bus_df)
+        group_start = np.r_[True, (vehicles[1:] != vehicles[:-1]) | (days[1:] != days[:-1])] \
+            if vehicles.shape[0] else np.zeros(0, dtype=bool)
+        distance = kernels.pair_distances(live_bus_df['Lon'], live_bus_df['Lat'], group_start)
+        return live_bus_df, pd.Series(distance, index=live_bus_df.index, name='Distance')
+
+    def create_speed_data(self, live_bus_df: pd.DataFrame, workers: int = 1):
         """
         Creates speed data from live bus data and adds it to the results.
         :param live_bus_df: dataframe with live bus data.
+        :param workers: number of worker processes, vehicles are processed in parallel if greater than 1.
         :return: None
         """
-        if self.results.speed_data is not None:
-            return
-        live_bus_df = live_bus_df[live_bus_df['RequestTime'].dt.hour == self.hour]
-        gk = live_bus_df[live_bus_df['Time'].dt.hour == self.hour].sort_values('Time').groupby('VehicleNumber')
-        self.results.speed_data = gk.apply(
-            lambda x: pd.concat([x['VehicleNumber'], x['Time'], x['Lon'], x['Lat'], x['Time'], util.speed(
-                util.distance(
-                    x['Lon'].shift(),
-                    x['Lat'].shift(),
-                    x['Lon'],
-                    x['Lat']
-                ),
-                (x['Time'] - x['Time'].shift()).dt.total_seconds() / 3600
-            ).rename("Speed")], axis=1)
-        ).dropna().reset_index(drop=True)
-
-    def create_places_speed_data(self, live_bus_df: pd.DataFrame):
+        self.require('speed', live_bus_df, workers=workers)
+
+    @instrumentation.traced
+    def parallel_vehicle_stage(self, stage: str, live_bus_df: pd.DataFrame, workers: int) -> pd.DataFrame:
+        """
+        Runs a per-vehicle stage (speed_data or distance_data) in a process pool. Live data is passed
+        to the workers through shared memory and split into shards of about equal size at vehicle boundaries.
+        The results of the shards are concatenated in the order of vehicle numbers,
+        so they are the same as the result of the serial stage.
+        :param stage: name of the method computing the stage.
+        :param live_bus_df: dataframe with live bus data.
+        :param workers: number of worker processes.
+        :return: result of the stage.
+        """
+        live_bus_df = live_bus_df[(live_bus_df['RequestTime'].dt.hour == self.hour) &
+                                  (live_bus_df['Time'].dt.hour == self.hour)]
+        live_bus_df = live_bus_df.sort_values('VehicleNumber', kind='stable')[
+            ['VehicleNumber', 'Lon', 'Lat', 'Time', 'RequestTime']
+        ]
+        bounds = parallel.balanced_bounds(live_bus_df['VehicleNumber'], 4 * workers)
+        if len(bounds) < 2:
+            return getattr(self, stage)(live_bus_df)
+        with parallel.SharedFrame(live_bus_df) as shared, shared.executor(workers) as executor:
+            futures = [
+                executor.submit(_vehicle_stage_worker, self.hour, stage, start, stop)
+                for start, stop in bounds
+            ]
+            return pd.concat([future.result() for future in futures], ignore_index=True)
+
+    @staticmethod
+    @instrumentation.traced
+    def places_speed_data(speed_data: pd.DataFrame, resolution: float = 0.01, hexagonal: bool = False,
+                          fast_speed: float = 50) -> tuple[pd.DataFrame, grid.Grid]:
+        """
+        Counts all and fast speed records in grid cells.
+        :param speed_data: dataframe with speed data.
+        :param resolution: size of the cells in degrees.
+        :param hexagonal: whether the cells are hexagonal.
+        :param fast_speed: speed in km/h above which a record is considered fast.
+        :return: tuple of dataframe with places speed data (cell centers, Total, Fast) and the grid.
+        """
+        cell_grid = grid.Grid(resolution, hexagonal)
+        places_speed_data = cell_grid.count(speed_data['Lon'], speed_data['Lat'],
+                                            {'Fast': speed_data['Speed'].to_numpy() > fast_speed})
+        return places_speed_data, cell_grid
+
+    @staticmethod
+    @instrumentation.traced
+    def places_speed_pyramid(speed_data: pd.DataFrame, resolutions: tuple[float, ...], hexagonal: bool = False,
+                             fast_speed: float = 50) -> dict[float, tuple[pd.DataFrame, grid.Grid]]:
+        """
+        Counts all and fast speed records in grid cells of several resolutions.
+        :param speed_data: dataframe with speed data.
+        :param resolutions: sizes of the cells in degrees.
+        :param hexagonal: whether the cells are hexagonal.
+        :param fast_speed: speed in km/h above which a record is considered fast.
+        :return: dictionary of resolution -> result of places_speed_data.
+        """
+        return {
+            resolution: Analyzer.places_speed_data(speed_data, resolution, hexagonal, fast_speed)
+            for resolution in resolutions
+        }
+
+    def create_places_speed_data(self, live_bus_df: pd.DataFrame, resolution: float = 0.01,
+                                 hexagonal: bool = False, fast_speed: float = 50, workers: int = 1):
         """
         Creates speed data for grid cells and adds it to the results.
         If speed data is not created, it is created first.
         :param live_bus_df: dataframe with live bus data.
+        :param resolution: size of the cells in degrees.
+        :param hexagonal: whether the cells are hexagonal.
+        :param fast_speed: speed in km/h above which a record is considered fast.
+        :param workers: number of worker processes used to create speed data.
         :return: None
         """
-        if self.results.places_speed_data is not None:
-            return
-        if self.results.speed_data is None:
-            self.create_speed_data(live_bus_df)
-        speed_data = self.results.speed_data
-        rounded_data = speed_data.round({'Lon': 2, 'Lat': 2})
-        gk = rounded_data.groupby(['Lon', 'Lat'])
-        self.results.places_speed_data = gk.apply(
-            lambda x: pd.Series(
-                [x.shape[0], x[x['Speed'] > 50].shape[0]],
-                index=['Total', 'Fast']
-            )
-        ).reset_index()
+        self.require('places_speed', live_bus_df, resolution=resolution, hexagonal=hexagonal, fast_speed=fast_speed,
+                     workers=workers)
+
+    def create_places_speed_pyramid(self, live_bus_df: pd.DataFrame, resolutions: tuple[float, ...],
+                                    hexagonal: bool = False, fast_speed: float = 50):
+        """
+        Creates speed data for grid cells of several resolutions and adds it to the results,
+        so that maps at different zoom levels can be plotted without recomputing.
+        :param live_bus_df: dataframe with live bus data.
+        :param resolutions: sizes of the cells in degrees.
+        :param hexagonal: whether the cells are hexagonal.
+        :param fast_speed: speed in km/h above which a record is considered fast.
+        :return: None
+        """
+        self.require('places_speed_pyramid', live_bus_df, resolutions=tuple(resolutions), hexagonal=hexagonal,
+                     fast_speed=fast_speed)
+
+    @instrumentation.traced
+    def ingest(self, snapshot_df: pd.DataFrame, route_data: RouteData = None):
+        """
+        Updates speed data, places speed data, distance data and (if route data is given) arrival data
+        in the results with new live data, e.g. a single snapshot from the API.
+        Only the new data is processed, using state carried over from previous calls (see IncrementalState).
+        Speed data and arrival data are assembled when they are read (see Results.defer), so the cost of a call
+        does not grow with the data ingested before. Speed data created before the first call is kept
+        and extended. Results of the create_* methods are not affected.
+        :param snapshot_df: dataframe with new live bus data.
+        :param route_data: route data.
+        :return: None
+        """
+        snapshot_df = snapshot_df[(snapshot_df['RequestTime'].dt.hour == self.hour) &
+                                  (snapshot_df['Time'].dt.hour == self.hour)]
+        if self.incremental_state is None:
+            self.incremental_state = incremental.IncrementalState()
+            if self.results.speed_data is not None:
+                self.incremental_state.speed_records.append(self.results.speed_data)
+        if route_data is not None:
+            if self.incremental_route_data is None or self.incremental_route_data[0] is not route_data:
+                new_line_route_info = self.get_max_opposite_routes(route_data.line_route_info)
+                self.incremental_route_data = (
+                    route_data, RouteData(route_data.stop_info, new_line_route_info, route_data.line_timetable_info)
+                )
+            route_data = self.incremental_route_data[1]
+
+        self.incremental_state.update(snapshot_df, route_data)
+        self.results.defer('speed_data', self.incremental_state.speed_data)
+        self.results.places_speed_data = self.incremental_state.places_speed_data()
+        self.results.places_grid = self.incremental_state.grid
+        self.results.distance_data = self.incremental_state.distance_data()
+        if route_data is not None:
+            self.results.defer('arrival_data', self.incremental_state.arrival_table)
 
     @staticmethod
-    def get_max_opposite_routes(line_route_info: dict[str, list[list[str]]]):
+    @instrumentation.traced
+    def get_max_opposite_routes(line_route_info: dict[str, list[list[str]]], backend: jit.Backend = None):
         """
         Gets the longest route and the longest route in the opposite direction for each line.
         :param line_route_info: dictionary of line number -> list of routes.
+        :param backend: backend counting inversions, the default one if not given.
         :return: dictionary of line number -> list of routes.
         """
+        backend = backend or jit.get_backend()
         res = {}
         for line in line_route_info:
             max_route = max(line_route_info[line], key=len)
@@ -92,7 +353,8 @@ class Analyzer:
                 max_route_groups.reverse()
                 route_groups, max_route_groups = util.get_common_sublists(route_groups, max_route_groups)
 
-                inversions = util.inversions(route_groups, max_route_groups)
+                route_index = {group: i for i, group in enumerate(route_groups)}
+                inversions = backend.inversions([route_index[group] for group in max_route_groups])
                 if inversions < len(route_groups) * (len(route_groups) - 1) / 4:
                     reversed_routes.append(route)
 
@@ -102,6 +364,7 @@ class Analyzer:
                 res[line] = [max_route, max(reversed_routes, key=len)]
         return res
 
+    @instrumentation.traced
     def initial_filter(self, live_bus_df: pd.DataFrame, route_data: RouteData):
         """
         Filters out buses that moved <= 1 km, have unknown lines or are not from the given hour.
@@ -109,219 +372,327 @@ class Analyzer:
         :param route_data: route data.
         :return: filtered dataframe.
         """
-
-        def filter_distance(df):
-            for index1, row1 in df.iterrows():
-                for index2, row2 in df.iterrows():
-                    if index1 != index2:
-                        if util.distance(row1['Lon'], row1['Lat'], row2['Lon'], row2['Lat']) > 1:
-                            return True
-            return False
-
         live_bus_df = live_bus_df.drop(live_bus_df[~live_bus_df["Lines"].isin(route_data.line_route_info)].index)
         live_bus_df = live_bus_df.drop(live_bus_df[live_bus_df["RequestTime"].dt.hour != self.hour].index)
         live_bus_df = live_bus_df.drop(live_bus_df[live_bus_df["Time"].dt.hour != self.hour].index)
-        return live_bus_df.groupby(['Lines', 'VehicleNumber']).filter(filter_distance)
+        return live_bus_df[self.moved(live_bus_df, 1)]
+
+    @staticmethod
+    @instrumentation.traced
+    def moved(live_bus_df: pd.DataFrame, distance: float) -> np.ndarray:
+        """
+        Marks the pings of buses (see bus_groups) with two pings further than a given distance apart.
+        Distances from the first ping of each bus decide for most buses: if one is larger than the distance,
+        the bus moved, if all are at most half of it, the bus did not. All pairs of pings are compared only
+        for the remaining buses.
+        :param live_bus_df: dataframe with live bus data.
+        :param distance: distance in km.
+        :return: boolean array, True for the pings of buses that moved.
+        """
+        group = bus_groups(live_bus_df)
+        lon = live_bus_df['Lon'].to_numpy(dtype=np.float64)
+        lat = live_bus_df['Lat'].to_numpy(dtype=np.float64)
+        order = np.argsort(group, kind='stable')
+        starts = np.searchsorted(group[order], np.arange(group.max(initial=-1) + 2))
+        first = order[starts[:-1]]
+        radius = np.zeros(starts.shape[0] - 1)
+        np.fmax.at(radius, group, kernels.haversine(lon[first][group], lat[first][group], lon, lat))
+        moved = radius > distance
+        for i in np.flatnonzero(~moved & (radius > distance / 2)):
+            rows = order[starts[i]:starts[i + 1]]
+            moved[i] = (kernels.many_to_many(lon[rows], lat[rows], lon[rows], lat[rows]) > distance).any()
+        return moved[group]
+
+    @staticmethod
+    def route_geometry(route_data: RouteData, line: str) -> linref.RouteGeometry:
+        """
+        Gets the geometry of the first (longest) route of a line.
+        :param route_data: route data.
+        :param line: line number.
+        :return: route geometry.
+        """
+        stops = route_data.stop_info.loc[route_data.line_route_info[line][0]]
+        return linref.RouteGeometry(stops['Lon'].to_numpy(), stops['Lat'].to_numpy())
 
     @staticmethod
-    def add_closest_stops(live_bus_df: pd.DataFrame, route_data: RouteData):
+    @instrumentation.traced
+    def add_route_positions(live_bus_df: pd.DataFrame, route_data: RouteData, backend: jit.Backend = None):
         """
-        Adds the closest stop of the route and the distance to it for each bus ping in the dataframe.
+        Projects each bus ping in the dataframe onto the first route of its line.
+        Adds the position along the route (Position, km), the distance from the route (Distance, km)
+        and the index of the closest stop along the route (Closest).
         :param live_bus_df: dataframe with live bus data.
         :param route_data: route data.
+        :param backend: backend projecting the pings, the default one if not given.
         :return: None
         """
-        gk = live_bus_df.sort_values('Time').groupby(['Lines', 'VehicleNumber'])
-        for name, group in gk:
-            max_route = route_data.line_route_info[name[0]][0]
-            for index, row in group.iterrows():
-                dist_arr = np.array(
-                    [
-                        util.distance(
-                            row['Lon'],
-                            row['Lat'],
-                            route_data.stop_info.loc[stop, 'Lon'],
-                            route_data.stop_info.loc[stop, 'Lat']
-                        )
-                        for stop in max_route
-                    ]
-                )
-                min_dist = np.min(dist_arr)
-                id_min_dist = np.argmin(dist_arr)
-                live_bus_df.loc[index, 'Closest'] = id_min_dist
-                live_bus_df.loc[index, 'Distance'] = min_dist
+        backend = backend or jit.get_backend()
+        live_bus_df['Position'] = np.nan
+        live_bus_df['Distance'] = np.nan
+        live_bus_df['Closest'] = -1
+        for line, group in live_bus_df.groupby('Lines'):
+            geometry = Analyzer.route_geometry(route_data, line)
+            position, offset = backend.project(geometry, group['Lon'].to_numpy(), group['Lat'].to_numpy())
+            live_bus_df.loc[group.index, 'Position'] = position
+            live_bus_df.loc[group.index, 'Distance'] = offset
+            live_bus_df.loc[group.index, 'Closest'] = geometry.closest_stops(position)
 
     @staticmethod
+    @instrumentation.traced
     def filter_stationary_buses(live_bus_df: pd.DataFrame):
         """
-        Filters out pings of buses that are >= 1 km from the closest stop.
-        Then filters out buses that have less than 3 different closest stops.
+        Filters out pings of buses that are > 1 km from the route.
+        Then filters out buses (see bus_groups) that have less than 3 different closest stops.
         :param live_bus_df: dataframe with live bus data.
         :return: filtered dataframe.
         """
         live_bus_df = live_bus_df.drop(live_bus_df[live_bus_df['Distance'] > 1].index)
-        return live_bus_df.groupby(['Lines', 'VehicleNumber']).filter(lambda x: x['Closest'].nunique() > 2)
+        return live_bus_df.groupby(bus_groups(live_bus_df)).filter(lambda x: x['Closest'].nunique() > 2)
 
     @staticmethod
-    def get_types(lst: np.array) -> list[int]:
+    @instrumentation.traced
+    def add_directions(live_bus_df: pd.DataFrame, backend: jit.Backend = None):
         """
-        Gets the direction of the bus based on the closest stops. 1 for forward, 0 for backward, -1 for unknown.
-        :param lst: array of closest stops.
-        :return: list of directions.
+        Splits the pings of each bus (see bus_groups) into trips (see linref.segment_trips) and adds the trip id (Trip)
+        and the direction of the bus (Direction) to the dataframe. 0 for forward, 1 for backward
+        (i.e. the index of the route the bus runs). Drops pings of buses with unknown direction.
+        The dataframe is sorted by line, vehicle and time.
+        :param live_bus_df: dataframe with live bus data, with positions (see add_route_positions).
+        :param backend: backend segmenting the trips, the default one if not given.
+        :return: None
         """
-        left_min_idx = np.where(lst == np.min(lst))[0][0]
-        right_min_idx = np.where(lst == np.min(lst))[0][-1]
-        left_max_idx = np.where(lst == np.max(lst))[0][0]
-        right_max_idx = np.where(lst == np.max(lst))[0][-1]
-
-        middle_min = (left_min_idx >= 3 and right_min_idx <= len(lst) - 4)
-        middle_max = (left_max_idx >= 3 and right_max_idx <= len(lst) - 4)
-
-        if middle_min and middle_max:
-            return [-1] * len(lst)
+        backend = backend or jit.get_backend()
+        live_bus_df.sort_values(['Lines', 'VehicleNumber', 'Time'], kind='stable', inplace=True)
+        group = bus_groups(live_bus_df)
+        trip, direction = backend.segment_trips(group, live_bus_df['Position'].to_numpy())
+        live_bus_df['Trip'] = trip
+        live_bus_df['Direction'] = direction
+        live_bus_df.drop(live_bus_df[live_bus_df['Direction'] == -1].index, inplace=True)
+        live_bus_df.reset_index(drop=True, inplace=True)
 
-        if middle_min:
-            if np.max(lst[left_min_idx:right_min_idx + 1], initial=-1) == np.max(lst):
-                return [-1] * len(lst)
-            return [1 if i <= left_min_idx else 0 if i >= right_min_idx else -1 for i in range(len(lst))]
+    @staticmethod
+    @instrumentation.traced
+    def arrival_events(live_bus_df: pd.DataFrame, route_data: RouteData,
+                       backend: jit.Backend = None) -> arrivals.ArrivalTable:
+        """
+        Gets the arrivals of buses at stops. Stops of each route are projected onto the first route
+        of the line and the times at which a bus passed them are interpolated between consecutive pings.
+        Stops further than 1 km from the first route are skipped. Stops up to 300 m outside the part of the route
+        covered by the pings of a bus (e.g. a terminus where the bus was seen just after departing) get the time
+        of the closest ping.
+        :param live_bus_df: dataframe with live bus data, with positions (see add_route_positions)
+                            and trips (see add_directions).
+        :param route_data: route data.
+        :param backend: backend projecting the stops, the default one if not given.
+        :return: arrival table with one event per bus passing a stop.
+        """
+        backend = backend or jit.get_backend()
+        trips = []
+        lines = live_bus_df['Lines'].unique()
+        for line in lines:
+            geometry = Analyzer.route_geometry(route_data, line)
+            line_data = live_bus_df[live_bus_df['Lines'] == line]
+            for i, route in enumerate(route_data.line_route_info[line]):
+                stops = route_data.stop_info.loc[route]
+                stop_position, stop_offset = backend.project(geometry, stops['Lon'].to_numpy(),
+                                                             stops['Lat'].to_numpy())
+                near = stop_offset < 1
+                route = np.asarray(route)[near]
+                stop_position = stop_position[near]
+                gk = line_data[line_data['Direction'] == i].sort_values('Time').groupby('Trip')
+                for _, group in gk:
+                    times = linref.passage_times(
+                        group['Position'].to_numpy(),
+                        group['Time'].to_numpy().astype(np.int64),
+                        stop_position,
+                        forward=(i == 0),
+                        tolerance=0.3
+                    )
+                    passed = ~np.isnan(times)
+                    brigade = group['Brigade'].iloc[0] if 'Brigade' in group else None
+                    trips.append((line, i, group['VehicleNumber'].iloc[0], brigade, route[passed], times[passed],
+                                  stop_position[passed]))
+        return arrivals.ArrivalTable.from_trips(trips, lines)
 
-        if middle_max:
-            if np.min(lst[left_max_idx:right_max_idx + 1], initial=-1) == np.min(lst):
-                return [-1] * len(lst)
-            return [0 if i <= left_max_idx else 1 if i >= right_max_idx else -1 for i in range(len(lst))]
+    @instrumentation.traced
+    def get_differences(self, arrival_table: arrivals.ArrivalTable,
+                        route_data: RouteData) -> tuple[pd.DataFrame, int]:
+        """
+        Gets the differences between the timetable and the live data. The closest arrival to each departure
+        in the analyzed hour on each day with arrivals is found with a binary search in the arrival table
+        (see ArrivalTable.closest), so every departure is compared once per day.
+        :param arrival_table: arrival table.
+        :param route_data: route data.
+        :return: tuple:
+                    dataframe with differences, ordered by day: line number (Line),
+                        stop ID (Stop),
+                        departure time (Departure),
+                        closest arrival time (Closest),
+                        difference in minutes (Difference),
+                        comment (Early, Late, On time) (Comment),
+                    number of records removed because of inaccuracies near the boundary of the time interval.
+        """
+        lines, stops, departures, minutes = [], [], [], []
+        for line in arrival_table.lines:
+            for stop, departure_times in route_data.line_timetable_info[line].items():
+                for departure_time in departure_times:
+                    hour, minute = departure_time.split(':')
+                    if int(hour) != self.hour:
+                        continue
+                    lines.append(line)
+                    stops.append(stop)
+                    departures.append(departure_time)
+                    minutes.append(int(minute))
+        days = arrival_table.days()
+        if not days.shape[0]:
+            # no arrivals, every departure is missed once
+            days = np.zeros(1, dtype=np.int64)
+        count = len(minutes)
+        lines = np.tile(np.asarray(lines, dtype=object), days.shape[0])
+        stops = np.tile(np.asarray(stops, dtype=object), days.shape[0])
+        departures = np.tile(np.asarray(departures, dtype=object), days.shape[0])
+        minutes = np.tile(np.asarray(minutes, dtype=np.int64), days.shape[0])
+        index = arrival_table.closest(lines, stops, self.hour * 60 + minutes, np.repeat(days, count))
+        found = index >= 0
+        closest = arrival_table.epoch_minutes()[index[found]]
+        difference = closest - (np.repeat(days, count)[found] * arrivals.MINUTES_PER_DAY + self.hour * 60 +
+                                minutes[found])
+        kept = (np.abs(difference) <= minutes[found]) & (np.abs(difference) <= 60 - minutes[found])
+        rows = np.flatnonzero(found)[kept]
+        closest = closest[kept] % arrivals.MINUTES_PER_DAY
+        difference = difference[kept]
+        differences = pd.DataFrame({
+            'Line': lines[rows],
+            'Stop': stops[rows],
+            'Departure': departures[rows],
+            'Closest': [f'{x // 60:02d}:{x % 60:02d}' for x in closest],
+            'Difference': np.abs(difference).astype(np.float64),
+            'Comment': np.where(difference < 0, 'Early', np.where(difference > 0, 'Late', 'On time')).astype(object),
+        })
+        return differences, int(minutes.shape[0] - rows.shape[0])
 
-        if left_min_idx < 3:
-            return [0 if right_min_idx <= i <= left_max_idx else -1 for i in range(len(lst))]
-        return [1 if right_max_idx <= i <= left_min_idx else -1 for i in range(len(lst))]
+    @instrumentation.traced
+    def line_arrival_events(self, live_bus_df: pd.DataFrame, route_data: RouteData) -> arrivals.ArrivalTable:
+        """
+        Runs the part of the punctuality pipeline that depends on live bus data. Vehicles are processed
+        independently, so the data can be split by vehicle and the results merged (see ArrivalTable.concat).
+        :param live_bus_df: dataframe with live bus data.
+        :param route_data: route data with at most two opposite routes per line.
+        :return: arrival table.
+        """
+        live_bus_df = self.initial_filter(live_bus_df, route_data)
+        self.add_route_positions(live_bus_df, route_data, self.backend)
+        live_bus_df = self.filter_stationary_buses(live_bus_df)
+        self.add_directions(live_bus_df, self.backend)
+        return self.arrival_events(live_bus_df, route_data, self.backend)
 
-    @staticmethod
-    def add_directions(live_bus_df: pd.DataFrame):
+    @instrumentation.traced
+    def parallel_line_arrival_events(self, live_bus_df: pd.DataFrame, route_data: RouteData,
+                                     workers: int) -> arrivals.ArrivalTable:
         """
-        Adds the direction of the bus to the dataframe. 1 for forward, 0 for backward.
-        Drops pings of buses with unknown direction.
+        Runs the part of the punctuality pipeline that depends on live bus data in a process pool, one task per line.
+        Live data is passed to the workers through shared memory.
         :param live_bus_df: dataframe with live bus data.
-        :return: None
+        :param route_data: route data with at most two opposite routes per line.
+        :param workers: number of worker processes.
+        :return: same as line_arrival_events.
         """
-        gk = live_bus_df.sort_values('Time').groupby(['Lines', 'VehicleNumber'])
-        live_bus_df['Direction'] = gk['Closest'].transform(lambda x: Analyzer.get_types(x.values))
-        live_bus_df.drop(live_bus_df[live_bus_df['Direction'] == -1].index, inplace=True)
-        live_bus_df.reset_index(drop=True, inplace=True)
+        live_bus_df = live_bus_df[live_bus_df['Lines'].isin(route_data.line_route_info) &
+                                  (live_bus_df['RequestTime'].dt.hour == self.hour) &
+                                  (live_bus_df['Time'].dt.hour == self.hour)]
+        line_order = sorted(live_bus_df['Lines'].unique())
+        columns = ['Lines', 'VehicleNumber', 'Lon', 'Lat', 'Time', 'RequestTime']
+        if 'Brigade' in live_bus_df:
+            columns.append('Brigade')
+        live_bus_df = live_bus_df.sort_values('Lines', kind='stable')[columns]
+        bounds = parallel.shard_bounds(live_bus_df['Lines'])
 
-    @staticmethod
-    def min_dist_and_time(group: pd.DataFrame, stop: str, route_data: RouteData) -> tuple[float, str]:
+        with parallel.SharedFrame(live_bus_df) as shared, shared.executor(workers) as executor:
+            futures = {}
+            # largest shards first for better load balancing
+            for line in sorted(line_order, key=lambda x: bounds[x][0] - bounds[x][1]):
+                line_stops = set(stop for route in route_data.line_route_info[line] for stop in route)
+                line_route_data = RouteData(
+                    route_data.stop_info[route_data.stop_info.index.isin(line_stops)],
+                    {line: route_data.line_route_info[line]},
+                    {line: route_data.line_timetable_info[line]}
+                )
+                futures[line] = executor.submit(
+                    _line_arrivals_worker, self.hour, self.backend.name, *bounds[line],
+                    line_route_data
+                )
+            return arrivals.ArrivalTable.concat([futures[line].result() for line in line_order])
+
+    @instrumentation.traced
+    def arrival_data(self, live_bus_df: pd.DataFrame, route_data: RouteData,
+                     workers: int = 1) -> arrivals.ArrivalTable:
         """
-        Gets the minimum distance and the time of the closest ping to the stop.
-        :param group: dataframe with pings of a single bus in a single direction.
-        :param stop: stop ID.
+        Calculates the arrivals of buses at stops from live bus data.
+        :param live_bus_df: dataframe with live bus data.
         :param route_data: route data.
-        :return: tuple of minimum distance and time.
-        """
-        min_dist = np.inf
-        min_time = None
-        for _, row in group.iterrows():
-            dist = util.distance(
-                row['Lon'],
-                row['Lat'],
-                route_data.stop_info.loc[stop, 'Lon'],
-                route_data.stop_info.loc[stop, 'Lat']
-            )
-            if dist < min_dist:
-                min_dist = dist
-                min_time = row['Time'].round('min').strftime('%H:%M')
-        return min_dist, min_time
+        :param workers: number of worker processes, lines are processed in parallel if greater than 1.
+        :return: arrival table.
+        """
+        new_line_route_info = self.get_max_opposite_routes(route_data.line_route_info, self.backend)
+        route_data = RouteData(route_data.stop_info, new_line_route_info, route_data.line_timetable_info)
+        if workers > 1:
+            return self.parallel_line_arrival_events(live_bus_df, route_data, workers)
+        return self.line_arrival_events(live_bus_df, route_data)
 
-    @staticmethod
-    def stop_arrival_info(live_bus_df: pd.DataFrame, route_data: RouteData) -> dict[str, dict[str, list[str]]]:
+    def create_arrival_data(self, live_bus_df: pd.DataFrame, route_data: RouteData, workers: int = 1):
         """
-        Gets the arrival times of buses at stops.
+        Creates the arrivals of buses at stops from live bus data and adds them to the results.
         :param live_bus_df: dataframe with live bus data.
         :param route_data: route data.
-        :return: dictionary of line number -> dictionary of stop -> list of arrival times.
-        """
-        stop_arrival_info = {}
-        for line in live_bus_df['Lines'].unique():
-            stop_arrival_info[line] = {}
-            stops = set(route_data.line_route_info[line][0])
-            if len(route_data.line_route_info[line]) > 1:
-                stops = stops | set(route_data.line_route_info[line][1])
-            for stop in stops:
-                for i in range(0, len(route_data.line_route_info[line])):
-                    if stop in route_data.line_route_info[line][i]:
-                        cut_data = live_bus_df[(live_bus_df['Lines'] == line) & (live_bus_df['Direction'] == i)]
-                        gk = cut_data.sort_values('Time').groupby('VehicleNumber')
-                        for _, group in gk:
-                            min_dist, min_time = Analyzer.min_dist_and_time(group, stop, route_data)
-                            if min_dist < 1:
-                                if stop in stop_arrival_info[line]:
-                                    stop_arrival_info[line][stop].append(min_time)
-                                else:
-                                    stop_arrival_info[line][stop] = [min_time]
-        return stop_arrival_info
-
-    def get_differences(self, stop_arrival_info: dict[str, dict[str, list[str]]],
-                        route_data: RouteData) -> tuple[list[pd.Series], int]:
-        """
-        Gets the differences between the timetable and the live data.
-        :param stop_arrival_info: dictionary of line number -> dictionary of stop -> list of arrival times.
+        :param workers: number of worker processes, lines are processed in parallel if greater than 1.
+        :return: None
+        """
+        self.require('arrivals', live_bus_df, route_data, workers=workers)
+
+    @instrumentation.traced
+    def punctuality_data(self, arrival_table: arrivals.ArrivalTable,
+                         route_data: RouteData) -> tuple[pd.DataFrame, int]:
+        """
+        Calculates punctuality data from the arrivals of buses and timetable data.
+        :param arrival_table: arrival table (see arrival_data).
         :param route_data: route data.
-        :return: tuple:
-                    list of series with differences: line number,
-                        stop ID,
-                        departure time,
-                        closest timetable time,
-                        difference,
-                        comment (Early, Late, On Time),
-                    number of records removed because of inaccuracies near the boundary of the time interval.
+        :return: tuple of dataframe with differences (see get_differences)
+                 and number of records removed because of inaccuracies near the boundary of the time interval.
         """
-        differences = []
-        boundary_bus_count = 0
+        return self.get_differences(arrival_table, route_data)
 
-        for line in stop_arrival_info:
-            for stop in route_data.line_timetable_info[line]:
-                for departure_time in route_data.line_timetable_info[line][stop]:
-                    datetime_object = datetime.strptime(departure_time, '%H:%M')
-                    if datetime_object.hour != self.hour:
-                        continue
-                    if stop not in stop_arrival_info[line]:
-                        boundary_bus_count += 1
-                        continue
-                    closest_time = min(
-                        stop_arrival_info[line][stop],
-                        key=lambda x: np.abs(datetime.strptime(x, '%H:%M') - datetime_object)
-                    )
-                    difference = (datetime.strptime(closest_time, '%H:%M') - datetime_object).total_seconds() // 60
-                    if abs(difference) > datetime_object.minute or abs(difference) > 60 - datetime_object.minute:
-                        boundary_bus_count += 1
-                        continue
-                    differences.append(pd.Series({
-                        'Line': line,
-                        'Stop': stop,
-                        'Departure': departure_time,
-                        'Closest': closest_time,
-                        'Difference': abs(difference),
-                        'Comment': 'Early' if difference < 0 else 'Late' if difference > 0 else 'On time'
-                    }))
-        return differences, boundary_bus_count
-
-    def create_punctuality_data(self, live_bus_df: pd.DataFrame, route_data: RouteData):
+    def create_punctuality_data(self, live_bus_df: pd.DataFrame, route_data: RouteData, workers: int = 1):
         """
         Creates punctuality data from live bus data and timetable data and adds it to the results.
         :param live_bus_df: dataframe with live bus data.
         :param route_data: route data.
+        :param workers: number of worker processes, lines are processed in parallel if greater than 1.
         :return: None
         """
-        if self.results.punctuality_data is not None:
-            return
-        new_line_route_info = self.get_max_opposite_routes(route_data.line_route_info)
-        route_data = RouteData(route_data.stop_info, new_line_route_info, route_data.line_timetable_info)
-        live_bus_df = self.initial_filter(live_bus_df, route_data)
-        self.add_closest_stops(live_bus_df, route_data)
-        live_bus_df = self.filter_stationary_buses(live_bus_df)
-        self.add_directions(live_bus_df)
-        stop_arrival_info = self.stop_arrival_info(live_bus_df, route_data)
-        differences, boundary_bus_count = self.get_differences(stop_arrival_info, route_data)
-        self.results.punctuality_data = pd.DataFrame(differences)
-        self.results.boundary_inaccuracy_count = boundary_bus_count
+        self.require('punctuality', live_bus_df, route_data, workers=workers)
+
+    @staticmethod
+    @instrumentation.traced
+    def punctuality_cube(punctuality: tuple[pd.DataFrame, int]) -> cube.PunctualityCube:
+        """
+        Aggregates punctuality data into counts of arrivals by line, stop, hour and difference.
+        :param punctuality: result of punctuality_data.
+        :return: punctuality cube.
+        """
+        return cube.PunctualityCube.from_punctuality(punctuality[0])
+
+    @staticmethod
+    @instrumentation.traced
+    def stop_punctuality_data(punctuality_cube: cube.PunctualityCube, route_data: RouteData,
+                              tol: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Counts all and late departures for each stop.
+        :param punctuality_cube: result of punctuality_cube.
+        :param route_data: route data.
+        :param tol: tolerance for punctuality in minutes.
+        :return: tuple of dataframe with stop punctuality data and dataframe with stop information.
+        """
+        return punctuality_cube.stop_punctuality(tol), route_data.stop_info
 
     def create_stop_punctuality_data(self, live_bus_df: pd.DataFrame, route_data: RouteData, tol: int):
         """
@@ -332,49 +703,120 @@ class Analyzer:
         :param tol: tolerance for punctuality in minutes.
         :return: None
         """
-        if self.results.punctuality_data is None:
-            self.create_punctuality_data(live_bus_df, route_data)
+        self.require('stop_punctuality', live_bus_df, route_data, tol=tol)
+
+    @staticmethod
+    @instrumentation.traced
+    def speed_sketches(live_bus_df: pd.DataFrame, speed_data: pd.DataFrame, k: int = 200,
+                       resolution: float = 0.01) -> sketch.SketchSet:
+        """
+        Sketches the distribution of speeds of all the speed records, per line, per grid cell and per hour.
+        :param live_bus_df: dataframe with live bus data, used to find the line of each speed record.
+        :param speed_data: dataframe with speed data.
+        :param k: parameter of the sketches (see sketch.KLLSketch).
+        :param resolution: size of the grid cells in degrees.
+        :return: sketch set of speeds in km/h.
+        """
+        speed_data = speed_data.loc[:, ~speed_data.columns.duplicated()]
+        lines = live_bus_df[['VehicleNumber', 'Time', 'Lines']].drop_duplicates(['VehicleNumber', 'Time'])
+        speed_data = speed_data.merge(lines, on=['VehicleNumber', 'Time'], how='left')
+        sketches = sketch.SketchSet(k, resolution, seed=0)
+        sketches.update(speed_data['Speed'], speed_data['Lines'].fillna(''), speed_data['Lon'], speed_data['Lat'],
+                        speed_data['Time'].dt.hour)
+        return sketches
+
+    @staticmethod
+    @instrumentation.traced
+    def delay_sketches(punctuality: tuple[pd.DataFrame, int], route_data: RouteData, k: int = 200,
+                       resolution: float = 0.01) -> sketch.SketchSet:
+        """
+        Sketches the distribution of delays of all the arrivals, per line, per grid cell of the stop
+        and per hour of the timetable departure.
+        :param punctuality: result of punctuality_data.
+        :param route_data: route data.
+        :param k: parameter of the sketches (see sketch.KLLSketch).
+        :param resolution: size of the grid cells in degrees.
+        :return: sketch set of delays in minutes, negative for early arrivals.
+        """
+        punctuality_data = punctuality[0]
+        stops = route_data.stop_info.reindex(punctuality_data['Stop'])
+        hours = [int(departure.split(':')[0]) % 24 for departure in punctuality_data['Departure']]
+        sketches = sketch.SketchSet(k, resolution, seed=0)
+        sketches.update(cube.signed_differences(punctuality_data), punctuality_data['Line'],
+                        stops['Lon'].to_numpy(), stops['Lat'].to_numpy(), hours)
+        return sketches
+
+    def create_sketches(self, live_bus_df: pd.DataFrame, route_data: RouteData = None, k: int = 200,
+                        resolution: float = 0.01, workers: int = 1):
+        """
+        Creates sketches of speeds and (if route data is given) delays and adds them to the results.
+        Sketch sets of different hours or days can be merged (see sketch.SketchSet.merge).
+        If speed data or punctuality data is not created, it is created first.
+        :param live_bus_df: dataframe with live bus data.
+        :param route_data: route data.
+        :param k: parameter of the sketches (see sketch.KLLSketch).
+        :param resolution: size of the grid cells in degrees.
+        :param workers: number of worker processes used to create speed and punctuality data.
+        :return: None
+        """
+        self.require('speed_sketches', live_bus_df, k=k, resolution=resolution, workers=workers)
+        if route_data is not None:
+            self.require('delay_sketches', live_bus_df, route_data, k=k, resolution=resolution, workers=workers)
 
-        gk = self.results.punctuality_data.groupby('Stop')
-        self.results.stop_punctuality_data = gk.apply(
-            lambda x: pd.Series([x.shape[0], x[(x['Difference'] > tol) & (x['Comment'] == 'Late')].shape[0]],
-                                index=['Total', 'Late'])).reset_index()
-        self.results.stop_info = route_data.stop_info
+    @instrumentation.traced
+    def distance_data(self, live_bus_df: pd.DataFrame, workers: int = 1) -> pd.DataFrame:
+        """
+        Calculates the distance covered by each bus.
+        :param live_bus_df: dataframe with live bus data.
+        :param workers: number of worker processes, vehicles are processed in parallel if greater than 1.
+        :return: dataframe with distance data.
+        """
+        if workers > 1:
+            return self.parallel_vehicle_stage('distance_data', live_bus_df, workers)
+        live_bus_df, distance = self.vehicle_pings(live_bus_df)
+        moved = distance.notna()
+        return distance[moved].groupby(live_bus_df['VehicleNumber'][moved]).sum().reset_index()
 
-    def create_distance_data(self, live_bus_df: pd.DataFrame, filter_measurement_errors: bool = False):
+    @instrumentation.traced
+    def filtered_distance_data(self, live_bus_df: pd.DataFrame, speed_data: pd.DataFrame,
+                               workers: int = 1) -> pd.DataFrame:
+        """
+        Calculates the distance covered by each bus, skipping buses with measurement errors
+        (pings with speed > 100 km/h).
+        :param live_bus_df: dataframe with live bus data.
+        :param speed_data: dataframe with speed data.
+        :param workers: number of worker processes, vehicles are processed in parallel if greater than 1.
+        :return: dataframe with distance data.
+        """
+        high_speed_data = speed_data[speed_data['Speed'] > 100]
+        return self.distance_data(live_bus_df[~live_bus_df['VehicleNumber'].isin(high_speed_data['VehicleNumber'])],
+                                  workers)
+
+    def create_distance_data(self, live_bus_df: pd.DataFrame, filter_measurement_errors: bool = False,
+                             workers: int = 1):
         """
         Creates distance data from live bus data and adds it to the results.
         :param live_bus_df: dataframe with live bus data.
         :param filter_measurement_errors: whether to filter out measurement errors (pings with speed > 100 km/h).
+        :param workers: number of worker processes, vehicles are processed in parallel if greater than 1.
         :return: None
         """
-        if not filter_measurement_errors and self.results.distance_data is not None:
-            return
-        if filter_measurement_errors:
-            if self.results.filtered_distance_data is not None:
-                return
-            if self.results.speed_data is None:
-                self.create_speed_data(live_bus_df)
-            high_speed_data = self.results.speed_data[self.results.speed_data['Speed'] > 100]
-            live_bus_df = live_bus_df.drop(live_bus_df[live_bus_df['VehicleNumber'].isin(
-                high_speed_data['VehicleNumber'])].index
-            )
-
-        live_bus_df = live_bus_df[live_bus_df['RequestTime'].dt.hour == self.hour]
-        gk = live_bus_df[live_bus_df['Time'].dt.hour == self.hour].sort_values('Time').groupby('VehicleNumber')
-
-        distance_data = gk.apply(
-            lambda x: pd.concat([x['VehicleNumber'], util.distance(
-                x['Lon'].shift(),
-                x['Lat'].shift(),
-                x['Lon'],
-                x['Lat']
-            ).rename("Distance")], axis=1)
-        ).dropna().reset_index(drop=True)
-
-        self.results.distance_data = distance_data.groupby('VehicleNumber').apply(
-            lambda x: pd.Series([x['Distance'].sum()], index=['Distance'])
-        ).reset_index()
+        self.require('filtered_distance' if filter_measurement_errors else 'distance', live_bus_df, workers=workers)
+
+    @instrumentation.traced
+    def longest_routes(self, live_bus_df: pd.DataFrame, distance_data: pd.DataFrame, count: int) -> pd.DataFrame:
+        """
+        Gets the pings of the buses that covered the longest distances.
+        :param live_bus_df: dataframe with live bus data.
+        :param distance_data: dataframe with distance data.
+        :param count: number of longest routes to get.
+        :return: dataframe with pings and distances of the buses.
+        """
+        distance_data = distance_data.nlargest(count, 'Distance')
+
+        live_bus_df = live_bus_df[live_bus_df['Time'].dt.hour == self.hour]
+        live_bus_df = live_bus_df[live_bus_df['VehicleNumber'].isin(distance_data['VehicleNumber'])]
+        return live_bus_df.merge(distance_data, on='VehicleNumber')
 
     def create_longest_routes(self, live_bus_df: pd.DataFrame, count: int, filter_measurement_errors: bool = False):
         """
@@ -384,24 +826,56 @@ class Analyzer:
         :param filter_measurement_errors: whether to filter out measurement errors (pings with speed > 100 km/h).
         :return: None
         """
-        if not filter_measurement_errors and self.results.longest_routes is not None:
-            return
-        if filter_measurement_errors and self.results.filtered_longest_routes is not None:
-            return
-        if not filter_measurement_errors and self.results.distance_data is None:
-            self.create_distance_data(live_bus_df)
-        if filter_measurement_errors and self.results.filtered_distance_data is None:
-            self.create_distance_data(live_bus_df, filter_measurement_errors=True)
+        self.require('filtered_longest_routes' if filter_measurement_errors else 'longest_routes',
+                     live_bus_df, count=count)
 
-        distance_data = self.results.distance_data.nlargest(count, 'Distance')
 
-        live_bus_df = live_bus_df[live_bus_df['Time'].dt.hour == self.hour]
-        live_bus_df = live_bus_df[live_bus_df['VehicleNumber'].isin(distance_data['VehicleNumber'])]
+def service_days(live_bus_df: pd.DataFrame) -> np.ndarray:
+    """
+    Gets the service days of pings, i.e. the dates of their times.
+    :param live_bus_df: dataframe with live bus data.
+    :return: array of days since the epoch.
+    """
+    return live_bus_df['Time'].to_numpy().astype('datetime64[D]').astype(np.int64)
 
-        if filter_measurement_errors:
-            self.results.filtered_longest_routes = live_bus_df.merge(distance_data, on='VehicleNumber')
-        else:
-            self.results.longest_routes = live_bus_df.merge(distance_data, on='VehicleNumber')
+
+def bus_groups(live_bus_df: pd.DataFrame) -> np.ndarray:
+    """
+    Numbers the buses of live data: pings of the same line and vehicle on the same day.
+    :param live_bus_df: dataframe with live bus data.
+    :return: array of bus numbers, in the order of the first pings of the buses.
+    """
+    return live_bus_df.groupby([live_bus_df['Lines'].to_numpy(), live_bus_df['VehicleNumber'].to_numpy(),
+                                service_days(live_bus_df)], sort=False).ngroup().to_numpy()
+
+
+def _vehicle_stage_worker(hour: int, stage: str, start: int, stop: int) -> pd.DataFrame:
+    """
+    Runs a per-vehicle stage on a slice of the live data shared with the worker process (see parallel.SharedFrame).
+    :param hour: hour of the day to be analyzed.
+    :param stage: name of the method of the Analyzer class computing the stage.
+    :param start: first row of the slice.
+    :param stop: row after the last row of the slice.
+    :return: result of the stage for the slice.
+    """
+    live_bus_df = parallel.SharedFrame.worker_slice(start, stop)
+    return getattr(Analyzer(hour), stage)(live_bus_df)
+
+
+def _line_arrivals_worker(hour: int, backend: str, start: int, stop: int,
+                          route_data: RouteData) -> arrivals.ArrivalTable:
+    """
+    Runs the part of the punctuality pipeline that depends on live bus data on a slice of the live data shared
+    with the worker process (see parallel.SharedFrame).
+    :param hour: hour of the day to be analyzed.
+    :param backend: name of the backend of the hot loops.
+    :param start: first row of the slice.
+    :param stop: row after the last row of the slice.
+    :param route_data: route data of the lines in the slice.
+    :return: same as Analyzer.line_arrival_events.
+    """
+    live_bus_df = parallel.SharedFrame.worker_slice(start, stop)
+    return Analyzer(hour, backend=backend).line_arrival_events(live_bus_df, route_data)
 
 
 class Results:
@@ -409,6 +883,16 @@ class Results:
     Class for storing analysis results and creating plots.
     """
 
+    # plot method -> stage of the Analyzer class creating the data needed by the plot
+    PLOT_STAGES = {
+        'plot_speeds': 'speed',
+        'plot_fast_places': 'places_speed',
+        'plot_punctuality': 'punctuality',
+        'plot_bad_stops': 'stop_punctuality',
+        'plot_distance': 'distance',
+        'plot_longest_routes': 'longest_routes',
+    }
+
     def __init__(self):
         """
         Constructor for the Results class.
@@ -417,68 +901,209 @@ class Results:
         """
         self.speed_data = None
         self.places_speed_data = None
+        self.places_grid = None
+        self.places_speed_pyramid = None
         self.punctuality_data = None
         self.boundary_inaccuracy_count = None
+        self.punctuality_cube = None
         self.stop_punctuality_data = None
         self.stop_info = None
+        self.speed_sketches = None
+        self.delay_sketches = None
         self.distance_data = None
         self.filtered_distance_data = None
         self.longest_routes = None
         self.filtered_longest_routes = None
+        self.arrival_data = None
+        self.trace = None
+        # (attribute, column, comment) -> (binned dataframe, histogram of the column),
+        # ('punctuality_data', 'cube') -> (punctuality data, punctuality cube)
+        self.histograms = {}
+        # attribute -> function computing the result when the attribute is read (see defer)
+        self.deferred = {}
+
+    def defer(self, attribute: str, loader):
+        """
+        Replaces a result with a function computing it. The function is called when the attribute is read
+        for the first time afterwards, e.g. results updated with every snapshot are assembled only when needed.
+        :param attribute: name of the result, e.g. 'speed_data'.
+        :param loader: function without arguments returning the result.
+        :return: None
+        """
+        self.__dict__.pop(attribute, None)
+        self.deferred[attribute] = loader
+
+    def __getattr__(self, name):
+        # called only for attributes missing from the instance, i.e. deferred results
+        deferred = self.__dict__.get('deferred')
+        if deferred is None or name not in deferred:
+            raise AttributeError(f"'Results' object has no attribute '{name}'")
+        value = deferred.pop(name)()
+        setattr(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        if name != 'deferred' and name in self.__dict__.get('deferred', {}):
+            del self.deferred[name]
+        super().__setattr__(name, value)
 
-    def plot_speeds(self, delimiters: list[int]) -> go.Figure:
+    def __getstate__(self):
+        for attribute in list(self.deferred):
+            getattr(self, attribute)
+        return self.__dict__
+
+    def histogram(self, attribute: str, column: str, comment: str = None) -> histogram.Histogram:
+        """
+        Gets the histogram of a column of a result. The histogram is cached until the result is replaced
+        (results modified in place are not detected).
+        :param attribute: name of the result, e.g. 'speed_data'.
+        :param column: name of the column.
+        :param comment: if given, only the rows with this punctuality comment are counted.
+        :return: histogram.
+        """
+        data = getattr(self, attribute)
+        if data is None:
+            raise ValueError(f'{attribute.replace("_", " ").capitalize()} not created')
+        key = (attribute, column, comment)
+        if key not in self.histograms or self.histograms[key][0] is not data:
+            values = data[column] if comment is None else data.loc[data['Comment'] == comment, column]
+            self.histograms[key] = (data, histogram.Histogram(values))
+        return self.histograms[key][1]
+
+    def counts(self, attribute: str, column: str, delimiters: list[float]) -> pd.DataFrame:
+        """
+        Counts the values of a column of a result in buckets [delimiters[i], delimiters[i + 1])
+        and [delimiters[-1], inf).
+        :param attribute: name of the result, e.g. 'speed_data'.
+        :param column: name of the column.
+        :param delimiters: non-decreasing list of delimiters.
+        :return: dataframe with the bounds of the buckets (From, To) and the counts (Count).
+        """
+        return pd.DataFrame({
+            'From': delimiters,
+            'To': list(delimiters[1:]) + [np.inf],
+            'Count': self.histogram(attribute, column).counts(delimiters),
+        })
+
+    def speed_counts(self, delimiters: list[float]) -> pd.DataFrame:
+        """
+        Counts the speed records in speed categories.
+        :param delimiters: list of speed category delimiters.
+        :return: dataframe with the bounds of the categories (From, To) and the counts (Count).
+        """
+        return self.counts('speed_data', 'Speed', delimiters)
+
+    def distance_counts(self, delimiters: list[float]) -> pd.DataFrame:
+        """
+        Counts the buses in distance categories.
+        :param delimiters: list of distance category delimiters.
+        :return: dataframe with the bounds of the categories (From, To) and the counts (Count).
+        """
+        return self.counts('distance_data', 'Distance', delimiters)
+
+    def punctuality_counts(self, delimiters: list[float], lines=None, stops=None, hours=None) -> pd.DataFrame:
+        """
+        Counts the arrivals in punctuality categories: early and late by [delimiters[i], delimiters[i + 1])
+        and by at least delimiters[-1] minutes, and within delimiters[0] minutes of the timetable
+        (including the arrivals on time). Every arrival is counted in exactly one category.
+        Arrivals of some lines, at some stops or in some hours are counted from the punctuality cube
+        (see get_punctuality_cube).
+        :param delimiters: list of punctuality category delimiters.
+        :param lines: line numbers, all lines if not given.
+        :param stops: stop IDs, all stops if not given.
+        :param hours: hours of the timetable departures, all hours if not given.
+        :return: dataframe with the comments (Comment), the bounds of the differences in minutes (From, To)
+                 and the counts (Count) of the categories, from the earliest to the latest.
+        """
+        if lines is not None or stops is not None or hours is not None:
+            return self.get_punctuality_cube().punctuality_counts(delimiters, lines, stops, hours)
+        comments, lower, upper, counts = histogram.punctuality_buckets(
+            self.histogram('punctuality_data', 'Difference', 'Early'),
+            self.histogram('punctuality_data', 'Difference', 'On time'),
+            self.histogram('punctuality_data', 'Difference', 'Late'),
+            delimiters
+        )
+        return pd.DataFrame({'Comment': comments, 'From': lower, 'To': upper, 'Count': counts})
+
+    def get_punctuality_cube(self) -> cube.PunctualityCube:
+        """
+        Gets the counts of arrivals by line, stop, hour and difference (see cube.PunctualityCube).
+        The cube is built from punctuality data once and cached until punctuality data is replaced.
+        :return: punctuality cube.
+        """
+        if self.punctuality_data is None:
+            raise ValueError('Punctuality data not created')
+        key = ('punctuality_data', 'cube')
+        if key not in self.histograms or self.histograms[key][0] is not self.punctuality_data:
+            self.histograms[key] = (self.punctuality_data, cube.PunctualityCube.from_punctuality(self.punctuality_data))
+        return self.histograms[key][1]
+
+    def save(self, path: str, file_format: str = None):
+        """
+        Saves the populated results to a directory in a typed columnar format with a manifest
+        (see columnar.write_results).
+        :param path: path to the directory.
+        :param file_format: 'feather' (requires pyarrow) or 'npy', by default feather if pyarrow is installed.
+        :return: None
+        """
+        columnar.write_results(self, path, file_format)
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> 'Results':
+        """
+        Loads results saved with save.
+        :param path: path to the directory.
+        :param mmap: whether to memory-map the data instead of reading it, so that results are opened without
+                     copying; memory-mapped dataframes are read-only.
+        :return: results.
+        """
+        return columnar.read_results(Results(), path, mmap)
+
+    def plot_speeds(self, delimiters: list[int]) -> 'go.Figure':
         """
         Plots the number of buses in different speed categories.
         :param delimiters: list of speed category delimiters.
         :return: plotly figure.
         """
-        if self.speed_data is None:
-            raise ValueError('Speed data not created')
-        speed_data = self.speed_data
-        categories = [f'{delimiters[i]}-{delimiters[i + 1]}' for i in range(len(delimiters) - 1)]
-        categories.append(f'{delimiters[-1]}+')
-        values = [
-            speed_data[(speed_data['Speed'] >= delimiters[i]) & (speed_data['Speed'] < delimiters[i + 1])].shape[0]
-            for i in range(len(delimiters) - 1)
-        ]
-        values.append(speed_data[(speed_data['Speed'] >= delimiters[-1])].shape[0])
-        fig = go.Figure(data=[go.Bar(x=categories, y=values)])
-        fig.update_layout(
-            title='Prędkości autobusów',
-            title_x=0.5,
-            xaxis_title='Prędkość [km/h]',
-            yaxis_title='Liczba zarejestrowanch przypadków prędkości',
-        )
-        return fig
+        from autobusy.analyzer import presentation
+        return presentation.plot_speeds(self, delimiters)
 
-    def plot_fast_places(self, min_buses: int, min_ratio: float) -> folium.Map:
+    def plot_fast_places(self, min_buses: int, min_ratio: float, resolution: float = None,
+                         layer: str = 'cells') -> 'folium.Map':
         """
         Plots the places where the number of buses is greater than min_buses and the ratio of fast buses is greater
-        than min_ratio (a bus is considered fast if its speed is greater than 50 km/h).
+        than min_ratio (a bus is considered fast if its speed is greater than the fast speed of the places data,
+        50 km/h by default).
         :param min_buses: minimum number of buses.
         :param min_ratio: minimum ratio of fast buses.
+        :param resolution: resolution of the places speed pyramid to be plotted,
+                           by default places speed data is plotted.
+        :param layer: 'cells' to outline the grid cells, 'heatmap' for a heatmap weighted by the number of fast buses.
         :return: folium map.
         """
-        if self.places_speed_data is None:
-            raise ValueError('Places speed data not created')
-        places_speed_data = self.places_speed_data
-        fast_places = places_speed_data[(places_speed_data['Total'] > min_buses) &
-                                        (places_speed_data['Fast'] / places_speed_data['Total'] > min_ratio)]
-        m = folium.Map(location=[52.22977, 21.01178], zoom_start=11)
-        for _, row in fast_places.iterrows():
-            coordinates = [
-                [row['Lat'] - 0.005, row['Lon'] - 0.005],
-                [row['Lat'] + 0.005, row['Lon'] - 0.005],
-                [row['Lat'] + 0.005, row['Lon'] + 0.005],
-                [row['Lat'] - 0.005, row['Lon'] + 0.005],
-                [row['Lat'] - 0.005, row['Lon'] - 0.005]
-            ]
-            folium.PolyLine(coordinates, color="red", weight=2.5,
-                            tooltip=f"Liczba autobusów: {row['Total']}<br>"
-                                    f"Liczba szybkich (powyżej 50 km/h): {row['Fast']}").add_to(
-                m)
+        from autobusy.analyzer import presentation
+        return presentation.plot_fast_places(self, min_buses, min_ratio, resolution, layer)
 
-        return m
+    def headways(self) -> pd.DataFrame:
+        """
+        Gets the arrivals of buses with the times since the previous arrival of the same line at the same stop.
+        :return: dataframe of arrival events with the headway in minutes (see ArrivalTable.headways).
+        """
+        if self.arrival_data is None:
+            raise ValueError('Arrival data not created')
+        return self.arrival_data.headways()
+
+    def bunching(self, ratio: float = 0.25, min_headway: float = None) -> pd.DataFrame:
+        """
+        Gets the arrivals of bunched buses.
+        :param ratio: an arrival is bunched if its headway is less than this fraction of the median headway
+                      of the line at the stop.
+        :param min_headway: if given, an arrival is bunched if its headway is less than this many minutes instead.
+        :return: dataframe of bunched arrival events (see ArrivalTable.bunching).
+        """
+        if self.arrival_data is None:
+            raise ValueError('Arrival data not created')
+        return self.arrival_data.bunching(ratio, min_headway)
 
     def get_boundary_inaccuracy_percentage(self) -> float:
         """
@@ -492,133 +1117,43 @@ class Results:
         return (self.boundary_inaccuracy_count /
                 (self.punctuality_data.shape[0] + self.boundary_inaccuracy_count) * 100)
 
-    def plot_punctuality(self, delimiters: list[int]) -> go.Figure:
+    def plot_punctuality(self, delimiters: list[int]) -> 'go.Figure':
         """
         Plots the number of buses in different punctuality categories.
         :param delimiters: list of punctuality category delimiters.
         :return: plotly figure.
         """
-        if self.punctuality_data is None:
-            raise ValueError('Punctuality data not created')
-
-        categories = [f'>{delimiters[-1]} minut za wcześnie']
-        categories += [
-            f'{delimiters[i]}-{delimiters[i + 1]} minut za wcześnie'
-            for i in reversed(range(len(delimiters) - 1))
-        ]
-        categories += [f'W obrębie {delimiters[0]} minut']
-        categories += [
-            f'{delimiters[i]}-{delimiters[i + 1]} minut za późno'
-            for i in range(len(delimiters) - 1)
-        ]
-        categories += [f'>{delimiters[-1]} minut za późno']
-
-        early_df = self.punctuality_data[self.punctuality_data['Comment'] == 'Early']
-        on_time_df = self.punctuality_data[self.punctuality_data['Comment'] == 'On time']
-        late_df = self.punctuality_data[self.punctuality_data['Comment'] == 'Late']
+        from autobusy.analyzer import presentation
+        return presentation.plot_punctuality(self, delimiters)
 
-        values = [
-            early_df[early_df['Difference'] > delimiters[-1]].shape[0]
-        ]
-        values += [
-            early_df[(early_df['Difference'] >= delimiters[i]) & (early_df['Difference'] < delimiters[i + 1])].shape[0]
-            for i in reversed(range(len(delimiters) - 1))
-        ]
-        values += [
-            early_df[early_df['Difference'] < delimiters[0]].shape[0] +
-            on_time_df.shape[0] +
-            late_df[late_df['Difference'] > delimiters[0]].shape[0]
-        ]
-        values += [
-            late_df[(late_df['Difference'] >= delimiters[i]) & (late_df['Difference'] < delimiters[i + 1])].shape[0]
-            for i in range(len(delimiters) - 1)
-        ]
-        values += [
-            late_df[late_df['Difference'] > delimiters[-1]].shape[0]
-        ]
-
-        fig = go.Figure(data=[go.Bar(x=categories, y=values)])
-        fig.update_layout(
-            title='Punktualność autobusów',
-            title_x=0.5,
-            xaxis_title='Różnica w minutach',
-            yaxis_title='Liczba zarejestrowanch przypadków',
-        )
-        return fig
-
-    def plot_bad_stops(self, min_buses: int, min_ratio: float) -> folium.Map:
+    def plot_bad_stops(self, min_buses: int, min_ratio: float, layer: str = 'markers') -> 'folium.Map':
         """
         Plots the stops with the number of buses greater than min_buses and the ratio of late to total buses
         greater than min_ratio.
         :param min_buses: minimum number of buses.
         :param min_ratio: minimum ratio of late buses to total buses.
+        :param layer: 'markers' for a marker per stop, 'cluster' for markers clustered in the browser,
+                      'heatmap' for a heatmap weighted by the number of late buses.
         :return: folium map.
         """
-        if self.stop_punctuality_data is None:
-            raise ValueError('Stop punctuality data not created')
-        stop_punctuality_data = self.stop_punctuality_data
-        bad_stops = stop_punctuality_data[(stop_punctuality_data['Late'] / stop_punctuality_data['Total'] > min_ratio) &
-                                          (stop_punctuality_data['Total'] > min_buses)]
-
-        m = folium.Map(location=[52.22977, 21.01178], zoom_start=11)
-        for _, row in bad_stops.join(self.stop_info, on='Stop').iterrows():
-            folium.Marker(
-                location=[row['Lat'], row['Lon']],
-                popup=f"{row['Name']}<br>Liczba autobusów: {row['Total']}<br>Liczba spóźnionych: {row['Late']}",
-                icon=folium.Icon(color='red', icon='info-sign')
-            ).add_to(m)
+        from autobusy.analyzer import presentation
+        return presentation.plot_bad_stops(self, min_buses, min_ratio, layer)
 
-        return m
-
-    def plot_distance(self, delimiters: list[int]) -> go.Figure:
+    def plot_distance(self, delimiters: list[int]) -> 'go.Figure':
         """
         Plots the number of buses in different distance categories.
         :param delimiters: list of distance category delimiters.
         :return: plotly figure.
         """
-        if self.distance_data is None:
-            raise ValueError('Distance data not created')
-        distance_data = self.distance_data
-        categories = [f'{delimiters[i]}-{delimiters[i + 1]}' for i in range(len(delimiters) - 1)]
-        categories.append(f'{delimiters[-1]}+')
-        values = [
-            distance_data[
-                (distance_data['Distance'] >= delimiters[i]) & (distance_data['Distance'] < delimiters[i + 1])].shape[0]
-            for i in range(len(delimiters) - 1)
-        ]
-        values.append(distance_data[(distance_data["Distance"] >= delimiters[-1])].shape[0])
-        fig = go.Figure(data=[go.Bar(x=categories, y=values)])
-        fig.update_layout(
-            title='Przebyte odległości przez autobusy',
-            title_x=0.5,
-            xaxis_title='Odległość [km]',
-            yaxis_title='Liczba autobusów',
-        )
-        return fig
+        from autobusy.analyzer import presentation
+        return presentation.plot_distance(self, delimiters)
 
-    def plot_longest_routes(self, filtered=False) -> folium.Map:
+    def plot_longest_routes(self, filtered=False, tolerance: float = 0.01) -> 'folium.Map':
         """
-        Plots the longest routes.
+        Plots the longest routes, simplified with the Douglas-Peucker algorithm.
+        :param filtered: whether to plot the longest routes with measurement errors filtered out.
+        :param tolerance: tolerance of the simplification in km, 0 plots all pings.
         :return: folium map.
         """
-        if not filtered and self.longest_routes is None:
-            raise ValueError('Longest routes not created')
-        if filtered and self.filtered_longest_routes is None:
-            raise ValueError('Filtered longest routes not created')
-        longest_routes = self.filtered_longest_routes if filtered else self.longest_routes
-        m = folium.Map(location=[52.22977, 21.01178], zoom_start=11)
-
-        linear_cm = cm.LinearColormap(
-            ['#ad1609', '#05a11a', '#05059c'],
-            vmin=0,
-            vmax=longest_routes['VehicleNumber'].nunique(),
-        )
-
-        for name, group in longest_routes.groupby('VehicleNumber'):
-            folium.PolyLine(
-                group[['Lat', 'Lon']].values,
-                color=linear_cm(group.index[0]),
-                weight=2.5,
-                tooltip=f"Numer linii: {group['Lines'].iloc[0]}<br>Długość: {group['Distance'].iloc[0]}"
-            ).add_to(m)
-        return m
+        from autobusy.analyzer import presentation
+        return presentation.plot_longest_routes(self, filtered, tolerance)
@@ -0,0 +1,219 @@
+import pandas as pd
+import numpy as np
+
+COLUMNS = ['Line', 'Direction', 'VehicleNumber', 'Brigade', 'Stop', 'Time', 'Distance']
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def empty_events() -> pd.DataFrame:
+    """
+    Gets an empty dataframe of arrival events.
+    :return: dataframe with the columns of arrival events and their types.
+    """
+    return pd.DataFrame({
+        'Line': pd.Series(dtype=object),
+        'Direction': pd.Series(dtype=np.int64),
+        'VehicleNumber': pd.Series(dtype=object),
+        'Brigade': pd.Series(dtype=object),
+        'Stop': pd.Series(dtype=object),
+        'Time': pd.Series(dtype='datetime64[ns]'),
+        'Distance': pd.Series(dtype=np.float64),
+    })
+
+
+class ArrivalTable:
+    """
+    Class for the arrivals of vehicles at stops: one event per vehicle passing a stop, with the line,
+    the direction (the index of the route the vehicle runs), the vehicle number, the brigade, the stop ID,
+    the exact (interpolated) time and the distance of the stop along the first route of the line in km.
+    Events are sorted by stop, line and time, so the arrivals of a line at a stop are a contiguous slice
+    found with a dictionary lookup and sequences of arrivals (headways, bunching) are computed on shifted arrays.
+    """
+
+    def __init__(self, events: pd.DataFrame = None, lines=()):
+        """
+        Constructor for the ArrivalTable class.
+        :param events: dataframe of arrival events (see COLUMNS), in any order.
+        :param lines: lines observed in live data, including lines without arrivals
+                      (their departures are counted as missed in timetable comparisons).
+        """
+        events = empty_events() if events is None or events.empty else events
+        self.events = events[COLUMNS].sort_values(['Stop', 'Line', 'Time'], kind='stable').reset_index(drop=True)
+        self.lines = sorted(set(lines) | set(self.events['Line']))
+        stop = self.events['Stop'].to_numpy()
+        line = self.events['Line'].to_numpy()
+        new_group = np.ones(stop.shape[0], dtype=bool)
+        new_group[1:] = (stop[1:] != stop[:-1]) | (line[1:] != line[:-1])
+        self.starts = np.flatnonzero(new_group)
+        self.ends = np.r_[self.starts[1:], stop.shape[0]].astype(np.int64)
+        # (line, stop) -> index of the group of events
+        self.groups = {(line[start], stop[start]): i for i, start in enumerate(self.starts)}
+        self.rounded_minutes = None
+        # whether times are compared with their days -> (sorted search keys, order of the events, key width)
+        self.keys = {}
+
+    @staticmethod
+    def from_trips(trips: list[tuple], lines=()) -> 'ArrivalTable':
+        """
+        Creates an arrival table from the arrivals of trips.
+        :param trips: list of tuples (line, direction, vehicle number, brigade, array of stop IDs,
+                      array of arrival times in nanoseconds since the epoch,
+                      array of distances of the stops along the first route of the line in km).
+        :param lines: lines observed in live data.
+        :return: arrival table.
+        """
+        if not trips:
+            return ArrivalTable(None, lines)
+        line, direction, vehicle, brigade, stops, times, distances = zip(*trips)
+        counts = [len(x) for x in stops]
+        return ArrivalTable(pd.DataFrame({
+            'Line': np.repeat(np.asarray(line, dtype=object), counts),
+            'Direction': np.repeat(np.asarray(direction, dtype=np.int64), counts),
+            'VehicleNumber': np.repeat(np.asarray(vehicle, dtype=object), counts),
+            'Brigade': np.repeat(np.asarray(brigade, dtype=object), counts),
+            'Stop': np.concatenate(stops).astype(object),
+            'Time': pd.to_datetime(np.concatenate(times).astype(np.int64)),
+            'Distance': np.concatenate(distances).astype(np.float64),
+        }), lines)
+
+    @staticmethod
+    def concat(tables: list['ArrivalTable']) -> 'ArrivalTable':
+        """
+        Merges arrival tables computed for disjoint sets of vehicles.
+        :param tables: list of arrival tables.
+        :return: arrival table with the events and the lines of all the tables.
+        """
+        frames = [table.events for table in tables if not table.events.empty]
+        return ArrivalTable(pd.concat(frames, ignore_index=True) if frames else None,
+                            [line for table in tables for line in table.lines])
+
+    def __len__(self) -> int:
+        return self.events.shape[0]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ArrivalTable) and self.lines == other.lines and self.events.equals(other.events)
+
+    def arrivals(self, line: str, stop: str) -> pd.DataFrame:
+        """
+        Gets the arrivals of a line at a stop.
+        :param line: line number.
+        :param stop: stop ID.
+        :return: dataframe of arrival events sorted by time.
+        """
+        group = self.groups.get((line, stop))
+        if group is None:
+            return self.events.iloc[:0]
+        return self.events.iloc[self.starts[group]:self.ends[group]]
+
+    def group_codes(self) -> np.ndarray:
+        """
+        Gets the index of the (stop, line) group of each event.
+        :return: array of group indexes, non-decreasing.
+        """
+        return np.repeat(np.arange(self.starts.shape[0]), self.ends - self.starts)
+
+    def headways(self) -> pd.DataFrame:
+        """
+        Gets the headways: times since the previous arrival of the same line at the same stop.
+        :return: dataframe of arrival events with the headway in minutes (Headway, NaN for the first arrival).
+        """
+        times = self.events['Time'].to_numpy().astype(np.int64)
+        headway = np.full(times.shape[0], np.nan)
+        same_group = np.zeros(times.shape[0], dtype=bool)
+        same_group[1:] = True
+        same_group[self.starts] = False
+        headway[same_group] = (times[1:] - times[:-1])[same_group[1:]] / 60e9
+        return self.events.assign(Headway=headway)
+
+    def bunching(self, ratio: float = 0.25, min_headway: float = None) -> pd.DataFrame:
+        """
+        Gets the arrivals of bunched vehicles: arrivals following the previous arrival of the same line
+        at the same stop much sooner than usual.
+        :param ratio: an arrival is bunched if its headway is less than this fraction of the median headway
+                      of the line at the stop.
+        :param min_headway: if given, an arrival is bunched if its headway is less than this many minutes instead.
+        :return: dataframe of bunched arrival events with the headway (Headway)
+                 and the median headway of the line at the stop (MedianHeadway), in minutes.
+        """
+        headways = self.headways()
+        median = headways.groupby(self.group_codes())['Headway'].transform('median').to_numpy()
+        threshold = ratio * median if min_headway is None else np.full(median.shape[0], min_headway)
+        bunched = headways['Headway'].to_numpy() < threshold
+        return headways.assign(MedianHeadway=median)[bunched]
+
+    def minutes(self) -> np.ndarray:
+        """
+        Gets the arrival times rounded to the minute, as minutes since midnight.
+        :return: array of minutes.
+        """
+        return self.epoch_minutes() % MINUTES_PER_DAY
+
+    def epoch_minutes(self) -> np.ndarray:
+        """
+        Gets the arrival times rounded to the minute, as minutes since the epoch.
+        :return: array of minutes.
+        """
+        if self.rounded_minutes is None:
+            rounded = self.events['Time'].dt.round('min').to_numpy().astype('datetime64[m]')
+            self.rounded_minutes = rounded.astype(np.int64)
+        return self.rounded_minutes
+
+    def days(self) -> np.ndarray:
+        """
+        Gets the service days of the arrivals, i.e. the dates of the arrival times.
+        :return: sorted array of distinct days as days since the epoch.
+        """
+        return np.unique(self.events['Time'].to_numpy().astype('datetime64[D]').astype(np.int64))
+
+    def closest(self, lines, stops, minutes: np.ndarray, days: np.ndarray = None) -> np.ndarray:
+        """
+        Finds the arrivals closest to given times, with one binary search over all the events.
+        Arrival times are rounded to the minute. Of two equally close arrivals, the earlier one is chosen.
+        :param lines: line numbers.
+        :param stops: stop IDs.
+        :param minutes: array of times as minutes since midnight.
+        :param days: array of the days of the times as days since the epoch (see days). If not given,
+                     the times and the arrivals of all days are compared as times of day.
+        :return: array of indexes of the closest events, -1 if the line has no arrivals at the stop.
+        """
+        minutes = np.asarray(minutes, dtype=np.int64)
+        code = np.fromiter((self.groups.get(key, -1) for key in zip(lines, stops)), dtype=np.int64,
+                           count=minutes.shape[0])
+        if not self.groups:
+            return code
+        # times of day or, if days are given, minutes since the day before the first arrival
+        absolute = days is not None
+        origin = self.epoch_minutes().min() - 1 if absolute else 0
+        if absolute:
+            minutes = np.asarray(days, dtype=np.int64) * MINUTES_PER_DAY + minutes - origin
+        if absolute not in self.keys:
+            group = self.group_codes()
+            minute = self.epoch_minutes() - origin if absolute else self.minutes()
+            width = max(int(minute.max()) + 2, MINUTES_PER_DAY)
+            order = np.lexsort((minute, group))
+            # sorted by group and minute, the groups occupy the same ranges as in the events
+            self.keys[absolute] = (group[order] * width + minute[order], order, width)
+        keys, order, width = self.keys[absolute]
+        # keys of a group are within [group * width, (group + 1) * width)
+        minutes = np.clip(minutes, 0, width - 1)
+        found = code >= 0
+        code = np.where(found, code, 0)
+        target = code * width + minutes
+        position = np.searchsorted(keys, target, side='left')
+        after = np.minimum(position, self.ends[code] - 1)
+        before = np.maximum(position - 1, self.starts[code])
+        chosen = np.where(np.abs(keys[before] - target) <= np.abs(keys[after] - target), before, after)
+        return np.where(found, order[chosen], -1)
+
+    def to_stop_arrival_info(self) -> dict[str, dict[str, list[str]]]:
+        """
+        Gets the arrival times rounded to the minute, in the format of the punctuality pipeline before arrival
+        events were kept.
+        :return: dictionary of line number -> dictionary of stop -> list of arrival times ('HH:MM') in time order.
+        """
+        stop_arrival_info = {line: {} for line in self.lines}
+        times = self.events['Time'].dt.round('min').dt.strftime('%H:%M')
+        for (line, stop), group in self.groups.items():
+            stop_arrival_info[line][stop] = times.iloc[self.starts[group]:self.ends[group]].tolist()
+        return stop_arrival_info
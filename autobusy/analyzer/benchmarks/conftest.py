@@ -0,0 +1,51 @@
+"""
+Fixtures of the benchmark suite, run with pytest-benchmark installed:
+
+    pytest autobusy/analyzer/benchmarks --benchmark-autosave
+    pytest autobusy/analyzer/benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+The first command stores a baseline in .benchmarks, the second compares against the latest stored baseline
+and fails on regressions. Scales of the synthetic data (see synthetic.SCALES) are selected with
+the AUTOBUSY_BENCHMARK_SCALES environment variable, e.g. AUTOBUSY_BENCHMARK_SCALES=small,medium,warsaw
+(small by default).
+"""
+from autobusy.analyzer.synthetic import SyntheticNetwork, SCALES
+from autobusy.analyzer.parser import LiveParser
+import os
+import pytest
+
+HOUR = 7
+
+
+@pytest.fixture(scope='session')
+def hour():
+    return HOUR
+
+
+@pytest.fixture(scope='session', params=os.environ.get('AUTOBUSY_BENCHMARK_SCALES', 'small').split(','))
+def network(request):
+    return SyntheticNetwork(**SCALES[request.param])
+
+
+@pytest.fixture(scope='session')
+def route_data(network):
+    return network.route_data()
+
+
+@pytest.fixture(scope='session')
+def timetable_file(network, tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('timetable') / 'RA240129.TXT')
+    network.write_timetable(filename)
+    return filename
+
+
+@pytest.fixture(scope='session')
+def archive_file(network, tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('live') / 'live.json')
+    network.write_archive(filename, [HOUR])
+    return filename
+
+
+@pytest.fixture(scope='session')
+def live_bus_df(archive_file):
+    return LiveParser(archive_file).parse()
@@ -0,0 +1,35 @@
+from autobusy.analyzer.analyzer import Analyzer
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+# create_* method -> (create_* calls computing the stages it depends on, call of the method);
+# the dependencies are computed before each round, so that only the stage itself is measured
+STAGES = {
+    'create_speed_data': ([], lambda a, live, route: a.create_speed_data(live)),
+    'create_places_speed_data': (['create_speed_data'], lambda a, live, route: a.create_places_speed_data(live)),
+    'create_places_speed_pyramid': (['create_speed_data'],
+                                    lambda a, live, route: a.create_places_speed_pyramid(live, (0.005, 0.01, 0.02))),
+    'create_punctuality_data': ([], lambda a, live, route: a.create_punctuality_data(live, route)),
+    'create_stop_punctuality_data': (['create_punctuality_data'],
+                                     lambda a, live, route: a.create_stop_punctuality_data(live, route, 5)),
+    'create_distance_data': ([], lambda a, live, route: a.create_distance_data(live)),
+    'create_filtered_distance_data': (['create_speed_data'],
+                                      lambda a, live, route: a.create_distance_data(live, True)),
+    'create_longest_routes': (['create_distance_data'], lambda a, live, route: a.create_longest_routes(live, 5)),
+    'create_filtered_longest_routes': (['create_filtered_distance_data'],
+                                       lambda a, live, route: a.create_longest_routes(live, 5, True)),
+}
+
+
+@pytest.mark.parametrize('stage', STAGES)
+def test_create_stage(benchmark, stage, hour, live_bus_df, route_data):
+    dependencies, call = STAGES[stage]
+
+    def setup():
+        analyzer = Analyzer(hour)
+        for dependency in dependencies:
+            STAGES[dependency][1](analyzer, live_bus_df, route_data)
+        return (analyzer,), {}
+
+    benchmark.pedantic(lambda analyzer: call(analyzer, live_bus_df, route_data), setup=setup, rounds=3)
@@ -0,0 +1,19 @@
+from autobusy.analyzer.parser import TimetableParser, LiveParser
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+
+def test_timetable_parser(benchmark, timetable_file, route_data):
+    stop_info, line_route_info, _ = benchmark(lambda: TimetableParser(timetable_file).parse())
+    assert line_route_info == route_data.line_route_info
+
+
+def test_live_parser(benchmark, archive_file, live_bus_df):
+    result = benchmark(lambda: LiveParser(archive_file).parse())
+    assert result.shape == live_bus_df.shape
+
+
+def test_live_parser_stream(benchmark, archive_file, live_bus_df):
+    chunks = benchmark(lambda: list(LiveParser.stream(archive_file)))
+    assert sum(chunk.shape[0] for chunk in chunks) == live_bus_df.shape[0]
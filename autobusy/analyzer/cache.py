@@ -0,0 +1,126 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+MISSING = object()
+
+
+def code_version() -> str:
+    """
+    Gets a hash of the source code of the analyzer package, so that cached results
+    are not reused after the code producing them changes.
+    :return: hex digest.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for filename in sorted(os.listdir(package_dir)):
+        if filename.endswith('.py'):
+            with open(os.path.join(package_dir, filename), 'rb') as f:
+                digest.update(filename.encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ResultsCache:
+    """
+    Class for persisting stage results in a local directory.
+    Entries are keyed by stage keys (see stages.StageExecutor.key) combined with the code version
+    and evicted in least recently used order when the size of the directory exceeds the limit.
+    Entries are pickled, so the directory should not be shared with untrusted users.
+    """
+
+    SUFFIX = '.pkl'
+
+    def __init__(self, directory: str, max_bytes: int = 2 ** 30, version: str = None):
+        """
+        Constructor for the ResultsCache class.
+        :param directory: path to the cache directory, created if it does not exist.
+        :param max_bytes: maximum total size of the cache entries.
+        :param version: code version included in the keys, defaults to the hash of the analyzer package.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = code_version() if version is None else version
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """
+        Gets the path of the entry with the given key.
+        :param key: stage key.
+        :return: path of the entry file.
+        """
+        name = hashlib.sha1(f'{self.version}:{key}'.encode()).hexdigest()
+        return os.path.join(self.directory, name + self.SUFFIX)
+
+    def get(self, key: str):
+        """
+        Loads an entry and marks it as recently used.
+        :param key: stage key.
+        :return: cached value or MISSING.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return MISSING
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value):
+        """
+        Stores an entry and evicts least recently used entries if the cache is too big.
+        :param key: stage key.
+        :param value: picklable value.
+        :return: None
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        """
+        Lists the cache entries.
+        :return: list of (last use time, size, path), least recently used first.
+        """
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(self.SUFFIX):
+                path = os.path.join(self.directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Removes least recently used entries until the total size is within the limit.
+        :return: None
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Removes all entries.
+        :return: None
+        """
+        for _, _, path in self.entries():
+            os.remove(path)
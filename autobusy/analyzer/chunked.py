@@ -0,0 +1,226 @@
+import pandas as pd
+import numpy as np
+import os
+import pickle
+import tempfile
+from autobusy.analyzer.analyzer import Analyzer, RouteData, Results
+from autobusy.analyzer.parser import LiveParser
+from autobusy.analyzer.arrivals import ArrivalTable
+import autobusy.analyzer.grid as grid
+
+
+class ChunkedAnalyzer:
+    """
+    Class for analyzing live data archives that do not fit in memory, e.g. several days of snapshots.
+    The archive is streamed in chunks of consecutive snapshots (see LiveParser.stream) and either:
+        - split into partitions by a hash of the vehicle number written to disk, so that all pings of a vehicle
+          are in the same partition, then the partitions are analyzed one by one (analyze),
+        - or passed chunk by chunk to Analyzer.ingest, which carries the last ping of each vehicle over
+          from the previous chunks (stream).
+    Aggregate results are merged, so the memory used depends on the size of a partition or chunk only.
+    """
+
+    def __init__(self, hour: int, partitions: int = 16, directory: str = None, snapshots_per_chunk: int = 60):
+        """
+        Constructor for the ChunkedAnalyzer class.
+        :param hour: hour of the day to be analyzed.
+        :param partitions: number of vehicle partitions.
+        :param directory: directory for temporary partition files, the system default if not given.
+        :param snapshots_per_chunk: number of snapshots read from the archive at once.
+        """
+        self.hour = hour
+        self.partitions = partitions
+        self.directory = directory
+        self.snapshots_per_chunk = snapshots_per_chunk
+
+    def partition_of(self, vehicles: pd.Series) -> np.ndarray:
+        """
+        Gets the partitions of vehicles. The hash is stable, so it does not depend on the process or the run.
+        :param vehicles: vehicle numbers.
+        :return: array of partition indexes.
+        """
+        return (pd.util.hash_array(vehicles.astype(str).to_numpy(dtype=object)) % self.partitions).astype(np.int64)
+
+    def partition_archive(self, filenames, directory: str) -> list[str]:
+        """
+        Splits the pings of the analyzed hour from an archive into partition files.
+        Each file is a sequence of pickled dataframes, one per chunk of the archive. The pings of a vehicle
+        on all days are in the same partition, so its longest routes can be read back from one file;
+        pings of different days are never paired (see Analyzer.vehicle_pings and Analyzer.get_differences).
+        :param filenames: path or list of paths to live data json files, in chronological order.
+        :param directory: directory for the partition files.
+        :return: list of paths to the partition files.
+        """
+        paths = [os.path.join(directory, f'part-{i:04d}.pkl') for i in range(self.partitions)]
+        analyzer = Analyzer(self.hour)
+        for chunk in LiveParser.stream(filenames, self.snapshots_per_chunk):
+            chunk = analyzer.partition(chunk)
+            for partition, part in chunk.groupby(self.partition_of(chunk['VehicleNumber'])):
+                with open(paths[partition], 'ab') as f:
+                    pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return paths
+
+    @staticmethod
+    def read_partition(path: str) -> pd.DataFrame:
+        """
+        Reads a partition file.
+        :param path: path to the partition file.
+        :return: dataframe with the pings of the partition, empty if the file does not exist.
+        """
+        parts = []
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        parts.append(pickle.load(f))
+                    except EOFError:
+                        break
+        if not parts:
+            return ChunkedAnalyzer.empty_partition()
+        return pd.concat(parts, ignore_index=True)
+
+    @staticmethod
+    def empty_partition() -> pd.DataFrame:
+        """
+        Gets an empty dataframe with the columns used by the analysis.
+        :return: empty dataframe.
+        """
+        return pd.DataFrame({
+            'Lines': pd.Series(dtype=object), 'VehicleNumber': pd.Series(dtype=object),
+            'Lon': pd.Series(dtype=float), 'Lat': pd.Series(dtype=float),
+            'Time': pd.Series(dtype='datetime64[ns]'), 'RequestTime': pd.Series(dtype='datetime64[ns]')
+        })
+
+    def analyze(self, filenames, route_data: RouteData = None, resolution: float = 0.01, hexagonal: bool = False,
+                fast_speed: float = 50, count: int = 5, tol: int = None, keep_speed_data: bool = False) -> Results:
+        """
+        Analyzes an archive partition by partition. The results are the same as the results
+        of the create_* methods of the Analyzer class for the whole archive.
+        :param filenames: path or list of paths to live data json files, in chronological order.
+        :param route_data: route data, punctuality is analyzed only if given.
+        :param resolution: size of the grid cells in degrees (see Analyzer.places_speed_data).
+        :param hexagonal: whether the grid cells are hexagonal.
+        :param fast_speed: speed in km/h above which a record is considered fast.
+        :param count: number of longest routes to get.
+        :param tol: tolerance for punctuality in minutes, punctuality per stop is analyzed only if given.
+        :param keep_speed_data: whether to keep all speed records in the results (their size is proportional
+                                to the size of the archive).
+        :return: results with places speed data, distance data, longest routes, punctuality data
+                 and (if requested) speed data and punctuality per stop.
+        """
+        analyzer = Analyzer(self.hour)
+        reduced_route_data = None
+        if route_data is not None:
+            reduced_route_data = RouteData(route_data.stop_info,
+                                           analyzer.get_max_opposite_routes(route_data.line_route_info),
+                                           route_data.line_timetable_info)
+        cell_grid = grid.Grid(resolution, hexagonal)
+        speed_data = []
+        places_speed_data = []
+        distance_data = []
+        arrival_tables = []
+
+        with tempfile.TemporaryDirectory(dir=self.directory) as directory:
+            paths = self.partition_archive(filenames, directory)
+            for path in paths:
+                live_bus_df = self.read_partition(path)
+                if live_bus_df.empty:
+                    continue
+                partition_speed_data = analyzer.speed_data(live_bus_df)
+                if keep_speed_data:
+                    speed_data.append(partition_speed_data)
+                places_speed_data.append(
+                    analyzer.places_speed_data(partition_speed_data, resolution, hexagonal, fast_speed)[0]
+                )
+                distance_data.append(analyzer.distance_data(live_bus_df))
+                if reduced_route_data is not None:
+                    arrival_tables.append(analyzer.line_arrival_events(live_bus_df, reduced_route_data))
+
+            results = Results()
+            if keep_speed_data:
+                results.speed_data = self.merge_speed_data(speed_data)
+            results.places_speed_data = self.merge_places_speed_data(places_speed_data, cell_grid)
+            results.places_grid = cell_grid
+            results.distance_data = self.merge_distance_data(distance_data)
+
+            longest = results.distance_data.nlargest(count, 'Distance')
+            longest_partitions = np.unique(self.partition_of(longest['VehicleNumber']))
+            live_bus_df = pd.concat([self.read_partition(paths[i]) for i in longest_partitions] or
+                                    [self.empty_partition()], ignore_index=True)
+            results.longest_routes = analyzer.longest_routes(live_bus_df, results.distance_data, count)
+
+        if reduced_route_data is not None:
+            results.arrival_data = ArrivalTable.concat(arrival_tables)
+            results.punctuality_data, boundary_bus_count = analyzer.get_differences(results.arrival_data,
+                                                                                    reduced_route_data)
+            results.boundary_inaccuracy_count = boundary_bus_count
+            results.punctuality_cube = results.get_punctuality_cube()
+            if tol is not None:
+                results.stop_punctuality_data, results.stop_info = analyzer.stop_punctuality_data(
+                    results.punctuality_cube, route_data, tol
+                )
+        return results
+
+    def stream(self, filenames, route_data: RouteData = None) -> Results:
+        """
+        Analyzes an archive chunk by chunk with Analyzer.ingest, carrying the last ping of each vehicle
+        over from the previous chunks. Only one chunk of the archive is in memory at a time,
+        but the speed records of the whole archive are kept in the results.
+        :param filenames: path or list of paths to live data json files, in chronological order.
+        :param route_data: route data, punctuality is analyzed only if given.
+        :return: results with speed data, places speed data, distance data
+                 and (if route data is given) punctuality data.
+        """
+        analyzer = Analyzer(self.hour)
+        for chunk in LiveParser.stream(filenames, self.snapshots_per_chunk):
+            analyzer.ingest(chunk, route_data)
+        if route_data is not None and analyzer.incremental_route_data is not None:
+            analyzer.results.punctuality_data, analyzer.results.boundary_inaccuracy_count = analyzer.get_differences(
+                analyzer.results.arrival_data, analyzer.incremental_route_data[1]
+            )
+        return analyzer.results
+
+    @staticmethod
+    def merge_speed_data(speed_data: list[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Merges speed data of partitions.
+        :param speed_data: list of dataframes with speed data.
+        :return: dataframe with speed data, ordered by vehicle as in Analyzer.speed_data.
+        """
+        if not speed_data:
+            return pd.DataFrame()
+        merged = pd.concat(speed_data, ignore_index=True)
+        return merged.sort_values('VehicleNumber', kind='stable').reset_index(drop=True)
+
+    @staticmethod
+    def merge_places_speed_data(places_speed_data: list[pd.DataFrame], cell_grid: grid.Grid) -> pd.DataFrame:
+        """
+        Merges places speed data of partitions by summing the counts of the same cells.
+        :param places_speed_data: list of dataframes with places speed data.
+        :param cell_grid: grid of the cells.
+        :return: dataframe with places speed data, ordered by cell as in Grid.count.
+        """
+        merged = pd.concat(places_speed_data + [pd.DataFrame({
+            'Lon': pd.Series(dtype=float), 'Lat': pd.Series(dtype=float),
+            'Total': pd.Series(dtype=np.int64), 'Fast': pd.Series(dtype=np.int64)
+        })], ignore_index=True)
+        counts = merged[['Total', 'Fast']].groupby(cell_grid.cells(merged['Lon'], merged['Lat'])).sum()
+        cell_lon, cell_lat = cell_grid.centers(counts.index.to_numpy())
+        return pd.DataFrame({
+            'Lon': cell_lon,
+            'Lat': cell_lat,
+            'Total': counts['Total'].to_numpy(),
+            'Fast': counts['Fast'].to_numpy(),
+        })
+
+    @staticmethod
+    def merge_distance_data(distance_data: list[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Merges distance data of partitions.
+        :param distance_data: list of dataframes with distance data.
+        :return: dataframe with distance data, ordered by vehicle as in Analyzer.distance_data.
+        """
+        merged = pd.concat(distance_data + [pd.DataFrame({
+            'VehicleNumber': pd.Series(dtype=object), 'Distance': pd.Series(dtype=float)
+        })], ignore_index=True)
+        return merged.sort_values('VehicleNumber').reset_index(drop=True)
@@ -0,0 +1,267 @@
+import pandas as pd
+import numpy as np
+import autobusy.analyzer.grid as grid
+import autobusy.analyzer.cube as cube
+import autobusy.analyzer.arrivals as arrivals
+import autobusy.analyzer.sketch as sketch
+import autobusy.analyzer.instrumentation as instrumentation
+from typing import TYPE_CHECKING
+import importlib.util
+import json
+import os
+
+if TYPE_CHECKING:
+    from autobusy.analyzer.analyzer import Results
+
+# format of frames written if not given: Feather (Arrow IPC) if pyarrow is installed, NumPy arrays otherwise
+FORMATS = ('feather', 'npy')
+DEFAULT_FORMAT = 'feather' if importlib.util.find_spec('pyarrow') is not None else 'npy'
+
+VERSION = 1
+MANIFEST = 'manifest.json'
+
+# results stored as dataframes
+FRAMES = ('speed_data', 'places_speed_data', 'punctuality_data', 'stop_punctuality_data', 'stop_info',
+          'distance_data', 'filtered_distance_data', 'longest_routes', 'filtered_longest_routes')
+SKETCHES = ('speed_sketches', 'delay_sketches')
+
+
+def write_frame(frame: pd.DataFrame, directory: str, name: str, file_format: str) -> dict:
+    """
+    Writes a dataframe in a typed columnar format. Duplicated columns (e.g. Time in speed data) are written once
+    and the index is written as columns if it is not the default one.
+    In the npy format every column is a .npy file, which can be memory-mapped: numeric, boolean and datetime
+    columns as they are, string columns dictionary-encoded as integer codes and an array of distinct strings.
+    Missing values of string columns, None or NaN, are read back as None.
+    :param frame: dataframe.
+    :param directory: output directory.
+    :param name: name of the frame, the name of its file or directory.
+    :param file_format: one of FORMATS.
+    :return: description of the frame for the manifest.
+    """
+    index, index_names = None, None
+    if not isinstance(frame.index, pd.RangeIndex) or frame.index.start != 0 or frame.index.step != 1:
+        index_names = list(frame.index.names)
+        frame = frame.reset_index()
+        index = [str(x) for x in frame.columns[:len(index_names)]]
+    columns = [str(x) for x in frame.columns]
+    frame = frame.loc[:, ~frame.columns.duplicated()]
+    frame.columns = [str(x) for x in frame.columns]
+    if file_format == 'feather':
+        filename = name + '.feather'
+        frame.to_feather(os.path.join(directory, filename), compression='uncompressed')
+        return {'kind': 'frame', 'file': filename, 'columns': columns, 'index': index, 'index_names': index_names,
+                'rows': frame.shape[0]}
+
+    os.makedirs(os.path.join(directory, name), exist_ok=True)
+    types = {}
+    for i, column in enumerate(frame.columns):
+        values = frame[column]
+        if values.dtype == object:
+            codes, categories = pd.factorize(values)
+            if not all(isinstance(x, str) for x in categories):
+                raise TypeError(f'Column {column} of {name} holds values other than strings')
+            np.save(os.path.join(directory, name, f'{i}.npy'), codes.astype(np.int32))
+            np.save(os.path.join(directory, name, f'{i}.categories.npy'), np.asarray(categories, dtype=str))
+            types[column] = 'string'
+        elif isinstance(values.dtype, np.dtype):
+            np.save(os.path.join(directory, name, f'{i}.npy'), values.to_numpy())
+            types[column] = str(values.dtype)
+        else:
+            raise TypeError(f'Column {column} of {name} has unsupported type {values.dtype}')
+    return {'kind': 'frame', 'file': name, 'columns': columns, 'index': index, 'index_names': index_names,
+            'rows': frame.shape[0], 'types': types}
+
+
+def read_frame(directory: str, description: dict, file_format: str, mmap: bool = True) -> pd.DataFrame:
+    """
+    Reads a dataframe written by write_frame.
+    :param directory: directory of the results.
+    :param description: description of the frame returned by write_frame.
+    :param file_format: one of FORMATS.
+    :param mmap: whether numeric, boolean and datetime columns are memory-mapped (read-only) instead of read.
+    :return: dataframe with the columns and the index of the dataframe written.
+    """
+    path = os.path.join(directory, description['file'])
+    if file_format == 'feather':
+        frame = pd.read_feather(path, memory_map=mmap)
+    else:
+        arrays = {}
+        for i, (column, kind) in enumerate(description['types'].items()):
+            # a plain array viewing the memory map
+            values = np.asarray(np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r' if mmap else None))
+            if kind == 'string':
+                categories = np.load(os.path.join(path, f'{i}.categories.npy')).astype(object)
+                values = np.where(values >= 0, np.append(categories, None)[values], None)
+            arrays[column] = values
+        frame = pd.DataFrame(arrays, copy=False) if arrays else pd.DataFrame(index=pd.RangeIndex(description['rows']))
+    if list(frame.columns) != description['columns']:
+        # duplicated columns viewing the same arrays, built with positional names (selecting them would copy)
+        frame = pd.DataFrame({i: frame[column].to_numpy() for i, column in enumerate(description['columns'])},
+                             copy=False)
+        frame.columns = description['columns']
+    if description['index'] is not None:
+        frame = frame.set_index(description['index'])
+        frame.index.names = description['index_names']
+    return frame
+
+
+def write_arrays(arrays: dict[str, np.ndarray], directory: str, name: str) -> dict:
+    """
+    Writes arrays as .npy files.
+    :param arrays: dictionary of name -> array of numbers or strings.
+    :param directory: output directory.
+    :param name: name of the directory of the arrays.
+    :return: description of the arrays for the manifest.
+    """
+    os.makedirs(os.path.join(directory, name), exist_ok=True)
+    for key, values in arrays.items():
+        values = np.asarray(values)
+        np.save(os.path.join(directory, name, key + '.npy'), values.astype(str) if values.dtype == object else values)
+    return {'kind': 'arrays', 'file': name, 'arrays': list(arrays)}
+
+
+def read_arrays(directory: str, description: dict, mmap: bool = True) -> dict[str, np.ndarray]:
+    """
+    Reads arrays written by write_arrays.
+    :param directory: directory of the results.
+    :param description: description of the arrays returned by write_arrays.
+    :param mmap: whether the arrays are memory-mapped (read-only) instead of read.
+    :return: dictionary of name -> array.
+    """
+    return {key: np.asarray(np.load(os.path.join(directory, description['file'], key + '.npy'),
+                                    mmap_mode='r' if mmap else None))
+            for key in description['arrays']}
+
+
+def write_manifest(manifest: dict, directory: str, filename: str):
+    """
+    Writes the manifest of results, after all the files it describes.
+    :param manifest: manifest.
+    :param directory: directory of the results.
+    :param filename: name of the manifest file.
+    :return: None
+    """
+    with open(os.path.join(directory, filename), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+
+def read_manifest(directory: str, filename: str) -> dict:
+    """
+    Reads the manifest of results.
+    :param directory: directory of the results.
+    :param filename: name of the manifest file.
+    :return: manifest.
+    """
+    with open(os.path.join(directory, filename), 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != VERSION:
+        raise ValueError(f'Unsupported version of saved results: {manifest.get("version")}')
+    return manifest
+
+
+def grid_description(cell_grid: grid.Grid) -> dict:
+    """
+    Describes a grid for the manifest.
+    :param cell_grid: grid.
+    :return: parameters of the grid.
+    """
+    return {'resolution': float(cell_grid.resolution), 'hexagonal': bool(cell_grid.hexagonal),
+            'lat0': float(cell_grid.lat0)}
+
+
+def write_results(results: 'Results', directory: str, file_format: str = None):
+    """
+    Writes the populated results to a directory: dataframes in a typed columnar format (see write_frame),
+    the punctuality cube as .npy arrays, sketches as JSON and everything else in the manifest,
+    which is written last.
+    :param results: results.
+    :param directory: output directory, created if it does not exist.
+    :param file_format: one of FORMATS, DEFAULT_FORMAT if not given.
+    :return: None
+    """
+    file_format = file_format or DEFAULT_FORMAT
+    if file_format not in FORMATS:
+        raise ValueError(f'Unknown format: {file_format}')
+    if file_format == 'feather' and importlib.util.find_spec('pyarrow') is None:
+        raise ValueError('Feather format requires pyarrow')
+    os.makedirs(directory, exist_ok=True)
+    entries = {}
+    for attribute in FRAMES:
+        if getattr(results, attribute) is not None:
+            entries[attribute] = write_frame(getattr(results, attribute), directory, attribute, file_format)
+    if results.places_grid is not None:
+        entries['places_grid'] = dict(grid_description(results.places_grid), kind='grid')
+    if results.places_speed_pyramid is not None:
+        entries['places_speed_pyramid'] = {'kind': 'pyramid', 'levels': [{
+            'resolution': resolution,
+            'grid': grid_description(cell_grid),
+            'frame': write_frame(frame, directory, f'places_speed_pyramid_{i}', file_format),
+        } for i, (resolution, (frame, cell_grid)) in enumerate(results.places_speed_pyramid.items())]}
+    if results.boundary_inaccuracy_count is not None:
+        entries['boundary_inaccuracy_count'] = {'kind': 'value', 'value': int(results.boundary_inaccuracy_count)}
+    if results.punctuality_cube is not None:
+        punctuality_cube = results.punctuality_cube
+        entries['punctuality_cube'] = write_arrays({
+            'lines': punctuality_cube.lines,
+            'stops': punctuality_cube.stops,
+            'cells': punctuality_cube.cells,
+            'differences': punctuality_cube.differences,
+            'counts': punctuality_cube.counts,
+        }, directory, 'punctuality_cube')
+    if results.arrival_data is not None:
+        entries['arrival_data'] = {'kind': 'arrivals', 'lines': [str(x) for x in results.arrival_data.lines],
+                                   'frame': write_frame(results.arrival_data.events, directory, 'arrival_data',
+                                                        file_format)}
+    for attribute in SKETCHES:
+        if getattr(results, attribute) is not None:
+            getattr(results, attribute).save(os.path.join(directory, attribute + '.json'))
+            entries[attribute] = {'kind': 'sketches', 'file': attribute + '.json'}
+    if results.trace is not None:
+        entries['trace'] = {'kind': 'trace', 'memory': results.trace.memory,
+                            'events': sorted(results.trace.events, key=lambda event: event['start'])}
+    write_manifest({'version': VERSION, 'format': file_format, 'results': entries}, directory, MANIFEST)
+
+
+def read_results(results: 'Results', directory: str, mmap: bool = True) -> 'Results':
+    """
+    Reads results written by write_results.
+    :param results: results to be filled, e.g. a new Results object.
+    :param directory: directory of the results.
+    :param mmap: whether numeric columns and arrays are memory-mapped (read-only) instead of read.
+    :return: filled results.
+    """
+    manifest = read_manifest(directory, MANIFEST)
+    file_format = manifest['format']
+    entries = manifest['results']
+    for attribute in FRAMES:
+        if attribute in entries:
+            setattr(results, attribute, read_frame(directory, entries[attribute], file_format, mmap))
+    if 'places_grid' in entries:
+        description = entries['places_grid']
+        results.places_grid = grid.Grid(description['resolution'], description['hexagonal'], description['lat0'])
+    if 'places_speed_pyramid' in entries:
+        results.places_speed_pyramid = {level['resolution']: (
+            read_frame(directory, level['frame'], file_format, mmap),
+            grid.Grid(level['grid']['resolution'], level['grid']['hexagonal'], level['grid']['lat0']),
+        ) for level in entries['places_speed_pyramid']['levels']}
+    if 'boundary_inaccuracy_count' in entries:
+        results.boundary_inaccuracy_count = entries['boundary_inaccuracy_count']['value']
+    if 'punctuality_cube' in entries:
+        data = read_arrays(directory, entries['punctuality_cube'], mmap)
+        results.punctuality_cube = cube.PunctualityCube(data['lines'], data['stops'], data['cells'],
+                                                        data['differences'], data['counts'])
+        if results.punctuality_data is not None:
+            # the cube was saved with the punctuality data, get_punctuality_cube need not rebuild it
+            results.histograms[('punctuality_data', 'cube')] = (results.punctuality_data, results.punctuality_cube)
+    if 'arrival_data' in entries:
+        description = entries['arrival_data']
+        results.arrival_data = arrivals.ArrivalTable(read_frame(directory, description['frame'], file_format, mmap),
+                                                     description['lines'])
+    for attribute in SKETCHES:
+        if attribute in entries:
+            setattr(results, attribute, sketch.SketchSet.load(os.path.join(directory, entries[attribute]['file'])))
+    if 'trace' in entries:
+        results.trace = instrumentation.Tracer(entries['trace']['memory'])
+        results.trace.events = entries['trace']['events']
+    return results
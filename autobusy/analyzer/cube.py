@@ -0,0 +1,254 @@
+import pandas as pd
+import numpy as np
+import autobusy.analyzer.histogram as histogram
+
+
+def signed_differences(punctuality_data: pd.DataFrame) -> np.ndarray:
+    """
+    Gets the differences between the arrivals and the timetable, negative for early arrivals.
+    :param punctuality_data: dataframe with punctuality data (see Analyzer.get_differences).
+    :return: array of differences in whole minutes.
+    """
+    difference = punctuality_data['Difference'].to_numpy(dtype=np.float64)
+    signed = np.where(punctuality_data['Comment'].to_numpy() == 'Early', -difference, difference)
+    return np.rint(signed).astype(np.int64)
+
+
+class PunctualityCube:
+    """
+    Class for punctuality data aggregated into counts of arrivals by line, stop, hour and signed difference
+    from the timetable in minutes. Each (line, stop, hour) cell present in the data is a row of a dense matrix
+    of counts with one column per difference, so any tolerance, delimiters, lines, stops or hours are answered
+    by summing slices of the matrix instead of grouping the raw rows. Cubes of different windows can be merged.
+    """
+
+    def __init__(self, lines: np.ndarray, stops: np.ndarray, cells: np.ndarray, differences: np.ndarray,
+                 counts: np.ndarray):
+        """
+        Constructor for the PunctualityCube class.
+        :param lines: sorted array of line numbers.
+        :param stops: sorted array of stop IDs.
+        :param cells: array of shape (n, 3) of indexes of the line and the stop and the hour of each cell,
+                      sorted and unique.
+        :param differences: consecutive signed differences in minutes, one per column of the counts.
+        :param counts: array of shape (n, len(differences)) of the numbers of arrivals.
+        """
+        self.lines = lines
+        self.stops = stops
+        self.cells = cells
+        self.differences = differences
+        self.counts = counts
+
+    @staticmethod
+    def from_frame(frame: pd.DataFrame) -> 'PunctualityCube':
+        """
+        Creates a cube from counts of arrivals.
+        :param frame: dataframe with line numbers (Line), stop IDs (Stop), hours (Hour),
+                      signed differences in whole minutes (Difference) and numbers of arrivals (Count),
+                      rows with the same values are added up.
+        :return: cube.
+        """
+        line_index, lines = pd.factorize(frame['Line'].astype(str), sort=True)
+        stop_index, stops = pd.factorize(frame['Stop'].astype(str), sort=True)
+        lines = lines.to_numpy(dtype=str)
+        stops = stops.to_numpy(dtype=str)
+        hour = frame['Hour'].to_numpy(dtype=np.int64)
+        difference = frame['Difference'].to_numpy(dtype=np.int64)
+        if not frame.shape[0]:
+            return PunctualityCube(lines, stops, np.zeros((0, 3), dtype=np.int32), np.zeros(0, dtype=np.int64),
+                                   np.zeros((0, 0), dtype=np.int32))
+        key = (line_index * stops.shape[0] + stop_index) * 24 + hour
+        keys, cell_index = np.unique(key, return_inverse=True)
+        cells = np.stack([keys // 24 // stops.shape[0], keys // 24 % stops.shape[0], keys % 24], axis=1)
+        differences = np.arange(difference.min(), difference.max() + 1)
+        counts = np.bincount(cell_index * differences.shape[0] + difference - differences[0],
+                             weights=frame['Count'].to_numpy(dtype=np.int64),
+                             minlength=keys.shape[0] * differences.shape[0])
+        return PunctualityCube(lines, stops, cells.astype(np.int32), differences,
+                               counts.reshape(keys.shape[0], differences.shape[0]).astype(np.int32))
+
+    @staticmethod
+    def from_punctuality(punctuality_data: pd.DataFrame) -> 'PunctualityCube':
+        """
+        Creates a cube from punctuality data. Arrivals are assigned to the hour of their timetable departure.
+        :param punctuality_data: dataframe with punctuality data (see Analyzer.get_differences).
+        :return: cube.
+        """
+        departure_index, departures = pd.factorize(punctuality_data['Departure'])
+        hours = np.array([int(departure.split(':')[0]) % 24 for departure in departures], dtype=np.int64)
+        return PunctualityCube.from_frame(pd.DataFrame({
+            'Line': punctuality_data['Line'],
+            'Stop': punctuality_data['Stop'],
+            'Hour': hours[departure_index],
+            'Difference': signed_differences(punctuality_data),
+            'Count': 1,
+        }))
+
+    @staticmethod
+    def merge(cubes: list['PunctualityCube']) -> 'PunctualityCube':
+        """
+        Merges cubes, e.g. of different hours or days, adding up the counts of the same cells.
+        :param cubes: list of cubes.
+        :return: cube.
+        """
+        return PunctualityCube.from_frame(pd.concat([cube.to_frame() for cube in cubes] or
+                                                    [PunctualityCube.empty().to_frame()], ignore_index=True))
+
+    @staticmethod
+    def empty() -> 'PunctualityCube':
+        """
+        Creates a cube without arrivals.
+        :return: cube.
+        """
+        return PunctualityCube.from_frame(pd.DataFrame({'Line': [], 'Stop': [], 'Hour': [], 'Difference': [],
+                                                        'Count': []}))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Gets the non-zero counts of the cube.
+        :return: dataframe with the columns accepted by from_frame.
+        """
+        cell, column = np.nonzero(self.counts)
+        return pd.DataFrame({
+            'Line': self.lines[self.cells[cell, 0]],
+            'Stop': self.stops[self.cells[cell, 1]],
+            'Hour': self.cells[cell, 2].astype(np.int64),
+            'Difference': self.differences[column],
+            'Count': self.counts[cell, column].astype(np.int64),
+        })
+
+    def save(self, filename: str):
+        """
+        Saves the cube in a compressed numpy archive.
+        :param filename: path to the file.
+        :return: None
+        """
+        np.savez_compressed(filename, lines=self.lines, stops=self.stops, cells=self.cells,
+                            differences=self.differences, counts=self.counts)
+
+    @staticmethod
+    def load(filename: str) -> 'PunctualityCube':
+        """
+        Loads a cube saved with save.
+        :param filename: path to the file.
+        :return: cube.
+        """
+        with np.load(filename) as data:
+            return PunctualityCube(data['lines'], data['stops'], data['cells'], data['differences'], data['counts'])
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PunctualityCube) and self.to_frame().equals(other.to_frame())
+
+    def select(self, lines=None, stops=None, hours=None) -> np.ndarray:
+        """
+        Selects the cells of given lines, stops and hours.
+        :param lines: line numbers, all lines if not given.
+        :param stops: stop IDs, all stops if not given.
+        :param hours: hours, all hours if not given.
+        :return: boolean array, True for the selected cells.
+        """
+        selected = np.ones(self.cells.shape[0], dtype=bool)
+        for column, categories, values in [(0, self.lines, lines), (1, self.stops, stops), (2, None, hours)]:
+            if values is None:
+                continue
+            if categories is None:
+                selected &= np.isin(self.cells[:, column], np.asarray(values, dtype=np.int64))
+            else:
+                wanted = np.isin(categories, np.asarray(values, dtype=str))
+                selected &= wanted[self.cells[:, column]]
+        return selected
+
+    def difference_counts(self, lines=None, stops=None, hours=None) -> np.ndarray:
+        """
+        Counts the arrivals of given lines at given stops in given hours per signed difference.
+        :param lines: line numbers, all lines if not given.
+        :param stops: stop IDs, all stops if not given.
+        :param hours: hours, all hours if not given.
+        :return: array of counts, one per difference (see the differences attribute).
+        """
+        return self.counts[self.select(lines, stops, hours)].sum(axis=0, dtype=np.int64)
+
+    def histograms(self, lines=None, stops=None,
+                   hours=None) -> tuple[histogram.Histogram, histogram.Histogram, histogram.Histogram]:
+        """
+        Gets the histograms of the differences of early, on time and late arrivals
+        of given lines at given stops in given hours.
+        :param lines: line numbers, all lines if not given.
+        :param stops: stop IDs, all stops if not given.
+        :param hours: hours, all hours if not given.
+        :return: tuple of histograms of early, on time and late arrivals, differences in minutes as in punctuality data.
+        """
+        counts = self.difference_counts(lines, stops, hours)
+        early = self.differences < 0
+        late = self.differences > 0
+        on_time = self.differences == 0
+        return (histogram.Histogram(-self.differences[early], counts[early]),
+                histogram.Histogram(self.differences[on_time], counts[on_time]),
+                histogram.Histogram(self.differences[late], counts[late]))
+
+    def punctuality_counts(self, delimiters: list[float], lines=None, stops=None, hours=None) -> pd.DataFrame:
+        """
+        Counts the arrivals of given lines at given stops in given hours in punctuality categories
+        (see Results.punctuality_counts).
+        :param delimiters: list of punctuality category delimiters.
+        :param lines: line numbers, all lines if not given.
+        :param stops: stop IDs, all stops if not given.
+        :param hours: hours, all hours if not given.
+        :return: dataframe with the comments (Comment), the bounds of the differences in minutes (From, To)
+                 and the counts (Count) of the categories, from the earliest to the latest.
+        """
+        comments, lower, upper, counts = histogram.punctuality_buckets(*self.histograms(lines, stops, hours),
+                                                                       delimiters)
+        return pd.DataFrame({'Comment': comments, 'From': lower, 'To': upper, 'Count': counts})
+
+    def summary(self, by: str, lines=None, stops=None, hours=None) -> pd.DataFrame:
+        """
+        Counts the arrivals of given lines at given stops in given hours per line, stop or hour.
+        :param by: 'Line', 'Stop' or 'Hour'.
+        :param lines: line numbers, all lines if not given.
+        :param stops: stop IDs, all stops if not given.
+        :param hours: hours, all hours if not given.
+        :return: dataframe with the line, the stop or the hour, the numbers of arrivals (Total, Early, Late)
+                 and the mean difference in minutes (MeanDifference, negative for early arrivals),
+                 sorted by the line, the stop or the hour. Lines, stops and hours without arrivals are skipped.
+        """
+        column = ['Line', 'Stop', 'Hour'].index(by)
+        selected = self.select(lines, stops, hours)
+        counts = self.counts[selected]
+        index = self.cells[selected, column]
+        size = [self.lines.shape[0], self.stops.shape[0], 24][column]
+        total = np.bincount(index, counts.sum(axis=1), size)
+        present = total > 0
+        early = np.bincount(index, counts[:, self.differences < 0].sum(axis=1), size)
+        late = np.bincount(index, counts[:, self.differences > 0].sum(axis=1), size)
+        signed = np.bincount(index, counts @ self.differences, size)
+        labels = [self.lines, self.stops, np.arange(24)][column]
+        return pd.DataFrame({
+            by: labels[present].astype(object) if column < 2 else labels[present],
+            'Total': total[present].astype(np.int64),
+            'Early': early[present].astype(np.int64),
+            'Late': late[present].astype(np.int64),
+            'MeanDifference': signed[present] / total[present],
+        })
+
+    def stop_punctuality(self, tol: int, lines=None, hours=None) -> pd.DataFrame:
+        """
+        Counts all and late arrivals at each stop (see Analyzer.stop_punctuality_data).
+        :param tol: tolerance for punctuality in minutes, arrivals late by more minutes are counted as late.
+        :param lines: line numbers, all lines if not given.
+        :param hours: hours, all hours if not given.
+        :return: dataframe with the stop IDs (Stop) and the numbers of all (Total) and late (Late) arrivals,
+                 sorted by the stop.
+        """
+        selected = self.select(lines, None, hours)
+        counts = self.counts[selected]
+        index = self.cells[selected, 1]
+        size = self.stops.shape[0]
+        total = np.bincount(index, counts.sum(axis=1), size)
+        late = np.bincount(index, counts[:, self.differences > max(tol, 0)].sum(axis=1), size)
+        present = total > 0
+        return pd.DataFrame({
+            'Stop': self.stops[present].astype(object),
+            'Total': total[present].astype(np.int64),
+            'Late': late[present].astype(np.int64),
+        })
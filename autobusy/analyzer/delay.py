@@ -0,0 +1,226 @@
+import pandas as pd
+import numpy as np
+import bisect
+import threading
+from autobusy.analyzer.analyzer import Analyzer, RouteData
+import autobusy.analyzer.linref as linref
+
+
+class LineModel:
+    """
+    Class for storing precomputed data of a line used by the delay estimator:
+    geometry of the first route, positions of the stops of both routes along it and timetables of the stops.
+    """
+
+    def __init__(self, line: str, route_data: RouteData):
+        """
+        Constructor for the LineModel class.
+        :param line: line number.
+        :param route_data: route data with at most two opposite routes per line.
+        """
+        routes = route_data.line_route_info[line]
+        stops = route_data.stop_info.loc[routes[0]]
+        self.geometry = linref.RouteGeometry(stops['Lon'].to_numpy(), stops['Lat'].to_numpy())
+        self.route_stops = []
+        for route in routes:
+            stops = route_data.stop_info.loc[route]
+            position, offset = self.geometry.project(stops['Lon'].to_numpy(), stops['Lat'].to_numpy())
+            near = offset < 1
+            order = np.argsort(position[near], kind='stable')
+            self.route_stops.append((np.asarray(route)[near][order].tolist(), position[near][order].tolist()))
+        self.timetables = {}
+        for stop, times in route_data.line_timetable_info.get(line, {}).items():
+            self.timetables[stop] = sorted(int(hour) * 60 + int(minute) for hour, minute in
+                                           (time.split(':') for time in times))
+
+    def closest_departure(self, stop: str, minute_of_day: float) -> float:
+        """
+        Gets the scheduled departure from a stop closest to a given time.
+        :param stop: stop ID.
+        :param minute_of_day: time as minutes since midnight.
+        :return: signed difference in minutes between the time and the closest departure, NaN if there is none.
+        """
+        times = self.timetables.get(stop)
+        if not times:
+            return np.nan
+        i = bisect.bisect_left(times, minute_of_day)
+        candidates = [times[i % len(times)], times[i - 1]]
+        differences = [(minute_of_day - x + 720) % 1440 - 720 for x in candidates]
+        return min(differences, key=abs)
+
+
+class VehicleState:
+    """
+    Class for storing the state of a single vehicle in the delay estimator.
+    """
+
+    def __init__(self, line: str, position: float, segment: int, time: pd.Timestamp):
+        """
+        Constructor for the VehicleState class.
+        :param line: line number.
+        :param position: position along the first route of the line in km.
+        :param segment: segment of the route the vehicle is on.
+        :param time: time of the last ping.
+        """
+        self.line = line
+        self.position = position
+        self.segment = segment
+        self.time = time
+        self.direction = -1
+        self.last_stop = None
+        self.delay = np.nan
+
+
+class DelayEstimator:
+    """
+    Class for estimating delays of vehicles in real time from consecutive polls of the live data API.
+    Each vehicle is handled by a small state machine: its position along the route of the line is updated
+    with a local search around the previous position, the direction is inferred from the movement
+    and stops passed since the previous ping are compared with the timetable.
+    The cost of a ping does not depend on the size of the network or the length of the route.
+    The estimator is thread safe, so it can be updated by the poller and queried from another thread.
+    """
+
+    def __init__(self, route_data: RouteData, min_progress: float = 0.05, max_distance: float = 1):
+        """
+        Constructor for the DelayEstimator class.
+        :param route_data: route data.
+        :param min_progress: minimal movement along the route in km for the direction to be updated
+                             and stops to be passed (smaller movements are treated as GPS noise).
+        :param max_distance: maximal distance in km of a ping from the route, further pings are ignored.
+        """
+        new_line_route_info = Analyzer.get_max_opposite_routes(route_data.line_route_info)
+        self.route_data = RouteData(route_data.stop_info, new_line_route_info, route_data.line_timetable_info)
+        self.min_progress = min_progress
+        self.max_distance = max_distance
+        self.line_models = {}
+        self.vehicles = {}
+        self.stop_delays = {}
+        self.lock = threading.Lock()
+
+    def line_model(self, line: str) -> LineModel:
+        """
+        Gets the model of a line, creating it on first use.
+        :param line: line number.
+        :return: line model.
+        """
+        if line not in self.line_models:
+            self.line_models[line] = LineModel(line, self.route_data)
+        return self.line_models[line]
+
+    def update(self, data: dict):
+        """
+        Updates the estimator with the result of a poll.
+        :param data: dict with request time and result field of the response (see RequestHandler.get_bus_locations).
+        :return: None
+        """
+        with self.lock:
+            for record in data['result']:
+                line = record.get('Lines')
+                if line not in self.route_data.line_route_info:
+                    continue
+                self.update_vehicle(record['VehicleNumber'], line, float(record['Lon']), float(record['Lat']),
+                                    pd.Timestamp(record['Time']))
+
+    def update_vehicle(self, vehicle: str, line: str, lon: float, lat: float, time: pd.Timestamp):
+        """
+        Updates the state of a vehicle with a new ping.
+        :param vehicle: vehicle number.
+        :param line: line number.
+        :param lon: longitude of the ping.
+        :param lat: latitude of the ping.
+        :param time: time of the ping.
+        :return: None
+        """
+        model = self.line_model(line)
+        state = self.vehicles.get(vehicle)
+        if state is not None and state.line == line and time <= state.time:
+            return
+        local = state is not None and state.line == line
+        position, offset, segment = model.geometry.project_point(lon, lat, state.segment if local else None)
+        if local and offset > self.max_distance:
+            position, offset, segment = model.geometry.project_point(lon, lat)
+        if offset > self.max_distance:
+            return
+        if not local:
+            self.vehicles[vehicle] = VehicleState(line, position, segment, time)
+            return
+
+        movement = position - state.position
+        if abs(movement) < self.min_progress:
+            state.time = time
+            state.segment = segment
+            return
+        direction = 0 if movement > 0 else 1
+        if direction < len(model.route_stops):
+            self.pass_stops(model, state, direction, position, time)
+        state.direction = direction
+        state.position = position
+        state.segment = segment
+        state.time = time
+
+    def pass_stops(self, model: LineModel, state: VehicleState, direction: int, position: float,
+                   time: pd.Timestamp):
+        """
+        Records delays at the stops passed by a vehicle between its previous and current position.
+        :param model: line model.
+        :param state: state of the vehicle before the ping.
+        :param direction: direction of the movement (index of the route).
+        :param position: current position of the vehicle.
+        :param time: time of the ping.
+        :return: None
+        """
+        stops, stop_positions = model.route_stops[direction]
+        if direction == 0:
+            first = bisect.bisect_right(stop_positions, state.position)
+            last = bisect.bisect_right(stop_positions, position)
+        else:
+            first = bisect.bisect_left(stop_positions, position)
+            last = bisect.bisect_left(stop_positions, state.position)
+        for i in range(first, last):
+            weight = (stop_positions[i] - state.position) / (position - state.position)
+            passage_time = state.time + pd.Timedelta(seconds=float(weight) * (time - state.time).total_seconds())
+            minute_of_day = (passage_time - passage_time.normalize()) / pd.Timedelta(minutes=1)
+            delay = model.closest_departure(stops[i], minute_of_day)
+            if np.isnan(delay):
+                continue
+            state.delay = delay
+            state.last_stop = stops[i]
+            self.stop_delays[(state.line, stops[i])] = (delay, passage_time)
+
+    def snapshot(self, lines: list[str] = None, stops: list[str] = None) -> pd.DataFrame:
+        """
+        Gets the latest delays at stops.
+        :param lines: lines to be included, all by default.
+        :param stops: stops to be included, all by default.
+        :return: dataframe with columns Line, Stop, Time (of the passage) and Delay (in minutes, negative if early).
+        """
+        with self.lock:
+            rows = [
+                (line, stop, passage_time, delay) for (line, stop), (delay, passage_time) in self.stop_delays.items()
+                if (lines is None or line in lines) and (stops is None or stop in stops)
+            ]
+        return pd.DataFrame(rows, columns=['Line', 'Stop', 'Time', 'Delay'])
+
+    def vehicle_snapshot(self) -> pd.DataFrame:
+        """
+        Gets the current state of all vehicles.
+        :return: dataframe with columns VehicleNumber, Line, Direction, Position, LastStop, Delay, Time.
+        """
+        with self.lock:
+            rows = [
+                (vehicle, state.line, state.direction, state.position, state.last_stop, state.delay, state.time)
+                for vehicle, state in self.vehicles.items()
+            ]
+        return pd.DataFrame(rows, columns=['VehicleNumber', 'Line', 'Direction', 'Position', 'LastStop', 'Delay',
+                                           'Time'])
+
+    def line_delays(self) -> pd.DataFrame:
+        """
+        Gets the mean and maximal current delay of vehicles for each line.
+        :return: dataframe with columns Line, Vehicles, MeanDelay, MaxDelay.
+        """
+        vehicles = self.vehicle_snapshot().dropna(subset=['Delay'])
+        return vehicles.groupby('Line')['Delay'].agg(
+            Vehicles='count', MeanDelay='mean', MaxDelay='max'
+        ).reset_index()
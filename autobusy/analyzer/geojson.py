@@ -0,0 +1,109 @@
+import pandas as pd
+import numpy as np
+from autobusy.analyzer.kernels import EARTH_RADIUS
+
+
+def simplify(lon, lat, tolerance: float) -> np.ndarray:
+    """
+    Simplifies a trajectory with the Douglas-Peucker algorithm. Distances are measured on a local
+    equirectangular projection, which is accurate enough for a single city.
+    :param lon: longitudes of the points of the trajectory.
+    :param lat: latitudes of the points of the trajectory.
+    :param tolerance: maximum distance in km of a removed point from the simplified trajectory.
+    :return: boolean array marking the points kept (always including the first and the last one).
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    keep = np.zeros(lon.shape[0], dtype=bool)
+    if lon.shape[0] <= 2:
+        keep[:] = True
+        return keep
+    x = np.radians(lon) * np.cos(np.radians(lat.mean())) * EARTH_RADIUS
+    y = np.radians(lat) * EARTH_RADIUS
+    keep[0] = keep[-1] = True
+    stack = [(0, lon.shape[0] - 1)]
+    while stack:
+        start, stop = stack.pop()
+        if stop - start < 2:
+            continue
+        dx, dy = x[stop] - x[start], y[stop] - y[start]
+        px, py = x[start + 1:stop] - x[start], y[start + 1:stop] - y[start]
+        length = dx * dx + dy * dy
+        t = np.clip((px * dx + py * dy) / length, 0, 1) if length > 0 else 0
+        distance = np.hypot(px - t * dx, py - t * dy)
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, stop))
+    return keep
+
+
+def feature_collection(geometry_type: str, coordinates: list, properties: pd.DataFrame = None) -> dict:
+    """
+    Builds a GeoJSON feature collection of geometries of one type.
+    :param geometry_type: GeoJSON geometry type, e.g. 'Point'.
+    :param coordinates: list of coordinates of the geometries.
+    :param properties: dataframe with the properties of the features, one row per geometry.
+    :return: GeoJSON feature collection.
+    """
+    records = properties.to_dict('records') if properties is not None else [{}] * len(coordinates)
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'geometry': {'type': geometry_type, 'coordinates': c}, 'properties': p}
+            for c, p in zip(coordinates, records)
+        ],
+    }
+
+
+def points(lon, lat, properties: pd.DataFrame = None) -> dict:
+    """
+    Builds a GeoJSON feature collection of points.
+    :param lon: longitudes of the points.
+    :param lat: latitudes of the points.
+    :param properties: dataframe with the properties of the points.
+    :return: GeoJSON feature collection.
+    """
+    coordinates = np.column_stack([np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)])
+    return feature_collection('Point', coordinates.tolist(), properties)
+
+
+def polygons(outlines: np.ndarray, properties: pd.DataFrame = None) -> dict:
+    """
+    Builds a GeoJSON feature collection of polygons without holes.
+    :param outlines: array of shape (number of polygons, number of vertices, 2) of closed [lon, lat] outlines
+                     (see Grid.polygons).
+    :param properties: dataframe with the properties of the polygons.
+    :return: GeoJSON feature collection.
+    """
+    return feature_collection('Polygon', [[outline] for outline in outlines.tolist()], properties)
+
+
+def lines(lon, lat, groups, properties: pd.DataFrame = None, tolerance: float = 0) -> dict:
+    """
+    Builds a GeoJSON feature collection of lines, e.g. trajectories of vehicles,
+    simplifying them with the Douglas-Peucker algorithm.
+    :param lon: longitudes of the points of the lines.
+    :param lat: latitudes of the points of the lines.
+    :param groups: labels of the lines of the points, the points of a line must be contiguous.
+    :param properties: dataframe with the properties of the lines, in the order of their first points.
+    :param tolerance: tolerance of the simplification in km, 0 keeps all points.
+    :return: GeoJSON feature collection.
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    groups = np.asarray(groups)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]]) if groups.shape[0] else np.array([], int)
+    bounds = np.r_[starts, groups.shape[0]]
+    if tolerance > 0:
+        keep = np.concatenate([simplify(lon[a:b], lat[a:b], tolerance) for a, b in zip(bounds[:-1], bounds[1:])]
+                              or [np.zeros(0, dtype=bool)])
+    else:
+        keep = np.ones(lon.shape[0], dtype=bool)
+    coordinates = np.column_stack([lon, lat])[keep].tolist()
+    kept_bounds = np.r_[0, np.cumsum(keep)][bounds]
+    return feature_collection('LineString', [
+        coordinates[a:b] for a, b in zip(kept_bounds[:-1], kept_bounds[1:])
+    ], properties)
@@ -0,0 +1,139 @@
+import pandas as pd
+import numpy as np
+
+WARSAW_LAT = 52.23
+
+
+class Grid:
+    """
+    Class for binning coordinates into square or hexagonal grid cells.
+    Cells are identified by 64-bit integers encoding two 32-bit cell coordinates.
+    Hexagonal cells are laid out on coordinates with longitude scaled by the cosine of the reference latitude,
+    so that they are close to regular hexagons on the ground.
+    """
+
+    def __init__(self, resolution: float = 0.01, hexagonal: bool = False, lat0: float = WARSAW_LAT):
+        """
+        Constructor for the Grid class.
+        :param resolution: size of the cells in degrees (side of a square cell
+                           or distance between centers of neighbouring hexagonal cells).
+        :param hexagonal: whether the cells are hexagonal.
+        :param lat0: reference latitude for hexagonal cells.
+        """
+        self.resolution = resolution
+        self.hexagonal = hexagonal
+        self.lat0 = lat0
+        self.scale = np.cos(np.radians(lat0))
+        self.radius = resolution / np.sqrt(3)
+
+    @staticmethod
+    def encode(i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        """
+        Encodes cell coordinates as cell ids.
+        :param i: first coordinates.
+        :param j: second coordinates.
+        :return: array of cell ids.
+        """
+        return (i.astype(np.int64) << 32) | (j.astype(np.int64) & 0xffffffff)
+
+    @staticmethod
+    def decode(cell: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Decodes cell ids into cell coordinates.
+        :param cell: array of cell ids.
+        :return: tuple of first and second coordinates.
+        """
+        return cell >> 32, ((cell & 0xffffffff) ^ 0x80000000) - 0x80000000
+
+    def cells(self, lon, lat) -> np.ndarray:
+        """
+        Gets the cells containing given points.
+        :param lon: longitudes of the points.
+        :param lat: latitudes of the points.
+        :return: array of cell ids.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        if not self.hexagonal:
+            return self.encode(np.floor(lon / self.resolution + 0.5), np.floor(lat / self.resolution + 0.5))
+        x = lon * self.scale / self.radius
+        y = lat / self.radius
+        q = np.sqrt(3) / 3 * x - y / 3
+        r = 2 / 3 * y
+        # cube coordinates rounding
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+        return self.encode(rq, rr)
+
+    def centers(self, cell: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the centers of cells.
+        :param cell: array of cell ids.
+        :return: tuple of longitudes and latitudes.
+        """
+        i, j = self.decode(np.asarray(cell, dtype=np.int64))
+        if not self.hexagonal:
+            return np.round(i * self.resolution, 10), np.round(j * self.resolution, 10)
+        x = self.radius * (np.sqrt(3) * i + np.sqrt(3) / 2 * j)
+        y = self.radius * 1.5 * j
+        return x / self.scale, y
+
+    def offsets(self) -> np.ndarray:
+        """
+        Gets the offsets of the vertices of a cell from its center.
+        :return: array of (longitude, latitude) offsets, one row per vertex.
+        """
+        if not self.hexagonal:
+            half = self.resolution / 2
+            return np.array([(-half, -half), (-half, half), (half, half), (half, -half)])
+        angles = np.radians(30 + 60 * np.arange(6))
+        return np.column_stack([self.radius * np.cos(angles) / self.scale, self.radius * np.sin(angles)])
+
+    def polygon(self, lon: float, lat: float) -> list[list[float]]:
+        """
+        Gets the outline of the cell with a given center.
+        :param lon: longitude of the center.
+        :param lat: latitude of the center.
+        :return: closed list of [lat, lon] vertices.
+        """
+        vertices = [[lat + d_lat, lon + d_lon] for d_lon, d_lat in self.offsets().tolist()]
+        return vertices + vertices[:1]
+
+    def polygons(self, lon, lat) -> np.ndarray:
+        """
+        Gets the outlines of the cells with given centers at once.
+        :param lon: longitudes of the centers.
+        :param lat: latitudes of the centers.
+        :return: array of shape (number of cells, number of vertices + 1, 2) of closed [lon, lat] outlines
+                 (the GeoJSON order of coordinates).
+        """
+        offsets = self.offsets()
+        offsets = np.concatenate([offsets, offsets[:1]])
+        centers = np.column_stack([np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)])
+        return centers[:, None, :] + offsets[None, :, :]
+
+    def count(self, lon, lat, flags: dict[str, np.ndarray] = None) -> pd.DataFrame:
+        """
+        Counts points in cells.
+        :param lon: longitudes of the points.
+        :param lat: latitudes of the points.
+        :param flags: dictionary of column name -> boolean array, points with the flag set are counted separately.
+        :return: dataframe with cell centers (Lon, Lat), number of points (Total) and numbers of flagged points,
+                 sorted by cell id.
+        """
+        cell_ids, inverse = np.unique(self.cells(lon, lat), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        cell_lon, cell_lat = self.centers(cell_ids)
+        res = pd.DataFrame({
+            'Lon': cell_lon,
+            'Lat': cell_lat,
+            'Total': np.bincount(inverse, minlength=cell_ids.shape[0]),
+        })
+        for name, flag in (flags or {}).items():
+            res[name] = np.bincount(inverse[np.asarray(flag, dtype=bool)], minlength=cell_ids.shape[0])
+        return res
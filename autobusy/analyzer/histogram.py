@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class Histogram:
+    """
+    Class for counting values in buckets given by delimiters.
+    The values are sorted once, then the counts for any delimiters are found with a binary search,
+    in time proportional to the number of buckets times the logarithm of the number of values.
+    Counts are memoised per delimiters, so re-plotting with the same buckets costs nothing.
+    Values can be weighted, e.g. by counts of values aggregated beforehand (see cube.PunctualityCube).
+    """
+
+    def __init__(self, values, weights=None):
+        """
+        Constructor for the Histogram class.
+        :param values: values to be counted, NaN values are skipped.
+        :param weights: integer weights of the values, 1 for every value if not given.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        known = ~np.isnan(values)
+        if weights is None:
+            self.values = np.sort(values[known])
+            self.cumulative = np.arange(self.values.shape[0] + 1)
+        else:
+            order = np.argsort(values[known], kind='stable')
+            self.values = values[known][order]
+            self.cumulative = np.r_[0, np.cumsum(np.asarray(weights, dtype=np.int64)[known][order])]
+        self.cache = {}
+
+    def counts(self, delimiters: list[float]) -> np.ndarray:
+        """
+        Counts the values in buckets [delimiters[i], delimiters[i + 1]) and [delimiters[-1], inf).
+        Values below the first delimiter are not counted.
+        :param delimiters: non-decreasing list of delimiters.
+        :return: array of counts, one per delimiter.
+        """
+        key = tuple(delimiters)
+        if key not in self.cache:
+            delimiters = np.asarray(delimiters, dtype=np.float64)
+            if delimiters.shape[0] == 0 or np.any(np.diff(delimiters) < 0):
+                raise ValueError('Delimiters must be a non-empty non-decreasing list')
+            starts = np.searchsorted(self.values, delimiters, side='left')
+            self.cache[key] = np.diff(self.cumulative[np.r_[starts, self.values.shape[0]]])
+        return self.cache[key]
+
+    def below(self, value: float) -> int:
+        """
+        Counts the values below a given value.
+        :param value: value.
+        :return: number (total weight) of values.
+        """
+        return int(self.cumulative[np.searchsorted(self.values, value, side='left')])
+
+    def total(self) -> int:
+        """
+        Counts all the values.
+        :return: number (total weight) of values.
+        """
+        return int(self.cumulative[-1])
+
+
+def punctuality_buckets(early: Histogram, on_time: Histogram, late: Histogram,
+                        delimiters: list[float]) -> tuple[list[str], list[float], list[float], np.ndarray]:
+    """
+    Counts arrivals in punctuality categories: early and late by [delimiters[i], delimiters[i + 1])
+    and by at least delimiters[-1] minutes, and within delimiters[0] minutes of the timetable
+    (including the arrivals on time). Every arrival is counted in exactly one category.
+    :param early: histogram of the differences of early arrivals.
+    :param on_time: histogram of the differences of arrivals on time.
+    :param late: histogram of the differences of late arrivals.
+    :param delimiters: non-decreasing list of delimiters.
+    :return: tuple of lists of the comments, the lower and the upper bounds of the differences in minutes
+             and array of the counts of the categories, from the earliest to the latest.
+    """
+    early_counts = early.counts(delimiters)
+    counts = np.concatenate([
+        early_counts[::-1],
+        [early.below(delimiters[0]) + on_time.total() + late.below(delimiters[0])],
+        late.counts(delimiters),
+    ])
+    bounds = list(delimiters[1:]) + [np.inf]
+    comments = ['Early'] * len(delimiters) + ['On time'] + ['Late'] * len(delimiters)
+    lower = list(reversed(delimiters)) + [0] + list(delimiters)
+    upper = list(reversed(bounds)) + [delimiters[0]] + bounds
+    return comments, lower, upper, counts
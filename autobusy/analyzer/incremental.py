@@ -0,0 +1,264 @@
+import pandas as pd
+import numpy as np
+import autobusy.analyzer.util as util
+import autobusy.analyzer.grid as grid
+import autobusy.analyzer.linref as linref
+import autobusy.analyzer.arrivals as arrivals
+
+
+class IncrementalState:
+    """
+    Class for updating analysis results as new snapshots of live data arrive.
+    Keeps carry-over state per vehicle (last ping, position along the route, odometer)
+    and per grid cell (counters), so that each update costs time proportional to the new data only.
+    Pings older than the last ping of their vehicle are ignored and pings of different days are not paired.
+    """
+
+    def __init__(self, resolution: float = 0.01, fast_speed: float = 50, min_progress: float = 0.05,
+                 end_tolerance: float = 0.3):
+        """
+        Constructor for the IncrementalState class.
+        :param resolution: size of the grid cells in degrees (see grid.Grid).
+        :param fast_speed: speed in km/h above which a record is considered fast.
+        :param min_progress: minimal movement along the route in km between consecutive pings
+                             for stop arrivals to be detected (smaller movements are treated as GPS noise).
+        :param end_tolerance: distance in km from an end of the route within which a vehicle is considered
+                              to be at the end (e.g. at a terminus), as in Analyzer.arrival_events.
+        """
+        self.grid = grid.Grid(resolution)
+        self.fast_speed = fast_speed
+        self.min_progress = min_progress
+        self.end_tolerance = end_tolerance
+        self.last_pings = pd.DataFrame(
+            {'Lines': pd.Series(dtype=object), 'Lon': pd.Series(dtype=float), 'Lat': pd.Series(dtype=float),
+             'Time': pd.Series(dtype='datetime64[ns]')},
+            index=pd.Index([], dtype=object, name='VehicleNumber')
+        )
+        # last ping of each vehicle near the route of its line, from which stop arrivals are detected,
+        # so that a ping far from the route (e.g. a GPS jump) does not break the detection
+        self.last_route_pings = pd.DataFrame(
+            {'Lines': pd.Series(dtype=object), 'Position': pd.Series(dtype=float),
+             'Time': pd.Series(dtype='datetime64[ns]')},
+            index=pd.Index([], dtype=object, name='VehicleNumber')
+        )
+        self.odometer = pd.Series(dtype=float, name='Distance')
+        self.cell_counts = pd.DataFrame({'Total': pd.Series(dtype=np.int64), 'Fast': pd.Series(dtype=np.int64)})
+        # dataframes of speed records, concatenated only when speed data is read
+        self.speed_records = []
+        # dataframes of arrival events (see arrivals.COLUMNS) and lines with consecutive pings on the same line
+        self.events = []
+        self.lines = set()
+        self.arrivals = None
+        self.geometries = {}
+
+    def consecutive_pings(self, snapshot_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Prepends the last known ping of each vehicle to new pings and marks the pairs of consecutive pings.
+        :param snapshot_df: dataframe with new pings.
+        :return: dataframe with pings sorted by vehicle and time, with columns Previous* describing the previous
+                 ping of the same vehicle on the same day (NaN for the first ping of a vehicle on each day).
+        """
+        columns = ['VehicleNumber', 'Lines', 'Lon', 'Lat', 'Time']
+        if 'Brigade' in snapshot_df:
+            columns.append('Brigade')
+        new_pings = snapshot_df[columns].copy()
+        new_pings['New'] = True
+        carried = self.last_pings[self.last_pings.index.isin(new_pings['VehicleNumber'])].reset_index()
+        carried['New'] = False
+        pings = pd.concat([carried, new_pings], ignore_index=True)
+        pings = pings.sort_values(['VehicleNumber', 'Time'], kind='stable')
+        last_time = pings['VehicleNumber'].map(self.last_pings['Time'])
+        pings = pings[~pings['New'] | last_time.isna() | (pings['Time'] > last_time)]
+        pings = pings.drop_duplicates(['VehicleNumber', 'Time'], keep='first').reset_index(drop=True)
+        day = pings['Time'].dt.normalize()
+        same_vehicle = pings['VehicleNumber'].eq(pings['VehicleNumber'].shift()) & day.eq(day.shift())
+        for column in ['Lines', 'Lon', 'Lat', 'Time']:
+            pings['Previous' + column] = pings[column].shift().where(same_vehicle)
+        return pings
+
+    def update(self, snapshot_df: pd.DataFrame, route_data=None) -> pd.DataFrame:
+        """
+        Updates the state with new pings.
+        :param snapshot_df: dataframe with new pings (in the format returned by LiveParser).
+        :param route_data: route data with at most two opposite routes per line,
+                           stop arrivals are updated only if given.
+        :return: dataframe with new speed records (same columns as Analyzer.speed_data).
+        """
+        pings = self.consecutive_pings(snapshot_df)
+        if route_data is not None:
+            self.update_positions(pings, route_data)
+            self.update_stop_arrivals(pings, route_data)
+        pairs = pings[pings['PreviousTime'].notna()]
+        dist = util.distance(pairs['PreviousLon'], pairs['PreviousLat'], pairs['Lon'], pairs['Lat'])
+        hours = (pairs['Time'] - pairs['PreviousTime']).dt.total_seconds() / 3600
+        speed_data = pd.concat([pairs['VehicleNumber'], pairs['Time'], pairs['Lon'], pairs['Lat'], pairs['Time'],
+                                util.speed(dist, hours).rename('Speed')], axis=1).dropna().reset_index(drop=True)
+
+        self.speed_records.append(speed_data)
+        self.odometer = self.odometer.add(dist.groupby(pairs['VehicleNumber']).sum(), fill_value=0)
+
+        counts = self.grid.count(speed_data['Lon'], speed_data['Lat'],
+                                 {'Fast': speed_data['Speed'].to_numpy() > self.fast_speed})
+        counts.index = self.grid.cells(counts['Lon'], counts['Lat'])
+        self.cell_counts = self.cell_counts.add(counts[['Total', 'Fast']], fill_value=0).astype(np.int64)
+
+        last_pings = pings.drop_duplicates('VehicleNumber', keep='last').set_index('VehicleNumber')
+        self.last_pings = pd.concat([
+            self.last_pings[~self.last_pings.index.isin(last_pings.index)],
+            last_pings[self.last_pings.columns.intersection(last_pings.columns)]
+        ])
+        return speed_data
+
+    def update_positions(self, pings: pd.DataFrame, route_data):
+        """
+        Adds positions along the first route of the line (Position) and distances from it (Distance) to the pings,
+        and the line, position and time of the previous ping of the same vehicle on the same day which is
+        at most 1 km from the route (PreviousRouteLines, PreviousRoutePosition, PreviousRouteTime).
+        Positions within end_tolerance of an end of the route are moved to the end.
+        :param pings: dataframe returned by consecutive_pings.
+        :param route_data: route data.
+        :return: None
+        """
+        pings['Position'] = np.nan
+        pings['Distance'] = np.nan
+        for line, group in pings[pings['Lines'].isin(route_data.line_route_info)].groupby('Lines'):
+            geometry = self.geometry(route_data, line)[0]
+            position, offset = geometry.project(group['Lon'], group['Lat'])
+            position[position <= self.end_tolerance] = 0
+            position[position >= geometry.cumulative[-1] - self.end_tolerance] = geometry.cumulative[-1]
+            pings.loc[group.index, 'Position'] = position
+            pings.loc[group.index, 'Distance'] = offset
+
+        # new pings near the route, and the last such ping of each vehicle in place of its carried ping
+        on_route = pings['New'] & (pings['Distance'] < 1)
+        route_pings = pings[['Lines', 'Position', 'Time']].where(on_route)
+        carried = pings.index[~pings['New']]
+        seed = self.last_route_pings.reindex(pings.loc[carried, 'VehicleNumber'])
+        for column in seed.columns:
+            route_pings.loc[carried, column] = seed[column].to_numpy()
+        vehicle = pings['VehicleNumber']
+        previous = route_pings.groupby(vehicle).shift().groupby(vehicle).ffill()
+        same_day = previous['Time'].dt.normalize().eq(pings['Time'].dt.normalize())
+        for column in ['Lines', 'Position', 'Time']:
+            pings['PreviousRoute' + column] = previous[column].where(same_day)
+
+        last = pings[on_route].drop_duplicates('VehicleNumber', keep='last').set_index('VehicleNumber')
+        self.last_route_pings = pd.concat([
+            self.last_route_pings[~self.last_route_pings.index.isin(last.index)],
+            last[self.last_route_pings.columns]
+        ])
+
+    def geometry(self, route_data, line: str) -> tuple[linref.RouteGeometry, list[tuple[np.ndarray, np.ndarray]]]:
+        """
+        Gets the cached geometry of the first route of a line and the positions of the stops of its routes.
+        :param route_data: route data with at most two opposite routes per line.
+        :param line: line number.
+        :return: tuple of route geometry and list of (stops, positions) for each route, sorted by position.
+                 Stops further than 1 km from the first route are skipped.
+        """
+        if line not in self.geometries:
+            routes = route_data.line_route_info[line]
+            stops = route_data.stop_info.loc[routes[0]]
+            geometry = linref.RouteGeometry(stops['Lon'].to_numpy(), stops['Lat'].to_numpy())
+            route_stops = []
+            for route in routes:
+                stops = route_data.stop_info.loc[route]
+                position, offset = geometry.project(stops['Lon'].to_numpy(), stops['Lat'].to_numpy())
+                near = offset < 1
+                order = np.argsort(position[near], kind='stable')
+                route_stops.append((np.asarray(route)[near][order], position[near][order]))
+            self.geometries[line] = (geometry, route_stops)
+        return self.geometries[line]
+
+    def update_stop_arrivals(self, pings: pd.DataFrame, route_data):
+        """
+        Detects stops passed between consecutive pings of a vehicle near the route of its line and records
+        the arrivals. Pings far from the route are skipped, so the pings around them are paired.
+        Moving forward along the first route means the vehicle runs the first route, moving backward - the second.
+        Arrival times are interpolated between the pings. A vehicle reaching an end of the route arrives
+        at the stops there, and a vehicle leaving an end (e.g. a terminus) passes the stops there
+        at its last ping at the end.
+        :param pings: dataframe returned by consecutive_pings, with positions (see update_positions).
+        :param route_data: route data.
+        :return: None
+        """
+        pairs = pings[(pings['PreviousRouteLines'] == pings['Lines']) & pings['PreviousRoutePosition'].notna() &
+                      (pings['Distance'] < 1)]
+        for line, group in pairs.groupby('Lines'):
+            geometry, route_stops = self.geometry(route_data, line)
+            start = group['PreviousRoutePosition'].to_numpy().astype(np.float64)
+            end = group['Position'].to_numpy()
+            start_time = group['PreviousRouteTime'].to_numpy().astype(np.int64).astype(np.float64)
+            end_time = group['Time'].to_numpy().astype(np.int64).astype(np.float64)
+            for i, (stops, stop_position) in enumerate(route_stops):
+                forward = i == 0
+                moving = (end - start if forward else start - end) > self.min_progress
+                # stops in (start, end] when moving forward and [end, start) when moving backward,
+                # and the stops at the end of the route the vehicle leaves
+                side = 'right' if forward else 'left'
+                if forward:
+                    bound = np.where(start <= 0, -np.inf, start)
+                else:
+                    bound = np.where(start >= geometry.cumulative[-1], np.inf, start)
+                first = np.searchsorted(stop_position, (bound if forward else end)[moving], side=side)
+                last = np.searchsorted(stop_position, (end if forward else bound)[moving], side=side)
+                count = last - first
+                pair = np.repeat(np.arange(count.shape[0]), count)
+                stop_index = first[pair] + np.arange(pair.shape[0]) - np.repeat(np.cumsum(count) - count, count)
+                weight = (stop_position[stop_index] - start[moving][pair]) / (end[moving][pair] - start[moving][pair])
+                times = start_time[moving][pair] + weight * (end_time[moving][pair] - start_time[moving][pair])
+                if pair.shape[0]:
+                    self.events.append(pd.DataFrame({
+                        'Line': line,
+                        'Direction': i,
+                        'VehicleNumber': group['VehicleNumber'].to_numpy()[moving][pair],
+                        'Brigade': group['Brigade'].to_numpy()[moving][pair] if 'Brigade' in group else None,
+                        'Stop': stops[stop_index].astype(object),
+                        'Time': pd.to_datetime(times.astype(np.int64)),
+                        'Distance': stop_position[stop_index],
+                    }))
+            self.lines.add(line)
+            self.arrivals = None
+
+    def speed_data(self) -> pd.DataFrame:
+        """
+        Gets the speed records of all updates so far. The records are concatenated when they are read,
+        so updates do not copy the records of previous updates.
+        :return: dataframe with the same columns as Analyzer.speed_data, None before the first update.
+        """
+        if not self.speed_records:
+            return None
+        if len(self.speed_records) > 1:
+            self.speed_records = [pd.concat(self.speed_records, ignore_index=True)]
+        return self.speed_records[0]
+
+    def arrival_table(self) -> arrivals.ArrivalTable:
+        """
+        Gets the arrivals recorded so far. The table is built when it is read after an update with new arrivals,
+        so updates only record new arrival events.
+        :return: arrival table.
+        """
+        if self.arrivals is None:
+            self.events = [pd.concat(self.events, ignore_index=True)] if self.events else []
+            self.arrivals = arrivals.ArrivalTable(self.events[0] if self.events else None, self.lines)
+        return self.arrivals
+
+    def places_speed_data(self) -> pd.DataFrame:
+        """
+        Gets places speed data from the cell counters.
+        :return: dataframe with the same columns as Analyzer.places_speed_data.
+        """
+        cell_lon, cell_lat = self.grid.centers(self.cell_counts.index.to_numpy())
+        return pd.DataFrame({
+            'Lon': cell_lon,
+            'Lat': cell_lat,
+            'Total': self.cell_counts['Total'].to_numpy(),
+            'Fast': self.cell_counts['Fast'].to_numpy(),
+        })
+
+    def distance_data(self) -> pd.DataFrame:
+        """
+        Gets distance data from the odometers.
+        :return: dataframe with the same columns as Analyzer.distance_data.
+        """
+        return self.odometer.rename_axis('VehicleNumber').rename('Distance').reset_index()
@@ -0,0 +1,247 @@
+import pandas as pd
+import numpy as np
+import autobusy.analyzer.arrivals as arrivals
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# tracer recording the spans of the current context
+_current = contextvars.ContextVar('tracer', default=None)
+
+
+def rows(value):
+    """
+    Gets the number of rows of a stage input or output.
+    :param value: value.
+    :return: number of rows of dataframes, series and arrays, length of lists, dicts and arrival tables,
+             rows of the first element of tuples, None for other values.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return value.shape[0] if value.ndim else None
+    if isinstance(value, (list, dict, arrivals.ArrivalTable)):
+        return len(value)
+    if isinstance(value, tuple) and value:
+        return rows(value[0])
+    return None
+
+
+class Span:
+    """
+    Class for measuring one call of a stage.
+    """
+
+    def __init__(self, tracer: 'Tracer', name: str, rows_in: int = None):
+        """
+        Constructor for the Span class.
+        :param tracer: tracer recording the span.
+        :param name: stage name.
+        :param rows_in: number of input rows.
+        """
+        self.tracer = tracer
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.parent = None
+        self.peak = 0
+
+    def __enter__(self):
+        tracer = self.tracer
+        self.parent = tracer.stack[-1] if tracer.stack else None
+        self.depth = len(tracer.stack)
+        tracer.stack.append(self)
+        if tracer.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                tracer.started_tracemalloc = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+        self.cpu_start = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu_start
+        tracer = self.tracer
+        peak_memory = None
+        if tracer.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak_memory = self.peak - self.memory_start
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, self.peak)
+        tracer.stack.pop()
+        if not tracer.stack and tracer.started_tracemalloc:
+            tracemalloc.stop()
+            tracer.started_tracemalloc = False
+        tracer.events.append({
+            'name': self.name,
+            'start': self.start - tracer.origin,
+            'wall': wall,
+            'cpu': cpu,
+            'peak_memory': peak_memory,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'depth': self.depth,
+            'parent': self.parent.name if self.parent is not None else None,
+            'error': exc_type.__name__ if exc_type is not None else None,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        })
+        return False
+
+
+class Tracer:
+    """
+    Class for recording a structured trace of analysis stages: wall time, CPU time, peak memory allocated
+    by the stage (measured with tracemalloc, which slows allocations down, so it can be turned off)
+    and numbers of input and output rows.
+    Stages are functions decorated with traced. They are recorded when a tracer is active, i.e. inside
+    a with block of the tracer or inside a method of an object with the tracer in its tracer attribute
+    (e.g. Analyzer created with trace=True). Otherwise traced functions only check a context variable.
+    Stages running in worker processes are recorded as a whole by the calling stage.
+    """
+
+    def __init__(self, memory: bool = True):
+        """
+        Constructor for the Tracer class.
+        :param memory: whether to measure peak memory.
+        """
+        self.memory = memory
+        self.events = []
+        self.stack = []
+        self.tokens = []
+        self.started_tracemalloc = False
+        self.origin = time.perf_counter()
+
+    def __enter__(self):
+        self.tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current.reset(self.tokens.pop())
+        return False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['stack'] = []
+        state['tokens'] = []
+        return state
+
+    def span(self, name: str, rows_in: int = None) -> Span:
+        """
+        Creates a span measuring a block of code, e.g. with tracer.span('name') as span: ...
+        :param name: stage name.
+        :param rows_in: number of input rows.
+        :return: span, its rows_out attribute can be set inside the block.
+        """
+        return Span(self, name, rows_in)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Gets the trace as a dataframe.
+        :return: dataframe with one row per recorded call, in the order of the starts of the calls.
+        """
+        columns = ['name', 'start', 'wall', 'cpu', 'peak_memory', 'rows_in', 'rows_out', 'depth', 'parent', 'error',
+                   'pid', 'tid']
+        return pd.DataFrame(self.events, columns=columns).sort_values('start', kind='stable').reset_index(drop=True)
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Gets the totals of the trace per stage.
+        :return: dataframe indexed by stage name with the number of calls (calls), total wall and CPU time
+                 (wall, cpu), the maximum peak memory (peak_memory) and total rows (rows_in, rows_out),
+                 sorted by total wall time.
+        """
+        return self.to_frame().groupby('name').agg(
+            calls=('wall', 'size'), wall=('wall', 'sum'), cpu=('cpu', 'sum'), peak_memory=('peak_memory', 'max'),
+            rows_in=('rows_in', 'sum'), rows_out=('rows_out', 'sum')
+        ).sort_values('wall', ascending=False)
+
+    def to_json(self, filename: str = None) -> str:
+        """
+        Exports the trace as JSON.
+        :param filename: path to the output file, the trace is only returned if not given.
+        :return: JSON with the list of recorded calls in the events field.
+        """
+        text = json.dumps({'events': sorted(self.events, key=lambda event: event['start'])}, indent=2)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_chrome_trace(self, filename: str = None) -> dict:
+        """
+        Exports the trace in the Chrome trace event format, which can be opened in chrome://tracing or Perfetto.
+        :param filename: path to the output file, the trace is only returned if not given.
+        :return: dictionary with complete events in the traceEvents field.
+        """
+        trace = {'traceEvents': [{
+            'name': event['name'],
+            'cat': 'autobusy',
+            'ph': 'X',
+            'ts': event['start'] * 1e6,
+            'dur': event['wall'] * 1e6,
+            'pid': event['pid'],
+            'tid': event['tid'],
+            'args': {key: event[key] for key in ('cpu', 'peak_memory', 'rows_in', 'rows_out', 'error')},
+        } for event in self.events], 'displayTimeUnit': 'ms'}
+        if filename is not None:
+            with open(filename, 'w') as f:
+                json.dump(trace, f)
+        return trace
+
+
+def current() -> Tracer:
+    """
+    Gets the active tracer.
+    :return: tracer or None.
+    """
+    return _current.get()
+
+
+def traced(func):
+    """
+    Decorator recording calls of a stage function in the active tracer (see Tracer).
+    The number of input rows is taken from the first positional argument with rows (see rows).
+    :param func: function, method or static method (below the staticmethod decorator).
+    :return: wrapped function.
+    """
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tracer = _current.get()
+        if tracer is None:
+            owner = getattr(args[0], '__dict__', None) if args else None
+            tracer = owner.get('tracer') if isinstance(owner, dict) else None
+            if not isinstance(tracer, Tracer):
+                return func(*args, **kwargs)
+            with tracer:
+                return call(tracer, name, func, args, kwargs)
+        return call(tracer, name, func, args, kwargs)
+
+    return wrapper
+
+
+def call(tracer: Tracer, name: str, func, args: tuple, kwargs: dict):
+    """
+    Calls a stage function inside a span.
+    :param tracer: tracer recording the span.
+    :param name: stage name.
+    :param func: function.
+    :param args: positional arguments.
+    :param kwargs: keyword arguments.
+    :return: result of the function.
+    """
+    rows_in = next((n for n in map(rows, args) if n is not None), None)
+    with tracer.span(name, rows_in) as span:
+        result = func(*args, **kwargs)
+        span.rows_out = rows(result)
+    return result
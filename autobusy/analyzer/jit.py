@@ -0,0 +1,265 @@
+import numpy as np
+import math
+import warnings
+import autobusy.analyzer.linref as linref
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ('numpy', 'numba')
+
+# loop implementations are compiled if Numba is installed and run by the interpreter otherwise
+_jit = numba.njit(cache=True) if numba is not None else (lambda func: func)
+
+
+@_jit
+def _inversions_loop(positions: np.ndarray) -> int:
+    """
+    Counts pairs i < j with positions[i] > positions[j].
+    :param positions: array of integers.
+    :return: number of inversions.
+    """
+    count = 0
+    for i in range(positions.shape[0]):
+        for j in range(i + 1, positions.shape[0]):
+            if positions[i] > positions[j]:
+                count += 1
+    return count
+
+
+def _inversions_numpy(positions: np.ndarray) -> int:
+    """
+    Counts pairs i < j with positions[i] > positions[j].
+    :param positions: array of integers.
+    :return: number of inversions.
+    """
+    return int(np.count_nonzero(np.triu(positions[:, None] > positions[None, :], 1)))
+
+
+@_jit
+def _project_loop(px: np.ndarray, py: np.ndarray, x: np.ndarray, y: np.ndarray, dx: np.ndarray, dy: np.ndarray,
+                  length2: np.ndarray, cumulative: np.ndarray, position: np.ndarray, offset: np.ndarray):
+    """
+    Projects points onto a polyline, one point at a time (see linref.RouteGeometry.project).
+    :param px: x coordinates of the points.
+    :param py: y coordinates of the points.
+    :param x: x coordinates of the vertices of the polyline.
+    :param y: y coordinates of the vertices of the polyline.
+    :param dx: x extents of the segments.
+    :param dy: y extents of the segments.
+    :param length2: squared lengths of the segments.
+    :param cumulative: positions of the vertices along the polyline.
+    :param position: output array of positions along the polyline.
+    :param offset: output array of distances from the polyline.
+    :return: None
+    """
+    for k in range(px.shape[0]):
+        best = np.inf
+        best_segment = -1
+        best_t = 0.0
+        for s in range(dx.shape[0]):
+            cx = px[k] - x[s]
+            cy = py[k] - y[s]
+            t = (cx * dx[s] + cy * dy[s]) / (length2[s] if length2[s] > 0 else 1.0)
+            t = min(max(t, 0.0), 1.0)
+            dist2 = (cx - t * dx[s]) ** 2 + (cy - t * dy[s]) ** 2
+            if dist2 < best:
+                best = dist2
+                best_segment = s
+                best_t = t
+        if best_segment < 0:
+            position[k] = np.nan
+            offset[k] = np.nan
+        else:
+            position[k] = cumulative[best_segment] + best_t * math.sqrt(length2[best_segment])
+            offset[k] = math.sqrt(best)
+
+
+@_jit
+def _fill_zeros_loop(group_start: np.ndarray, values: np.ndarray):
+    """
+    Replaces zeros in place, like linref.fill_zeros.
+    :param group_start: boolean array marking the first element of each group.
+    :param values: array of values, grouped.
+    :return: None
+    """
+    n = values.shape[0]
+    last = 0.0
+    for i in range(n):
+        if group_start[i]:
+            last = 0.0
+        if values[i] != 0:
+            last = values[i]
+        else:
+            values[i] = last
+    following = 0.0
+    for i in range(n - 1, -1, -1):
+        if i == n - 1 or group_start[i + 1]:
+            following = 0.0
+        if values[i] != 0:
+            following = values[i]
+        else:
+            values[i] = following
+
+
+@_jit
+def _runs_loop(group_start: np.ndarray, sign: np.ndarray, step: np.ndarray, run: np.ndarray) -> np.ndarray:
+    """
+    Numbers the runs of equal signs within groups and sums the steps of each run.
+    :param group_start: boolean array marking the first element of each group.
+    :param sign: array of signs.
+    :param step: array of steps.
+    :param run: output array of run ids.
+    :return: array of displacements of the runs.
+    """
+    current = -1
+    for i in range(sign.shape[0]):
+        if group_start[i] or sign[i] != sign[i - 1]:
+            current += 1
+        run[i] = current
+    displacement = np.zeros(current + 1)
+    for i in range(sign.shape[0]):
+        displacement[run[i]] += step[i]
+    return displacement
+
+
+@_jit
+def _segment_trips_loop(group: np.ndarray, position: np.ndarray, jitter: float, tolerance: float,
+                        min_length: float, run: np.ndarray, direction: np.ndarray):
+    """
+    Splits pings of vehicles into trips in a single sequential pass per stage (see linref.segment_trips).
+    :param group: vehicle keys of the pings, as integers.
+    :param position: positions of the pings along the route in km.
+    :param jitter: movement in km below which a vehicle is considered standing still.
+    :param tolerance: minimal displacement in km of a run in the opposite direction to be considered a new trip.
+    :param min_length: minimal displacement in km of a trip, shorter trips get unknown direction.
+    :param run: output array of trip ids.
+    :param direction: output array of directions.
+    :return: None
+    """
+    n = position.shape[0]
+    group_start = np.empty(n, dtype=np.bool_)
+    step = np.zeros(n)
+    sign = np.zeros(n)
+    for i in range(n):
+        group_start[i] = i == 0 or group[i] != group[i - 1]
+    for i in range(n - 1):
+        if group[i + 1] == group[i]:
+            step[i] = position[i + 1] - position[i]
+        if abs(step[i]) >= jitter and step[i] != 0:
+            sign[i] = 1.0 if step[i] > 0 else -1.0
+    for _ in range(2):
+        _fill_zeros_loop(group_start, sign)
+        displacement = _runs_loop(group_start, sign, step, run)
+        for i in range(n):
+            if abs(displacement[run[i]]) < tolerance:
+                sign[i] = 0.0
+    _fill_zeros_loop(group_start, sign)
+    displacement = _runs_loop(group_start, sign, step, run)
+    for i in range(n):
+        if abs(displacement[run[i]]) < min_length or sign[i] == 0:
+            direction[i] = -1
+        else:
+            direction[i] = 0 if sign[i] > 0 else 1
+
+
+class Backend:
+    """
+    Class for running the hot loops of the analyzer: inversion counting, projection of pings onto routes
+    and trip segmentation. The numpy backend uses vectorised implementations,
+    the numba backend compiles loop implementations with Numba (an optional dependency).
+    Both backends give the same results.
+    """
+
+    def __init__(self, name: str = 'numpy', require_numba: bool = True):
+        """
+        Constructor for the Backend class. Use get_backend to get a shared instance.
+        :param name: backend name, one of BACKENDS.
+        :param require_numba: whether the numba backend requires Numba, if not, the loop implementations
+                              are run by the interpreter when Numba is not installed (slow, meant for testing).
+        """
+        if name not in BACKENDS:
+            raise ValueError(f'Unknown backend: {name}')
+        if name == 'numba' and numba is None and require_numba:
+            raise ImportError('Numba is not installed')
+        self.name = name
+        self.loops = name == 'numba'
+
+    def inversions(self, positions) -> int:
+        """
+        Counts pairs i < j with positions[i] > positions[j].
+        :param positions: sequence of integers.
+        :return: number of inversions.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.loops:
+            return int(_inversions_loop(positions))
+        return _inversions_numpy(positions)
+
+    def project(self, geometry: linref.RouteGeometry, lon, lat) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Projects points onto a route (see linref.RouteGeometry.project).
+        :param geometry: route geometry.
+        :param lon: longitudes of the points.
+        :param lat: latitudes of the points.
+        :return: tuple of positions along the route and distances of the points from the route.
+        """
+        if not self.loops or geometry.dx.shape[0] == 0:
+            return geometry.project(lon, lat)
+        px, py = geometry.to_plane(lon, lat)
+        position = np.empty(px.shape[0])
+        offset = np.empty(px.shape[0])
+        _project_loop(px, py, geometry.x, geometry.y, geometry.dx, geometry.dy, geometry.length2,
+                      geometry.cumulative, position, offset)
+        return position, offset
+
+    def segment_trips(self, group, position, jitter: float = 0.02, tolerance: float = 0.2,
+                      min_length: float = 0.5) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Splits pings of vehicles into trips (see linref.segment_trips).
+        :param group: vehicle keys of the pings, sorted so that pings of a vehicle are adjacent and ordered by time.
+        :param position: positions of the pings along the route in km.
+        :param jitter: movement in km below which a vehicle is considered standing still.
+        :param tolerance: minimal displacement in km of a run in the opposite direction to be considered a new trip.
+        :param min_length: minimal displacement in km of a trip, shorter trips get unknown direction.
+        :return: tuple of trip ids and directions.
+        """
+        group = np.asarray(group)
+        position = np.asarray(position, dtype=np.float64)
+        if not self.loops:
+            return linref.segment_trips(group, position, jitter, tolerance, min_length)
+        run = np.zeros(position.shape[0], dtype=np.int64)
+        direction = np.zeros(position.shape[0], dtype=np.int64)
+        _segment_trips_loop(np.unique(group, return_inverse=True)[1].astype(np.int64), position,
+                            jitter, tolerance, min_length, run, direction)
+        return run, direction
+
+
+_backends = {}
+
+
+def available_backends() -> list[str]:
+    """
+    Gets the names of the backends that can be used.
+    :return: list of backend names.
+    """
+    return [name for name in BACKENDS if name != 'numba' or numba is not None]
+
+
+def get_backend(name: str = 'auto') -> Backend:
+    """
+    Gets a shared backend instance. The numba backend is used by 'auto' if Numba is installed.
+    If the numba backend is requested but Numba is not installed, the numpy backend is used with a warning.
+    :param name: backend name, one of BACKENDS or 'auto'.
+    :return: backend.
+    """
+    if name == 'auto':
+        name = 'numba' if numba is not None else 'numpy'
+    elif name == 'numba' and numba is None:
+        warnings.warn('Numba is not installed, using the numpy backend', RuntimeWarning)
+        name = 'numpy'
+    if name not in _backends:
+        _backends[name] = Backend(name)
+    return _backends[name]
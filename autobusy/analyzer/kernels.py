@@ -0,0 +1,167 @@
+import numpy as np
+
+EARTH_RADIUS = 6373.0  # km
+
+
+def _prepare(dtype, *arrays) -> list[np.ndarray]:
+    """
+    Converts coordinates to arrays of a given dtype.
+    :param dtype: floating point dtype.
+    :param arrays: coordinates (scalars, lists, arrays or series).
+    :return: list of arrays.
+    """
+    return [np.asarray(x, dtype=dtype) for x in arrays]
+
+
+def _output(out: np.ndarray, shape: tuple, dtype) -> np.ndarray:
+    """
+    Gets the output array of a kernel.
+    :param out: preallocated output array or None.
+    :param shape: shape of the output.
+    :param dtype: dtype of the output.
+    :return: out if given, a new array otherwise.
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape:
+        raise ValueError(f'Output has shape {out.shape}, expected {shape}')
+    return out
+
+
+def haversine(lon1, lat1, lon2, lat2, out: np.ndarray = None, dtype=np.float64):
+    """
+    Calculates great-circle distances between points, element by element (with broadcasting).
+    Like all kernels of this module it takes coordinates in degrees, returns distances in km
+    and computes in float64 by default or in float32 if dtype=np.float32 is given (the error of float32
+    distances in Warsaw is below 1 m, coordinates themselves are stored in float32 with 0.2 m precision).
+    :param lon1: longitudes of the first points.
+    :param lat1: latitudes of the first points.
+    :param lon2: longitudes of the second points.
+    :param lat2: latitudes of the second points.
+    :param out: preallocated output array.
+    :param dtype: dtype of the computation.
+    :return: array of distances in km (a scalar for scalar inputs without out).
+    """
+    lon1, lat1, lon2, lat2 = _prepare(dtype, lon1, lat1, lon2, lat2)
+    lon1, lat1, lon2, lat2 = np.radians(lon1), np.radians(lat1), np.radians(lon2), np.radians(lat2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    if out is None:
+        return c * EARTH_RADIUS
+    return np.multiply(c, EARTH_RADIUS, out=out)
+
+
+def equirectangular(lon1, lat1, lon2, lat2, out: np.ndarray = None, dtype=np.float64):
+    """
+    Calculates approximate distances between points, element by element (with broadcasting),
+    projecting them onto a plane at their mean latitude, which avoids most of the trigonometry of haversine.
+    For distances up to 50 km around the latitude of Warsaw the relative error is below 1e-5
+    (0.5 m at 50 km, 2 mm at 1 km).
+    :param lon1: longitudes of the first points.
+    :param lat1: latitudes of the first points.
+    :param lon2: longitudes of the second points.
+    :param lat2: latitudes of the second points.
+    :param out: preallocated output array.
+    :param dtype: dtype of the computation.
+    :return: array of distances in km (a scalar for scalar inputs without out).
+    """
+    lon1, lat1, lon2, lat2 = _prepare(dtype, lon1, lat1, lon2, lat2)
+    x = np.radians(lon2 - lon1) * np.cos(np.radians((lat1 + lat2) / 2))
+    y = np.radians(lat2 - lat1)
+    if out is None:
+        return np.hypot(x, y) * EARTH_RADIUS
+    return np.multiply(np.hypot(x, y), EARTH_RADIUS, out=out)
+
+
+def pair_distances(lon, lat, group_start: np.ndarray = None, out: np.ndarray = None, dtype=np.float64,
+                   approximate: bool = False) -> np.ndarray:
+    """
+    Calculates distances between consecutive points of a flat array of groups (e.g. pings of vehicles).
+    :param lon: longitudes of the points.
+    :param lat: latitudes of the points.
+    :param group_start: boolean array marking the first point of each group, the whole array is one group if None.
+    :param out: preallocated output array of the same length as the points.
+    :param dtype: dtype of the computation.
+    :param approximate: whether to use the equirectangular approximation.
+    :return: array of distances from the previous point of the same group, NaN for the first points of groups.
+    """
+    lon, lat = _prepare(dtype, lon, lat)
+    out = _output(out, lon.shape, dtype)
+    if lon.shape[0] == 0:
+        return out
+    out[0] = np.nan
+    kernel = equirectangular if approximate else haversine
+    kernel(lon[:-1], lat[:-1], lon[1:], lat[1:], out=out[1:], dtype=dtype)
+    if group_start is not None:
+        out[np.asarray(group_start, dtype=bool)] = np.nan
+    return out
+
+
+def point_to_many(lon: float, lat: float, lons, lats, out: np.ndarray = None, dtype=np.float64,
+                  approximate: bool = False) -> np.ndarray:
+    """
+    Calculates distances from a point to many points.
+    :param lon: longitude of the point.
+    :param lat: latitude of the point.
+    :param lons: longitudes of the other points.
+    :param lats: latitudes of the other points.
+    :param out: preallocated output array of the same length as the other points.
+    :param dtype: dtype of the computation.
+    :param approximate: whether to use the equirectangular approximation.
+    :return: array of distances.
+    """
+    lons, lats = _prepare(dtype, lons, lats)
+    out = _output(out, lons.shape, dtype)
+    kernel = equirectangular if approximate else haversine
+    return kernel(lon, lat, lons, lats, out=out, dtype=dtype)
+
+
+def many_to_many(lon1, lat1, lon2, lat2, out: np.ndarray = None, dtype=np.float64, approximate: bool = False,
+                 chunk_size: int = 4096) -> np.ndarray:
+    """
+    Calculates the matrix of distances between two sets of points. Rows are computed in chunks,
+    so temporary arrays take memory proportional to chunk_size times the number of the second points.
+    :param lon1: longitudes of the first points (rows).
+    :param lat1: latitudes of the first points.
+    :param lon2: longitudes of the second points (columns).
+    :param lat2: latitudes of the second points.
+    :param out: preallocated output array of shape (number of first points, number of second points).
+    :param dtype: dtype of the computation.
+    :param approximate: whether to use the equirectangular approximation.
+    :param chunk_size: number of rows computed at once.
+    :return: matrix of distances.
+    """
+    lon1, lat1, lon2, lat2 = _prepare(dtype, lon1, lat1, lon2, lat2)
+    out = _output(out, (lon1.shape[0], lon2.shape[0]), dtype)
+    kernel = equirectangular if approximate else haversine
+    for start in range(0, lon1.shape[0], chunk_size):
+        stop = start + chunk_size
+        kernel(lon1[start:stop, None], lat1[start:stop, None], lon2[None, :], lat2[None, :],
+               out=out[start:stop], dtype=dtype)
+    return out
+
+
+def nearest(lon1, lat1, lon2, lat2, dtype=np.float64, approximate: bool = False,
+            chunk_size: int = 4096) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the nearest second point for each first point, without materializing the whole distance matrix.
+    :param lon1: longitudes of the first points.
+    :param lat1: latitudes of the first points.
+    :param lon2: longitudes of the second points, at least one.
+    :param lat2: latitudes of the second points.
+    :param dtype: dtype of the computation.
+    :param approximate: whether to use the equirectangular approximation.
+    :param chunk_size: number of first points processed at once.
+    :return: tuple of indexes of the nearest second points and distances to them.
+    """
+    lon1, lat1, lon2, lat2 = _prepare(dtype, lon1, lat1, lon2, lat2)
+    index = np.empty(lon1.shape[0], dtype=np.int64)
+    distance = np.empty(lon1.shape[0], dtype=dtype)
+    buffer = np.empty((min(chunk_size, lon1.shape[0]), lon2.shape[0]), dtype=dtype)
+    for start in range(0, lon1.shape[0], chunk_size):
+        stop = min(start + chunk_size, lon1.shape[0])
+        block = many_to_many(lon1[start:stop], lat1[start:stop], lon2, lat2, out=buffer[:stop - start],
+                             dtype=dtype, approximate=approximate, chunk_size=chunk_size)
+        index[start:stop] = np.argmin(block, axis=1)
+        distance[start:stop] = block[np.arange(stop - start), index[start:stop]]
+    return index, distance
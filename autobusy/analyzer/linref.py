@@ -0,0 +1,193 @@
+import numpy as np
+from autobusy.analyzer.kernels import EARTH_RADIUS
+
+
+class RouteGeometry:
+    """
+    Class for linear referencing along a route, i.e. a polyline through the stops of the route.
+    Coordinates are projected onto a local plane (equirectangular projection around the route),
+    which is accurate to well below a meter at the scale of a city.
+    """
+
+    def __init__(self, lon: np.ndarray, lat: np.ndarray):
+        """
+        Constructor for the RouteGeometry class. Precomputes segments and cumulative distances.
+        :param lon: longitudes of the stops of the route, in order.
+        :param lat: latitudes of the stops of the route, in order.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        self.lon0 = lon.mean()
+        self.lat0 = lat.mean()
+        self.x, self.y = self.to_plane(lon, lat)
+        self.dx = np.diff(self.x)
+        self.dy = np.diff(self.y)
+        self.length2 = self.dx ** 2 + self.dy ** 2
+        self.cumulative = np.r_[0, np.cumsum(np.sqrt(self.length2))]
+
+    def to_plane(self, lon, lat) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Projects coordinates onto the local plane of the route.
+        :param lon: longitudes.
+        :param lat: latitudes.
+        :return: tuple of x and y coordinates in km.
+        """
+        x = np.radians(np.asarray(lon, dtype=np.float64) - self.lon0) * np.cos(np.radians(self.lat0)) * EARTH_RADIUS
+        y = np.radians(np.asarray(lat, dtype=np.float64) - self.lat0) * EARTH_RADIUS
+        return x, y
+
+    def project(self, lon, lat, chunk_size: int = 4096) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Projects points onto the route. Points are processed in chunks, so memory use is bounded
+        by chunk_size times the number of segments.
+        :param lon: longitudes of the points.
+        :param lat: latitudes of the points.
+        :param chunk_size: number of points projected at once.
+        :return: tuple of positions along the route (km from the first stop)
+                 and distances of the points from the route (km).
+        """
+        px, py = self.to_plane(lon, lat)
+        position = np.empty(px.shape[0])
+        offset = np.empty(px.shape[0])
+        if self.dx.shape[0] == 0:
+            position[:] = 0
+            offset[:] = np.hypot(px - self.x[0], py - self.y[0])
+            return position, offset
+        length2 = np.where(self.length2 > 0, self.length2, 1)
+        for start in range(0, px.shape[0], chunk_size):
+            cx = px[start:start + chunk_size, None] - self.x[None, :-1]
+            cy = py[start:start + chunk_size, None] - self.y[None, :-1]
+            t = np.clip((cx * self.dx + cy * self.dy) / length2, 0, 1)
+            dist2 = (cx - t * self.dx) ** 2 + (cy - t * self.dy) ** 2
+            segment = np.argmin(dist2, axis=1)
+            rows = np.arange(segment.shape[0])
+            position[start:start + chunk_size] = (self.cumulative[segment] +
+                                                  t[rows, segment] * np.sqrt(self.length2[segment]))
+            offset[start:start + chunk_size] = np.sqrt(dist2[rows, segment])
+        return position, offset
+
+    def project_point(self, lon: float, lat: float, segment: int = None,
+                      window: int = 2) -> tuple[float, float, int]:
+        """
+        Projects a single point onto the route. If the segment of a previous projection is given,
+        only the segments within the window around it are searched, so the cost does not depend on the route length.
+        :param lon: longitude of the point.
+        :param lat: latitude of the point.
+        :param segment: index of the segment of a previous projection.
+        :param window: number of segments searched on each side of the previous segment.
+        :return: tuple of position along the route, distance from the route and index of the segment.
+        """
+        px, py = self.to_plane(lon, lat)
+        if self.dx.shape[0] == 0:
+            return 0.0, float(np.hypot(px - self.x[0], py - self.y[0])), 0
+        first, last = 0, self.dx.shape[0]
+        if segment is not None:
+            first, last = max(segment - window, 0), min(segment + window + 1, self.dx.shape[0])
+        cx = px - self.x[first:last]
+        cy = py - self.y[first:last]
+        dx, dy, length2 = self.dx[first:last], self.dy[first:last], self.length2[first:last]
+        t = np.clip((cx * dx + cy * dy) / np.where(length2 > 0, length2, 1), 0, 1)
+        dist2 = (cx - t * dx) ** 2 + (cy - t * dy) ** 2
+        best = int(np.argmin(dist2))
+        position = self.cumulative[first + best] + t[best] * np.sqrt(length2[best])
+        return float(position), float(np.sqrt(dist2[best])), first + best
+
+    def closest_stops(self, position: np.ndarray) -> np.ndarray:
+        """
+        Gets the indexes of the stops closest along the route to given positions.
+        :param position: positions along the route.
+        :return: array of stop indexes.
+        """
+        if self.cumulative.shape[0] == 1:
+            return np.zeros(np.shape(position), dtype=np.int64)
+        right = np.clip(np.searchsorted(self.cumulative, position), 1, self.cumulative.shape[0] - 1)
+        left = right - 1
+        return np.where(position - self.cumulative[left] <= self.cumulative[right] - position, left, right)
+
+
+def passage_times(position: np.ndarray, time: np.ndarray, stop_position: np.ndarray,
+                  forward: bool = True, tolerance: float = 0) -> np.ndarray:
+    """
+    Interpolates the times at which a vehicle passed given positions along the route.
+    Positions of the vehicle are made monotone first, so that small backward jumps caused by GPS noise are ignored.
+    If the vehicle stayed at a position for several pings, the time of the last of them (the departure) is used.
+    :param position: positions of the vehicle along the route, sorted by time.
+    :param time: times of the pings as numbers (e.g. nanoseconds).
+    :param stop_position: positions to be passed.
+    :param forward: whether the vehicle moves in the direction of increasing positions.
+    :param tolerance: positions at most this far outside the part of the route covered by the pings
+                      get the time of the first or last ping.
+    :return: array of interpolated times, NaN for positions outside the part of the route covered by the pings.
+    """
+    position = np.asarray(position, dtype=np.float64)
+    stop_position = np.asarray(stop_position, dtype=np.float64)
+    time = np.asarray(time, dtype=np.float64)
+    if position.shape[0] < 2:
+        return np.full(stop_position.shape[0], np.nan)
+    if not forward:
+        position = -position
+        stop_position = -stop_position
+    position = np.maximum.accumulate(position)
+    right = np.clip(np.searchsorted(position, stop_position, side='right'), 1, position.shape[0] - 1)
+    left = right - 1
+    span = position[right] - position[left]
+    weight = np.clip(np.where(span > 0, (stop_position - position[left]) / np.where(span > 0, span, 1), 1), 0, 1)
+    result = time[left] + weight * (time[right] - time[left])
+    result[(stop_position < position[0] - tolerance) | (stop_position > position[-1] + tolerance)] = np.nan
+    return result
+
+
+def fill_zeros(group_start: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Replaces zeros with the closest preceding non-zero value of the same group,
+    or the closest following one if there is no preceding one.
+    :param group_start: boolean array marking the first element of each group.
+    :param values: array of values, grouped.
+    :return: array with zeros filled (zeros remain only in groups with no non-zero values).
+    """
+    n = values.shape[0]
+    index = np.arange(n)
+    forward = np.maximum.accumulate(np.where((values != 0) | group_start, index, 0))
+    values = values[forward]
+    group_end = np.r_[group_start[1:], True]
+    backward = np.minimum.accumulate(np.where((values != 0) | group_end, index, n - 1)[::-1])[::-1]
+    return values[backward]
+
+
+def segment_trips(group: np.ndarray, position: np.ndarray, jitter: float = 0.02, tolerance: float = 0.2,
+                  min_length: float = 0.5) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits pings of vehicles into trips, i.e. monotone runs of positions along the route, all vehicles at once.
+    Each ping gets the direction of its movement towards the next ping of the vehicle, so a ping at a turnaround
+    (or at the end of a dwell) starts the next trip. Steps shorter than jitter are treated as standing still,
+    and runs shorter than tolerance in the opposite direction are treated as GPS noise and merged
+    with the surrounding trip.
+    :param group: vehicle keys of the pings, sorted so that pings of a vehicle are adjacent and ordered by time.
+    :param position: positions of the pings along the route in km.
+    :param jitter: movement in km below which a vehicle is considered standing still.
+    :param tolerance: minimal displacement in km of a run in the opposite direction to be considered a new trip.
+    :param min_length: minimal displacement in km of a trip, shorter trips get unknown direction.
+    :return: tuple of trip ids (increasing, unique across vehicles) and directions
+             (0 for increasing positions, 1 for decreasing, -1 for unknown).
+    """
+    if position.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    group_start = np.r_[True, group[1:] != group[:-1]]
+    step = np.r_[np.diff(position), 0]
+    step[np.r_[group_start[1:], True]] = 0
+    sign = np.where(np.abs(step) < jitter, 0, np.sign(step))
+
+    for _ in range(2):
+        sign = fill_zeros(group_start, sign)
+        run_start = group_start | np.r_[True, sign[1:] != sign[:-1]]
+        run = np.cumsum(run_start) - 1
+        displacement = np.bincount(run, weights=step)
+        sign = np.where((np.abs(displacement) < tolerance)[run], 0, sign)
+
+    sign = fill_zeros(group_start, sign)
+    run_start = group_start | np.r_[True, sign[1:] != sign[:-1]]
+    run = np.cumsum(run_start) - 1
+    displacement = np.bincount(run, weights=step)
+    direction = np.where(sign > 0, 0, np.where(sign < 0, 1, -1))
+    direction[(np.abs(displacement) < min_length)[run]] = -1
+    return run, direction
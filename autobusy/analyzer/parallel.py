@@ -0,0 +1,152 @@
+import pandas as pd
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+# description of the frame shared with the current worker process, set once by the pool initializer
+_worker_spec = None
+
+
+def init_worker(spec: tuple[int, list[tuple]]):
+    """
+    Keeps the description of a shared frame in a worker process, so that tasks only carry row ranges.
+    :param spec: description of the shared columns, as returned by SharedFrame.spec().
+    :return: None
+    """
+    global _worker_spec
+    _worker_spec = spec
+
+
+class SharedFrame:
+    """
+    Class for passing dataframe columns to worker processes through shared memory.
+    Numeric and datetime columns are copied into shared memory blocks as they are,
+    other columns are factorized and only their integer codes are shared (missing values are shared as -1
+    and recreated as None). The description of the columns, including the distinct values of factorized ones,
+    is sent to the workers of executor() once, when they start.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Constructor for the SharedFrame class. Copies the columns of the dataframe into shared memory.
+        :param df: dataframe to be shared.
+        """
+        self.length = df.shape[0]
+        self.blocks = []
+        self.columns = []
+        try:
+            for column in df.columns:
+                values = df[column].to_numpy()
+                uniques = None
+                if values.dtype.kind not in 'biufcmM':
+                    values, uniques = pd.factorize(df[column])
+                    uniques = list(uniques)
+                block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                self.blocks.append(block)
+                np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+                self.columns.append((column, block.name, values.dtype.str, uniques))
+        except BaseException:
+            # blocks created before the failure would otherwise outlive the process
+            self.close()
+            raise
+
+    def spec(self) -> tuple[int, list[tuple]]:
+        """
+        Gets a picklable description of the shared columns.
+        :return: tuple of number of rows and list of (column name, block name, dtype, uniques).
+        """
+        return self.length, self.columns
+
+    def executor(self, workers: int) -> ProcessPoolExecutor:
+        """
+        Creates a pool of worker processes which can read the frame with worker_slice.
+        :param workers: number of worker processes.
+        :return: process pool executor.
+        """
+        return ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(self.spec(),))
+
+    def close(self):
+        """
+        Releases and removes the shared memory blocks.
+        :return: None
+        """
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def attach(spec: tuple[int, list[tuple]], start: int = 0, stop: int = None) -> pd.DataFrame:
+        """
+        Recreates a slice of a shared dataframe. The rows are copied out of shared memory,
+        so the result stays valid after the blocks are released.
+        :param spec: description of the shared columns, as returned by spec().
+        :param start: first row of the slice.
+        :param stop: row after the last row of the slice (defaults to the end of the frame).
+        :return: dataframe with rows [start, stop).
+        """
+        length, columns = spec
+        stop = length if stop is None else stop
+        data = {}
+        for column, name, dtype, uniques in columns:
+            block = shared_memory.SharedMemory(name=name)
+            try:
+                values = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)[start:stop].copy()
+            finally:
+                block.close()
+            if uniques is not None:
+                # code -1 of missing values indexes the appended None
+                values = np.append(np.asarray(uniques, dtype=object), None)[values]
+            data[column] = values
+        return pd.DataFrame(data)
+
+    @staticmethod
+    def worker_slice(start: int = 0, stop: int = None) -> pd.DataFrame:
+        """
+        Recreates a slice of the frame shared with the current worker process of executor() (see attach).
+        :param start: first row of the slice.
+        :param stop: row after the last row of the slice (defaults to the end of the frame).
+        :return: dataframe with rows [start, stop).
+        """
+        if _worker_spec is None:
+            raise RuntimeError('No frame is shared with this process')
+        return SharedFrame.attach(_worker_spec, start, stop)
+
+
+def shard_bounds(keys: pd.Series) -> dict:
+    """
+    Gets the row ranges of consecutive equal keys.
+    :param keys: series of keys, sorted so that equal keys are adjacent.
+    :return: dictionary of key -> (start, stop).
+    """
+    values = keys.to_numpy()
+    if values.shape[0] == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    stops = np.r_[starts[1:], values.shape[0]]
+    return {values[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+
+def balanced_bounds(keys: pd.Series, shards: int) -> list[tuple[int, int]]:
+    """
+    Splits rows into ranges of about equal size without splitting runs of equal keys.
+    :param keys: series of keys, sorted so that equal keys are adjacent.
+    :param shards: maximal number of ranges.
+    :return: list of (start, stop), covering all rows in order.
+    """
+    values = keys.to_numpy()
+    length = values.shape[0]
+    if length == 0:
+        return []
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    targets = np.arange(1, shards) * length / shards
+    cut_index = np.searchsorted(starts, targets)
+    cuts = np.unique(starts[cut_index[cut_index < starts.shape[0]]])
+    cuts = cuts[cuts > 0].tolist()
+    return list(zip([0] + cuts, cuts + [length]))
@@ -1,11 +1,14 @@
 import pandas as pd
 import json
+import autobusy.analyzer.instrumentation as instrumentation
+from autobusy.downloader.storage import SQLiteStorage, COLUMNS, is_sqlite
 
 
 class TimetableParser:
     """
     Class for parsing timetable files.
     """
+    @instrumentation.traced
     def __init__(self, filename: str):
         """
         Constructor for TimetableParser.
@@ -60,6 +63,7 @@ class TimetableParser:
                 res[curr_stop].append(str(int(hour_split[0]) % 24) + ':' + hour_split[1])
         return res
 
+    @instrumentation.traced
     def parse_stop_info(self) -> pd.DataFrame:
         """
         Parses the stop information from the file.
@@ -86,6 +90,7 @@ class TimetableParser:
         stop_info_df['Lon'] = pd.to_numeric(stop_info_df['Lon'], errors='coerce')
         return stop_info_df
 
+    @instrumentation.traced
     def parse_line_info(self) -> tuple[dict[str, list[list[str]]], dict[str, dict[str, list[str]]]]:
         """
         Parses the line information from the file.
@@ -114,6 +119,7 @@ class TimetableParser:
 
         return line_route_info, line_timetable_info
 
+    @instrumentation.traced
     def parse(self) -> tuple[pd.DataFrame, dict[str, list[list[str]]], dict[str, dict[str, list[str]]]]:
         """
         Parses the file.
@@ -127,24 +133,133 @@ class TimetableParser:
 
 class LiveParser:
     """
-    Class for parsing live data json files.
+    Class for parsing live data json files and SQLite databases written by RequestHandler.
     """
+    @instrumentation.traced
     def __init__(self, filename: str):
         """
-        Constructor for LiveParser.
+        Constructor for LiveParser. JSON files are loaded, SQLite databases (see SQLiteStorage) are only opened.
         :param filename: path to the file to be parsed.
         """
-        with open(filename, 'r') as f:
-            self.results = json.load(f)
+        self.filename = filename
+        self.results = None
+        self.storage = None
+        if is_sqlite(filename):
+            self.storage = SQLiteStorage(filename, read_only=True)
+        else:
+            with open(filename, 'r') as f:
+                self.results = json.load(f)
 
+    @instrumentation.traced
     def parse(self) -> pd.DataFrame:
         """
         Parses the file.
         :return: DataFrame with parsed data: Line, VehicleNumber, Brigade, Lon, Lat, RequestTime.
         """
-        base_df = pd.concat([pd.DataFrame(x['result']) for x in self.results], ignore_index=True)
+        if self.storage is not None:
+            return self.query()
+        return self.to_frame(self.results)
+
+    @instrumentation.traced
+    def query(self, vehicle: str = None, line: str = None, start=None, end=None) -> pd.DataFrame:
+        """
+        Gets the records of a vehicle or a line in a time range. In SQLite databases only the matching rows
+        are read, using the indexes on (VehicleNumber, Time) and (Lines, Time).
+        :param vehicle: vehicle number, all vehicles if not given.
+        :param line: line number, all lines if not given.
+        :param start: minimum time of the records (inclusive), datetime or string like '2024-01-29 07:00:00'.
+        :param end: maximum time of the records (exclusive), datetime or string like '2024-01-29 08:00:00'.
+        :return: DataFrame in the format returned by parse, with the matching records.
+        """
+        if self.storage is None:
+            live_bus_df = self.to_frame(self.results)
+            mask = pd.Series(True, index=live_bus_df.index)
+            if vehicle is not None:
+                mask &= live_bus_df['VehicleNumber'] == vehicle
+            if line is not None:
+                mask &= live_bus_df['Lines'] == line
+            if start is not None:
+                mask &= live_bus_df['Time'] >= pd.Timestamp(start)
+            if end is not None:
+                mask &= live_bus_df['Time'] < pd.Timestamp(end)
+            return live_bus_df[mask].reset_index(drop=True)
+        live_bus_df = pd.DataFrame.from_records(self.storage.query(vehicle, line, start, end), columns=COLUMNS)
+        live_bus_df = live_bus_df.astype({'Lon': float, 'Lat': float})
+        live_bus_df['Time'] = pd.to_datetime(live_bus_df['Time'])
+        live_bus_df['RequestTime'] = pd.to_datetime(live_bus_df['RequestTime'])
+        return live_bus_df
+
+    @staticmethod
+    @instrumentation.traced
+    def to_frame(results: list[dict]) -> pd.DataFrame:
+        """
+        Converts responses of the live data API to a dataframe.
+        :param results: list of dicts with request time and result field of the response.
+        :return: DataFrame with parsed data: Line, VehicleNumber, Brigade, Lon, Lat, RequestTime.
+        """
+        base_df = pd.concat([pd.DataFrame(x['result']) for x in results], ignore_index=True)
         base_df['Time'] = pd.to_datetime(base_df['Time'])
-        request_time_df = pd.DataFrame([x['request_time'] for x in self.results for _ in range(len(x['result']))],
+        request_time_df = pd.DataFrame([x['request_time'] for x in results for _ in range(len(x['result']))],
                                        columns=['RequestTime'])
         request_time_df['RequestTime'] = pd.to_datetime(request_time_df['RequestTime'])
         return pd.concat([base_df, request_time_df], axis=1)
+
+    @staticmethod
+    def iter_snapshots(filename: str, block_size: int = 2 ** 20):
+        """
+        Reads the responses from a live data json file or SQLite database one by one, without loading the whole
+        file into memory. Responses in SQLite databases are read in the order in which they were saved and only
+        those with vehicles are stored.
+        :param filename: path to the file to be parsed.
+        :param block_size: number of characters read from a json file or rows read from a database at once.
+        :return: generator of dicts with request time and result field of the response.
+        """
+        if is_sqlite(filename):
+            with SQLiteStorage(filename, read_only=True) as storage:
+                yield from storage.iter_requests(block_size)
+            return
+        decoder = json.JSONDecoder()
+        with open(filename, 'r') as f:
+            buffer = ''
+            position = 0
+            eof = False
+            while True:
+                while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+                    position += 1
+                if position < len(buffer):
+                    try:
+                        snapshot, position = decoder.raw_decode(buffer, position)
+                        yield snapshot
+                        continue
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                if eof:
+                    return
+                block = f.read(block_size)
+                eof = not block
+                buffer = buffer[position:] + block
+                position = 0
+
+    @staticmethod
+    def stream(filenames, snapshots_per_chunk: int = 60, block_size: int = 2 ** 20):
+        """
+        Parses live data json files and SQLite databases in chunks of consecutive responses, so that archives larger
+        than memory can be processed.
+        :param filenames: path or list of paths to the files to be parsed, in chronological order.
+        :param snapshots_per_chunk: number of responses in a chunk.
+        :param block_size: number of characters read from a json file or rows read from a database at once.
+        :return: generator of DataFrames in the format returned by parse, chunks with no records are skipped.
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        chunk = []
+        for filename in filenames:
+            for snapshot in LiveParser.iter_snapshots(filename, block_size):
+                if snapshot['result']:
+                    chunk.append(snapshot)
+                if len(chunk) == snapshots_per_chunk:
+                    yield LiveParser.to_frame(chunk)
+                    chunk = []
+        if chunk:
+            yield LiveParser.to_frame(chunk)
@@ -0,0 +1,211 @@
+import pandas as pd
+import plotly.graph_objects as go
+import folium
+import folium.plugins
+import branca.colormap as cm
+import autobusy.analyzer.geojson as geojson
+from autobusy.analyzer.analyzer import Results
+
+# map layers for point data
+POINT_LAYERS = ('markers', 'cluster', 'heatmap')
+
+# creates the markers of a FastMarkerCluster from rows of [lat, lon, popup]
+CLUSTER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    return marker;
+}
+"""
+
+
+def plot_speeds(results: Results, delimiters: list[int]) -> go.Figure:
+    """
+    Plots the number of buses in different speed categories.
+    :param results: analysis results.
+    :param delimiters: list of speed category delimiters.
+    :return: plotly figure.
+    """
+    categories = [f'{delimiters[i]}-{delimiters[i + 1]}' for i in range(len(delimiters) - 1)]
+    categories.append(f'{delimiters[-1]}+')
+    values = results.speed_counts(delimiters)['Count'].tolist()
+    fig = go.Figure(data=[go.Bar(x=categories, y=values)])
+    fig.update_layout(
+        title='Prędkości autobusów',
+        title_x=0.5,
+        xaxis_title='Prędkość [km/h]',
+        yaxis_title='Liczba zarejestrowanch przypadków prędkości',
+    )
+    return fig
+
+
+def plot_fast_places(results: Results, min_buses: int, min_ratio: float, resolution: float = None,
+                     layer: str = 'cells') -> folium.Map:
+    """
+    Plots the places where the number of buses is greater than min_buses and the ratio of fast buses is greater
+    than min_ratio (a bus is considered fast if its speed is greater than the fast speed of the places data,
+    50 km/h by default).
+    :param results: analysis results.
+    :param min_buses: minimum number of buses.
+    :param min_ratio: minimum ratio of fast buses.
+    :param resolution: resolution of the places speed pyramid to be plotted,
+                       by default places speed data is plotted.
+    :param layer: 'cells' to outline the grid cells, 'heatmap' for a heatmap weighted by the number of fast buses.
+    :return: folium map.
+    """
+    if layer not in ('cells', 'heatmap'):
+        raise ValueError(f'Unknown layer: {layer}')
+    if resolution is None:
+        if results.places_speed_data is None:
+            raise ValueError('Places speed data not created')
+        places_speed_data, cell_grid = results.places_speed_data, results.places_grid
+    else:
+        if results.places_speed_pyramid is None or resolution not in results.places_speed_pyramid:
+            raise ValueError(f'Places speed data for resolution {resolution} not created')
+        places_speed_data, cell_grid = results.places_speed_pyramid[resolution]
+    fast_places = places_speed_data[(places_speed_data['Total'] > min_buses) &
+                                    (places_speed_data['Fast'] / places_speed_data['Total'] > min_ratio)]
+    m = folium.Map(location=[52.22977, 21.01178], zoom_start=11)
+    if layer == 'heatmap':
+        folium.plugins.HeatMap(fast_places[['Lat', 'Lon', 'Fast']].to_numpy(dtype=float).tolist()).add_to(m)
+        return m
+    if fast_places.empty:
+        return m
+    folium.GeoJson(
+        geojson.polygons(cell_grid.polygons(fast_places['Lon'], fast_places['Lat']),
+                         fast_places[['Total', 'Fast']]),
+        style_function=lambda feature: {'color': 'red', 'weight': 2.5, 'fill': False},
+        tooltip=folium.GeoJsonTooltip(fields=['Total', 'Fast'],
+                                      aliases=['Liczba autobusów:', 'Liczba szybkich:']),
+    ).add_to(m)
+    return m
+
+
+def plot_punctuality(results: Results, delimiters: list[int]) -> go.Figure:
+    """
+    Plots the number of buses in different punctuality categories.
+    :param results: analysis results.
+    :param delimiters: list of punctuality category delimiters.
+    :return: plotly figure.
+    """
+    categories = [f'{delimiters[-1]}+ minut za wcześnie']
+    categories += [
+        f'{delimiters[i]}-{delimiters[i + 1]} minut za wcześnie'
+        for i in reversed(range(len(delimiters) - 1))
+    ]
+    categories += [f'W obrębie {delimiters[0]} minut']
+    categories += [
+        f'{delimiters[i]}-{delimiters[i + 1]} minut za późno'
+        for i in range(len(delimiters) - 1)
+    ]
+    categories += [f'{delimiters[-1]}+ minut za późno']
+    values = results.punctuality_counts(delimiters)['Count'].tolist()
+
+    fig = go.Figure(data=[go.Bar(x=categories, y=values)])
+    fig.update_layout(
+        title='Punktualność autobusów',
+        title_x=0.5,
+        xaxis_title='Różnica w minutach',
+        yaxis_title='Liczba zarejestrowanch przypadków',
+    )
+    return fig
+
+
+def plot_bad_stops(results: Results, min_buses: int, min_ratio: float, layer: str = 'markers') -> folium.Map:
+    """
+    Plots the stops with the number of buses greater than min_buses and the ratio of late to total buses
+    greater than min_ratio.
+    :param results: analysis results.
+    :param min_buses: minimum number of buses.
+    :param min_ratio: minimum ratio of late buses to total buses.
+    :param layer: 'markers' for a marker per stop, 'cluster' for markers clustered in the browser,
+                  'heatmap' for a heatmap weighted by the number of late buses.
+    :return: folium map.
+    """
+    if layer not in POINT_LAYERS:
+        raise ValueError(f'Unknown layer: {layer}')
+    if results.stop_punctuality_data is None:
+        raise ValueError('Stop punctuality data not created')
+    stop_punctuality_data = results.stop_punctuality_data
+    bad_stops = stop_punctuality_data[(stop_punctuality_data['Late'] / stop_punctuality_data['Total'] > min_ratio) &
+                                      (stop_punctuality_data['Total'] > min_buses)]
+    bad_stops = bad_stops.join(results.stop_info, on='Stop')
+
+    m = folium.Map(location=[52.22977, 21.01178], zoom_start=11)
+    if layer == 'heatmap':
+        folium.plugins.HeatMap(bad_stops[['Lat', 'Lon', 'Late']].to_numpy(dtype=float).tolist()).add_to(m)
+    elif layer == 'cluster':
+        popups = (bad_stops['Name'].astype(str) + '<br>Liczba autobusów: ' + bad_stops['Total'].astype(str) +
+                  '<br>Liczba spóźnionych: ' + bad_stops['Late'].astype(str))
+        folium.plugins.FastMarkerCluster(
+            pd.DataFrame({'Lat': bad_stops['Lat'], 'Lon': bad_stops['Lon'], 'Popup': popups}).values.tolist(),
+            callback=CLUSTER_CALLBACK,
+        ).add_to(m)
+    elif not bad_stops.empty:
+        folium.GeoJson(
+            geojson.points(bad_stops['Lon'], bad_stops['Lat'], bad_stops[['Name', 'Total', 'Late']]),
+            marker=folium.Marker(icon=folium.Icon(color='red', icon='info-sign')),
+            popup=folium.GeoJsonPopup(fields=['Name', 'Total', 'Late'],
+                                      aliases=['', 'Liczba autobusów:', 'Liczba spóźnionych:']),
+        ).add_to(m)
+
+    return m
+
+
+def plot_distance(results: Results, delimiters: list[int]) -> go.Figure:
+    """
+    Plots the number of buses in different distance categories.
+    :param results: analysis results.
+    :param delimiters: list of distance category delimiters.
+    :return: plotly figure.
+    """
+    categories = [f'{delimiters[i]}-{delimiters[i + 1]}' for i in range(len(delimiters) - 1)]
+    categories.append(f'{delimiters[-1]}+')
+    values = results.distance_counts(delimiters)['Count'].tolist()
+    fig = go.Figure(data=[go.Bar(x=categories, y=values)])
+    fig.update_layout(
+        title='Przebyte odległości przez autobusy',
+        title_x=0.5,
+        xaxis_title='Odległość [km]',
+        yaxis_title='Liczba autobusów',
+    )
+    return fig
+
+
+def plot_longest_routes(results: Results, filtered=False, tolerance: float = 0.01) -> folium.Map:
+    """
+    Plots the longest routes, simplified with the Douglas-Peucker algorithm.
+    :param results: analysis results.
+    :param filtered: whether to plot the longest routes with measurement errors filtered out.
+    :param tolerance: tolerance of the simplification in km, 0 plots all pings.
+    :return: folium map.
+    """
+    if not filtered and results.longest_routes is None:
+        raise ValueError('Longest routes not created')
+    if filtered and results.filtered_longest_routes is None:
+        raise ValueError('Filtered longest routes not created')
+    longest_routes = results.filtered_longest_routes if filtered else results.longest_routes
+    m = folium.Map(location=[52.22977, 21.01178], zoom_start=11)
+    if longest_routes.empty:
+        return m
+
+    linear_cm = cm.LinearColormap(
+        ['#ad1609', '#05a11a', '#05059c'],
+        vmin=0,
+        vmax=longest_routes['VehicleNumber'].nunique(),
+    )
+
+    longest_routes = longest_routes.sort_values('VehicleNumber', kind='stable')
+    first = longest_routes.drop_duplicates('VehicleNumber')
+    properties = pd.DataFrame({
+        'Lines': first['Lines'].to_numpy(),
+        'Distance': first['Distance'].to_numpy(),
+        'Color': [linear_cm(i) for i in first.index],
+    })
+    folium.GeoJson(
+        geojson.lines(longest_routes['Lon'], longest_routes['Lat'], longest_routes['VehicleNumber'],
+                      properties, tolerance),
+        style_function=lambda feature: {'color': feature['properties']['Color'], 'weight': 2.5},
+        tooltip=folium.GeoJsonTooltip(fields=['Lines', 'Distance'], aliases=['Numer linii:', 'Długość:']),
+    ).add_to(m)
+    return m
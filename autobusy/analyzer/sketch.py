@@ -0,0 +1,341 @@
+import pandas as pd
+import numpy as np
+import autobusy.analyzer.grid as grid
+import json
+
+# dimensions of sketch sets -> names of their columns in summaries
+DIMENSIONS = {'all': None, 'line': 'Line', 'cell': 'Cell', 'hour': 'Hour'}
+
+
+class KLLSketch:
+    """
+    Class for a mergeable quantile sketch (Karnin, Lang and Liberty, "Optimal Quantile Approximation in Streams").
+    Values are kept in levels of compactors, a value at level h standing for 2 ** h values. A level holding
+    more values than its capacity (k at the top level, shrinking by a factor of 2/3 per level below it) is sorted
+    and every other value, starting at a random offset, is promoted to the level above. The sketch of n values
+    holds O(k + log n) values, about 3k at most, and the rank of a value (hence a quantile) is estimated
+    with an error below about 1.7% of n at k = 200 with high probability, the error decreasing as 1 / k.
+    Sketches of different data (e.g. days or worker processes) are merged level by level with the same guarantee.
+    Minimum, maximum and count are exact.
+    """
+
+    def __init__(self, k: int = 200, seed=None):
+        """
+        Constructor for the KLLSketch class.
+        :param k: capacity of the top level, which determines the size and the error of the sketch.
+        :param seed: seed of the random offsets of compactions.
+        """
+        if k < 8:
+            raise ValueError('k must be at least 8')
+        self.k = k
+        self.levels = [np.zeros(0)]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.rng = np.random.default_rng(seed)
+        self.sorted = None
+
+    def capacity(self, level: int) -> int:
+        """
+        Gets the capacity of a level.
+        :param level: level.
+        :return: maximum number of values at the level.
+        """
+        return max(int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))), 2)
+
+    def compress(self):
+        """
+        Compacts the levels holding more values than their capacity, from the lowest one.
+        :return: None
+        """
+        level = 0
+        while level < len(self.levels):
+            if self.levels[level].shape[0] > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                values = np.sort(self.levels[level])
+                # an odd value out stays at the level
+                kept = values[:values.shape[0] % 2]
+                promoted = values[kept.shape[0]:][self.rng.integers(2)::2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+        self.sorted = None
+
+    def update(self, values):
+        """
+        Adds values to the sketch.
+        :param values: values, NaN values are skipped.
+        :return: None
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not values.shape[0]:
+            return
+        self.count += values.shape[0]
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def merge(self, other: 'KLLSketch'):
+        """
+        Adds the values of another sketch to the sketch.
+        :param other: sketch with the same k.
+        :return: None
+        """
+        if other.k != self.k:
+            raise ValueError(f'Cannot merge sketches with k = {self.k} and k = {other.k}')
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for level, values in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+
+    def weighted(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the values of the sketch sorted, with cumulative weights. Computed once per update.
+        :return: tuple of sorted values and cumulative weights (the number of values they stand for).
+        """
+        if self.sorted is None:
+            values = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(x.shape[0], 2.0 ** level) for level, x in enumerate(self.levels)])
+            order = np.argsort(values, kind='stable')
+            self.sorted = (values[order], np.cumsum(weights[order]))
+        return self.sorted
+
+    def rank(self, values) -> np.ndarray:
+        """
+        Estimates the fraction of the values of the sketch below given values.
+        :param values: values.
+        :return: array of fractions.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        sorted_values, cumulative = self.weighted()
+        if not sorted_values.shape[0]:
+            return np.full(values.shape, np.nan)
+        position = np.searchsorted(sorted_values, values, side='left')
+        return np.r_[0, cumulative][position] / cumulative[-1]
+
+    def quantiles(self, fractions) -> np.ndarray:
+        """
+        Estimates quantiles of the values of the sketch.
+        :param fractions: fractions between 0 and 1, 0 gives the minimum and 1 the maximum.
+        :return: array of quantiles, NaN if the sketch is empty.
+        """
+        fractions = np.asarray(fractions, dtype=np.float64)
+        if np.any((fractions < 0) | (fractions > 1)):
+            raise ValueError('Fractions must be between 0 and 1')
+        sorted_values, cumulative = self.weighted()
+        if not sorted_values.shape[0]:
+            return np.full(fractions.shape, np.nan)
+        position = np.searchsorted(cumulative, fractions * cumulative[-1], side='left')
+        quantiles = sorted_values[np.minimum(position, sorted_values.shape[0] - 1)]
+        return np.clip(np.where(fractions == 0, self.min, np.where(fractions == 1, self.max, quantiles)),
+                       self.min, self.max)
+
+    def counts(self, delimiters: list[float]) -> np.ndarray:
+        """
+        Estimates the numbers of values in buckets [delimiters[i], delimiters[i + 1]) and [delimiters[-1], inf)
+        (see histogram.Histogram.counts).
+        :param delimiters: non-decreasing list of delimiters.
+        :return: array of estimated counts, one per delimiter.
+        """
+        delimiters = np.asarray(delimiters, dtype=np.float64)
+        if delimiters.shape[0] == 0 or np.any(np.diff(delimiters) < 0):
+            raise ValueError('Delimiters must be a non-empty non-decreasing list')
+        if not self.count:
+            return np.zeros(delimiters.shape[0])
+        return np.diff(np.r_[self.rank(delimiters), 1.0]) * self.count
+
+    def to_dict(self) -> dict:
+        """
+        Serialises the sketch.
+        :return: JSON-serialisable dictionary.
+        """
+        return {
+            'k': self.k,
+            'count': self.count,
+            'min': float(self.min) if self.count else None,
+            'max': float(self.max) if self.count else None,
+            'levels': [x.tolist() for x in self.levels],
+        }
+
+    @staticmethod
+    def from_dict(data: dict, seed=None) -> 'KLLSketch':
+        """
+        Deserialises a sketch.
+        :param data: dictionary returned by to_dict.
+        :param seed: seed of the random offsets of compactions.
+        :return: sketch.
+        """
+        sketch = KLLSketch(data['k'], seed)
+        sketch.levels = [np.asarray(x, dtype=np.float64) for x in data['levels']]
+        sketch.count = data['count']
+        if data['count']:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+
+class SketchSet:
+    """
+    Class for quantile sketches of one metric (e.g. speed or delay) of all the values, per line, per grid cell
+    and per hour, so that percentiles over long periods are kept in a bounded state instead of all the records.
+    Sets computed for different days or worker processes are merged sketch by sketch.
+    """
+
+    def __init__(self, k: int = 200, resolution: float = 0.01, seed=None):
+        """
+        Constructor for the SketchSet class.
+        :param k: parameter of the sketches (see KLLSketch).
+        :param resolution: size of the grid cells in degrees (see grid.Grid).
+        :param seed: seed of the random offsets of compactions.
+        """
+        self.k = k
+        self.resolution = resolution
+        self.grid = grid.Grid(resolution)
+        self.rng = np.random.default_rng(seed)
+        # (dimension, key) -> sketch
+        self.sketches = {}
+
+    def sketch(self, dimension: str, key) -> KLLSketch:
+        """
+        Gets the sketch of a key, creating it if needed.
+        :param dimension: one of DIMENSIONS.
+        :param key: line number, cell id, hour or None for all the values.
+        :return: sketch.
+        """
+        if (dimension, key) not in self.sketches:
+            self.sketches[(dimension, key)] = KLLSketch(self.k, self.rng)
+        return self.sketches[(dimension, key)]
+
+    def update(self, values, lines=None, lon=None, lat=None, hours=None):
+        """
+        Adds values to the sketches.
+        :param values: values.
+        :param lines: line number of each value, not sketched per line if not given.
+        :param lon: longitude of each value, not sketched per cell if not given.
+        :param lat: latitude of each value.
+        :param hours: hour of each value, not sketched per hour if not given.
+        :return: None
+        """
+        values = np.asarray(values, dtype=np.float64)
+        self.sketch('all', None).update(values)
+        groups = []
+        if lines is not None:
+            groups.append(('line', np.asarray(lines, dtype=object), values))
+        if lon is not None:
+            lon = np.asarray(lon, dtype=np.float64)
+            lat = np.asarray(lat, dtype=np.float64)
+            # values without a position are not sketched per cell
+            known = ~(np.isnan(lon) | np.isnan(lat))
+            groups.append(('cell', self.grid.cells(lon[known], lat[known]), values[known]))
+        if hours is not None:
+            groups.append(('hour', np.asarray(hours, dtype=np.int64), values))
+        for dimension, keys, group_values in groups:
+            for key, positions in pd.Series(group_values).groupby(keys).indices.items():
+                self.sketch(dimension, key.item() if isinstance(key, np.generic) else key).update(
+                    group_values[positions]
+                )
+
+    def merge(self, other: 'SketchSet'):
+        """
+        Adds the values of another set to the set.
+        :param other: sketch set with the same k and resolution.
+        :return: None
+        """
+        if (other.k, other.resolution) != (self.k, self.resolution):
+            raise ValueError('Cannot merge sketch sets with different k or resolution')
+        for (dimension, key), sketch in other.sketches.items():
+            self.sketch(dimension, key).merge(sketch)
+
+    @staticmethod
+    def merge_all(sets: list['SketchSet']) -> 'SketchSet':
+        """
+        Merges sketch sets, e.g. of different days.
+        :param sets: non-empty list of sketch sets with the same k and resolution.
+        :return: new sketch set.
+        """
+        merged = SketchSet(sets[0].k, sets[0].resolution)
+        for sketch_set in sets:
+            merged.merge(sketch_set)
+        return merged
+
+    def quantiles(self, fractions: list[float], dimension: str = 'all') -> pd.DataFrame:
+        """
+        Estimates quantiles of the values of each key of a dimension.
+        :param fractions: fractions between 0 and 1.
+        :param dimension: one of DIMENSIONS.
+        :return: dataframe with the key (Line, Cell with the cell center Lon and Lat, or Hour, no key for 'all'),
+                 the number of values (Count) and a column per fraction (e.g. P50 for 0.5), sorted by the key.
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f'Unknown dimension {dimension}')
+        keys = sorted(key for x, key in self.sketches if x == dimension)
+        sketches = [self.sketches[(dimension, key)] for key in keys]
+        columns = {}
+        if DIMENSIONS[dimension] is not None:
+            columns[DIMENSIONS[dimension]] = keys
+        if dimension == 'cell':
+            columns['Lon'], columns['Lat'] = self.grid.centers(np.asarray(keys, dtype=np.int64))
+        columns['Count'] = [sketch.count for sketch in sketches]
+        quantiles = np.array([sketch.quantiles(fractions) for sketch in sketches]).reshape(len(keys), len(fractions))
+        for i, fraction in enumerate(fractions):
+            columns[f'P{fraction * 100:g}'] = quantiles[:, i]
+        return pd.DataFrame(columns)
+
+    def size(self) -> int:
+        """
+        Gets the number of values kept in the sketches.
+        :return: number of values.
+        """
+        return sum(level.shape[0] for sketch in self.sketches.values() for level in sketch.levels)
+
+    def to_dict(self) -> dict:
+        """
+        Serialises the sketch set.
+        :return: JSON-serialisable dictionary.
+        """
+        return {
+            'k': self.k,
+            'resolution': self.resolution,
+            'sketches': [{'dimension': dimension, 'key': key, 'sketch': sketch.to_dict()}
+                         for (dimension, key), sketch in self.sketches.items()],
+        }
+
+    @staticmethod
+    def from_dict(data: dict, seed=None) -> 'SketchSet':
+        """
+        Deserialises a sketch set.
+        :param data: dictionary returned by to_dict.
+        :param seed: seed of the random offsets of compactions.
+        :return: sketch set.
+        """
+        sketch_set = SketchSet(data['k'], data['resolution'], seed)
+        for entry in data['sketches']:
+            sketch_set.sketches[(entry['dimension'], entry['key'])] = KLLSketch.from_dict(entry['sketch'],
+                                                                                          sketch_set.rng)
+        return sketch_set
+
+    def save(self, filename: str):
+        """
+        Saves the sketch set as JSON.
+        :param filename: path to the file.
+        :return: None
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @staticmethod
+    def load(filename: str) -> 'SketchSet':
+        """
+        Loads a sketch set saved with save.
+        :param filename: path to the file.
+        :return: sketch set.
+        """
+        with open(filename, 'r') as f:
+            return SketchSet.from_dict(json.load(f))
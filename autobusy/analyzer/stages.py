@@ -0,0 +1,148 @@
+import pandas as pd
+import autobusy.analyzer.cache as cache
+import hashlib
+import json
+from typing import Callable
+
+
+def fingerprint(value) -> str:
+    """
+    Calculates a fingerprint of a stage input. Dataframes and series are hashed by content,
+    objects with a fingerprint method (e.g. RouteData) use that method, other values are hashed by repr.
+    :param value: value to be fingerprinted.
+    :return: hex digest.
+    """
+    digest = hashlib.sha1()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif hasattr(value, 'fingerprint'):
+        return value.fingerprint()
+    else:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+class Stage:
+    """
+    Class for describing a node of the analysis graph.
+    """
+
+    def __init__(self, func: Callable, inputs: tuple[str, ...] = (), params: tuple[str, ...] = (),
+                 options: tuple[str, ...] = (), defaults: dict = None):
+        """
+        Constructor for the Stage class.
+        :param func: function computing the stage, called with values of inputs as positional arguments
+                     and params and options as keyword arguments.
+        :param inputs: names of stages or sources the stage depends on.
+        :param params: names of parameters that affect the result.
+        :param options: names of parameters that do not affect the result (e.g. number of workers).
+        :param defaults: default values of params.
+        """
+        self.func = func
+        self.inputs = inputs
+        self.params = params
+        self.options = options
+        self.defaults = defaults or {}
+
+    def resolve(self, params: dict) -> dict:
+        """
+        Gets the values of the parameters of the stage.
+        :param params: dictionary of parameter name -> value.
+        :return: dictionary of values of params, with defaults for missing ones.
+        """
+        missing = [param for param in self.params if param not in params and param not in self.defaults]
+        if missing:
+            raise ValueError(f'Missing parameters: {missing}')
+        return {param: params[param] if param in params else self.defaults[param] for param in self.params}
+
+
+class StageExecutor:
+    """
+    Class for lazily computing stages of the analysis graph.
+    Results are memoised by stage name, stage parameters and fingerprints of the inputs,
+    so each stage is computed at most once for given data.
+    Results can also be persisted in a ResultsCache, so that they survive between runs.
+    """
+
+    def __init__(self, stages: dict[str, Stage], context: dict = None, results_cache: cache.ResultsCache = None):
+        """
+        Constructor for the StageExecutor class.
+        :param stages: dictionary of stage name -> stage.
+        :param context: parameters shared by all stages (e.g. analyzed hour), included in every key.
+        :param results_cache: optional persistent cache consulted before computing a stage.
+        """
+        self.stages = stages
+        self.context = context or {}
+        self.results_cache = results_cache
+        self.memo = {}
+
+    def key(self, name: str, sources: dict, params: dict, source_fingerprints: dict) -> str:
+        """
+        Calculates the memoisation key of a stage without computing it.
+        :param name: stage name.
+        :param sources: dictionary of source name -> value.
+        :param params: dictionary of parameter name -> value.
+        :param source_fingerprints: dictionary of already calculated source fingerprints, filled in place.
+        :return: hex digest identifying the stage result.
+        """
+        if name not in self.stages:
+            if name not in sources:
+                raise ValueError(f'Missing source: {name}')
+            if name not in source_fingerprints:
+                source_fingerprints[name] = fingerprint(sources[name])
+            return source_fingerprints[name]
+        stage = self.stages[name]
+        description = {
+            'stage': name,
+            'context': self.context,
+            'params': stage.resolve(params),
+            'inputs': [self.key(x, sources, params, source_fingerprints) for x in stage.inputs],
+        }
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def run(self, name: str, sources: dict, params: dict = None, source_fingerprints: dict = None):
+        """
+        Computes a stage and the stages it depends on, reusing memoised results.
+        :param name: stage name.
+        :param sources: dictionary of source name -> value (e.g. live data, route data).
+        :param params: dictionary of parameter name -> value, extra parameters are ignored.
+        :param source_fingerprints: dictionary of already calculated source fingerprints.
+        :return: result of the stage.
+        """
+        params = params or {}
+        source_fingerprints = {} if source_fingerprints is None else source_fingerprints
+        if name not in self.stages:
+            return sources[name]
+        key = self.key(name, sources, params, source_fingerprints)
+        if key not in self.memo:
+            value = cache.MISSING if self.results_cache is None else self.results_cache.get(key)
+            if value is cache.MISSING:
+                stage = self.stages[name]
+                input_values = [self.run(x, sources, params, source_fingerprints) for x in stage.inputs]
+                kwargs = stage.resolve(params)
+                kwargs.update({option: params[option] for option in stage.options if option in params})
+                value = stage.func(*input_values, **kwargs)
+                if self.results_cache is not None:
+                    self.results_cache.put(key, value)
+            self.memo[key] = value
+        return self.memo[key]
+
+    def dependencies(self, name: str) -> list[str]:
+        """
+        Gets the stages a stage depends on, directly or indirectly, including the stage itself.
+        :param name: stage name.
+        :return: list of stage names, each stage after the stages it depends on.
+        """
+        res = []
+        for x in self.stages[name].inputs:
+            if x in self.stages:
+                res += [y for y in self.dependencies(x) if y not in res]
+        return res + [name]
+
+    def clear(self):
+        """
+        Removes all memoised results.
+        :return: None
+        """
+        self.memo = {}
@@ -0,0 +1,313 @@
+import pandas as pd
+import numpy as np
+import json
+import autobusy.analyzer.kernels as kernels
+from autobusy.analyzer.analyzer import RouteData
+from autobusy.analyzer.parser import LiveParser
+
+# bounding box of Warsaw: min lon, min lat, max lon, max lat
+WARSAW_BOUNDS = (20.85, 52.10, 21.27, 52.37)
+
+# scale name -> parameters of SyntheticNetwork
+SCALES = {
+    'small': {'lines': 20, 'stops': 400, 'vehicles': 100},
+    'medium': {'lines': 100, 'stops': 1500, 'vehicles': 500},
+    'warsaw': {'lines': 300, 'stops': 4000, 'vehicles': 1500},
+}
+
+
+def format_time(minutes: float, separator: str = ':') -> str:
+    """
+    Formats minutes since midnight as hours and minutes, e.g. 7:05.
+    :param minutes: minutes since midnight.
+    :param separator: separator of hours and minutes.
+    :return: formatted time.
+    """
+    minutes = int(round(minutes))
+    return f'{minutes // 60}{separator}{minutes % 60:02d}'
+
+
+class SyntheticNetwork:
+    """
+    Class for generating synthetic but realistic data at the scale of Warsaw, for benchmarks and tests:
+    a network of stops and lines with a timetable (which can be written in the RA format read by TimetableParser)
+    and live data archives in the format written by RequestHandler, with vehicles following the timetable
+    with delays, GPS noise, stalls (stale pings repeated by the API) and jumps (single pings far off the route).
+    Every stop group has two stops, one for each direction; each line runs back and forth along one route,
+    its vehicles evenly spaced on the cycle, with the timetable derived from the same schedule.
+    Data is deterministic for a given seed.
+    """
+
+    SERVICE_START = 4 * 60  # minutes since midnight
+    SERVICE_END = 24 * 60
+    SPEED = 20  # average speed in km/h
+    DWELL = 0.5  # minutes at a stop
+    LAYOVER = 5  # minutes at a terminus
+    DATE = '2024-01-29'
+
+    def __init__(self, lines: int = 300, stops: int = 4000, vehicles: int = 1500, seed: int = 0):
+        """
+        Constructor for the SyntheticNetwork class.
+        :param lines: number of lines.
+        :param stops: number of stops (two per stop group).
+        :param vehicles: number of vehicles, spread evenly over the lines.
+        :param seed: seed of the random generator.
+        """
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        min_lon, min_lat, max_lon, max_lat = WARSAW_BOUNDS
+        groups = max(stops // 2, 2)
+        self.group_lon = rng.uniform(min_lon, max_lon, groups)
+        self.group_lat = rng.uniform(min_lat, max_lat, groups)
+        self.group_id = [f'{1000 + i:04d}' for i in range(groups)]
+
+        self.routes = {}
+        for i in range(lines):
+            self.routes[str(100 + i)] = self.random_route(rng)
+        fleet = np.full(lines, vehicles // lines)
+        fleet[:vehicles % lines] += 1
+        self.fleet = dict(zip(self.routes, fleet.tolist()))
+        self.cycles = {line: self.cycle(route) for line, route in self.routes.items()}
+
+    def random_route(self, rng: np.random.Generator) -> np.ndarray:
+        """
+        Draws a route as the stop groups nearest to a gently curved path between two random points.
+        :param rng: random generator.
+        :return: array of indexes of stop groups, without repetitions.
+        """
+        min_lon, min_lat, max_lon, max_lat = WARSAW_BOUNDS
+        while True:
+            lon = rng.uniform(min_lon, max_lon, 2)
+            lat = rng.uniform(min_lat, max_lat, 2)
+            length = kernels.haversine(lon[0], lat[0], lon[1], lat[1])
+            if length < 4:
+                continue
+            t = np.linspace(0, 1, int(length / 0.5) + 2)
+            bend = rng.normal(0, 0.1) * np.sin(np.pi * t)
+            path_lon = lon[0] + t * (lon[1] - lon[0]) - bend * (lat[1] - lat[0])
+            path_lat = lat[0] + t * (lat[1] - lat[0]) + bend * (lon[1] - lon[0])
+            index, _ = kernels.nearest(path_lon, path_lat, self.group_lon, self.group_lat)
+            _, first = np.unique(index, return_index=True)
+            route = index[np.sort(first)]
+            if route.shape[0] >= 5:
+                return route
+
+    def stop_position(self, group: np.ndarray, direction: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the positions of the stops of stop groups, the stops of the two directions are about 20 m apart.
+        :param group: indexes of stop groups.
+        :param direction: 0 or 1.
+        :return: tuple of longitudes and latitudes.
+        """
+        return self.group_lon[group], self.group_lat[group] + (0.0001 if direction == 0 else -0.0001)
+
+    def stop_ids(self, group: np.ndarray, direction: int) -> list[str]:
+        """
+        Gets the IDs of the stops of stop groups.
+        :param group: indexes of stop groups.
+        :param direction: 0 or 1.
+        :return: list of stop IDs.
+        """
+        return [f'{self.group_id[g]}0{direction + 1}' for g in group]
+
+    def cycle(self, route: np.ndarray) -> pd.DataFrame:
+        """
+        Gets the schedule of one cycle of a line (forward, layover, backward, layover).
+        :param route: indexes of stop groups of the forward route.
+        :return: dataframe with the knots of the cycle: minutes since the start of the cycle (Time),
+                 position (Lon, Lat), direction (Direction) and stop ID (Stop, None for the end of a layover).
+        """
+        knots = []
+        offset = 0.0
+        for direction, groups in enumerate([route, route[::-1]]):
+            lon, lat = self.stop_position(groups, direction)
+            distance = np.r_[0, kernels.pair_distances(lon, lat)[1:]]
+            times = offset + np.cumsum(distance / self.SPEED * 60 + self.DWELL) - self.DWELL
+            knots.append(pd.DataFrame({'Time': times, 'Lon': lon, 'Lat': lat, 'Direction': direction,
+                                       'Stop': self.stop_ids(groups, direction)}))
+            offset = times[-1] + self.LAYOVER
+            knots.append(pd.DataFrame({'Time': [offset], 'Lon': lon[-1:], 'Lat': lat[-1:], 'Direction': direction,
+                                       'Stop': [None]}))
+        return pd.concat(knots, ignore_index=True)
+
+    def headway(self, line: str) -> float:
+        """
+        Gets the headway of a line.
+        :param line: line number.
+        :return: minutes between consecutive vehicles.
+        """
+        return self.cycles[line]['Time'].iloc[-1] / self.fleet[line]
+
+    def stop_info(self) -> pd.DataFrame:
+        """
+        Gets the stop information in the format returned by TimetableParser.
+        :return: dataframe with stop information: ID (index), Name, Lat, Lon.
+        """
+        frames = []
+        for direction in (0, 1):
+            groups = np.arange(len(self.group_id))
+            lon, lat = self.stop_position(groups, direction)
+            frames.append(pd.DataFrame({
+                'ID': self.stop_ids(groups, direction),
+                'Name': [f'Przystanek {g}' for g in self.group_id],
+                'Lat': np.round(lat, 6),
+                'Lon': np.round(lon, 6),
+            }))
+        return pd.concat(frames, ignore_index=True).sort_values('ID').set_index('ID')
+
+    def line_info(self) -> tuple[dict[str, list[list[str]]], dict[str, dict[str, list[str]]]]:
+        """
+        Gets the routes and the timetable of the lines in the format returned by TimetableParser.
+        :return: tuple of dictionaries: line number -> list of routes
+                                        and line number -> dictionary of stop -> list of hours.
+        """
+        line_route_info = {}
+        line_timetable_info = {}
+        for line, route in self.routes.items():
+            line_route_info[line] = [self.stop_ids(route, 0), self.stop_ids(route[::-1], 1)]
+            cycle = self.cycles[line]
+            period = cycle['Time'].iloc[-1]
+            starts = self.SERVICE_START + np.arange(self.fleet[line]) * self.headway(line)
+            timetable = {}
+            for stop, time in zip(cycle['Stop'], cycle['Time']):
+                if stop is None:
+                    continue
+                times = (starts[:, None] + time + period * np.arange(int(24 * 60 / period) + 1)[None, :]).ravel()
+                times = np.sort(np.round(times))
+                times = times[times < self.SERVICE_END]
+                timetable[stop] = [format_time(t) for t in times]
+            line_timetable_info[line] = timetable
+        return line_route_info, line_timetable_info
+
+    def route_data(self) -> RouteData:
+        """
+        Gets the route data of the network.
+        :return: route data.
+        """
+        return RouteData(self.stop_info(), *self.line_info())
+
+    def write_timetable(self, filename: str):
+        """
+        Writes the network in the RA format of the ZTM timetable files, as far as TimetableParser reads it.
+        :param filename: path to the output file.
+        :return: None
+        """
+        stop_info = self.stop_info()
+        line_route_info, line_timetable_info = self.line_info()
+        out = [f'*ZP {len(self.group_id)}']
+        for group in self.group_id:
+            out.append(f'   {group}   Przystanek {group},  --  WARSZAWA')
+            out.append('      *PR 2')
+            for stop in (group + '01', group + '02'):
+                row = stop_info.loc[stop]
+                out.append(f'         {stop}   {row["Name"]}, Warszawa   Y= {row["Lat"]:.6f}     '
+                           f'X= {row["Lon"]:.6f}     Pu=0')
+            out.append('      #PR')
+        out.append('#ZP')
+        out.append(f'*LL {len(line_route_info)}')
+        for line, routes in line_route_info.items():
+            out.append(f'   Linia:   {line}  - LINIA ZWYKŁA')
+            out.append(f'      *TR  {len(routes)}')
+            for route in routes:
+                destination = stop_info.loc[route[-1], 'Name']
+                out.append(f'         TX-{line}  ,  {stop_info.loc[route[0], "Name"]},  ==>  {destination}')
+                out.append(f'         *LW {len(route)}')
+                for stop in route:
+                    out.append(f'            {stop_info.loc[stop, "Name"]},   r {stop}  1')
+                out.append('         #LW')
+                out.append(f'         *RP {len(route)}')
+                for stop in route:
+                    row = stop_info.loc[stop]
+                    times = line_timetable_info[line][stop]
+                    out.append(f'            {stop}   Kier.: {destination}   Y= {row["Lat"]:.6f}     '
+                               f'X= {row["Lon"]:.6f}     Pu=0')
+                    out.append(f'               *OD {len(times)}')
+                    out += [f'                  {t.replace(":", ".")}  DP' for t in times]
+                    out.append('               #OD')
+                out.append('         #RP')
+            out.append('      #TR')
+        out.append('#LL')
+        with open(filename, 'w', encoding='Windows-1250') as f:
+            f.write('\n'.join(out) + '\n')
+
+    def snapshots(self, hour: int, noise: float = 5e-5, delay: float = 2.0, stall_probability: float = 0.02,
+                  jump_probability: float = 0.002, date: str = DATE) -> list[dict]:
+        """
+        Generates the responses of the live data API for each minute of an hour.
+        :param hour: hour of the day.
+        :param noise: standard deviation of the GPS noise in degrees (5e-5 is about 5 m).
+        :param delay: standard deviation of the delays of vehicles in minutes.
+        :param stall_probability: probability that a ping repeats the previous ping of the vehicle.
+        :param jump_probability: probability that a ping is a few km off the route.
+        :param date: day of the responses, e.g. '2024-01-29'.
+        :return: list of dicts with request time and result field of the response.
+        """
+        rng = np.random.default_rng([self.seed, hour])
+        minutes = np.arange(60)
+        request_time = hour * 60 + minutes + 0.5
+        columns = {'Lines': [], 'VehicleNumber': [], 'Brigade': [], 'Lon': [], 'Lat': [], 'Time': []}
+        vehicle = 0
+        for line, cycle in self.cycles.items():
+            fleet = self.fleet[line]
+            period = cycle['Time'].iloc[-1]
+            time = request_time[None, :] - rng.uniform(0, 25 / 60, (fleet, 60))
+            starts = self.SERVICE_START + np.arange(fleet) * self.headway(line)
+            phase = np.mod(time - starts[:, None] - rng.normal(0, delay, fleet)[:, None], period)
+            lon = np.interp(phase, cycle['Time'], cycle['Lon']) + rng.normal(0, noise, phase.shape)
+            lat = np.interp(phase, cycle['Time'], cycle['Lat']) + rng.normal(0, noise, phase.shape)
+            jump = rng.random(phase.shape) < jump_probability
+            lon[jump] += rng.choice([-1, 1], jump.sum()) * rng.uniform(0.03, 0.06, jump.sum())
+            lat[jump] += rng.choice([-1, 1], jump.sum()) * rng.uniform(0.02, 0.04, jump.sum())
+            # a stalled ping repeats the last fresh ping of the vehicle
+            fresh = rng.random(phase.shape) >= stall_probability
+            fresh[:, 0] = True
+            last = np.maximum.accumulate(np.where(fresh, minutes[None, :], 0), axis=1)
+            rows = np.arange(fleet)[:, None]
+            columns['Lon'].append(lon[rows, last])
+            columns['Lat'].append(lat[rows, last])
+            columns['Time'].append(time[rows, last])
+            columns['Lines'].append(np.full((fleet, 60), line))
+            columns['VehicleNumber'].append(np.repeat([str(1000 + vehicle + v) for v in range(fleet)], 60)
+                                            .reshape(fleet, 60))
+            columns['Brigade'].append(np.repeat([str(v + 1) for v in range(fleet)], 60).reshape(fleet, 60))
+            vehicle += fleet
+
+        # one row per minute, one column per vehicle
+        frame = {name: np.concatenate(values).T for name, values in columns.items()}
+        base = pd.Timestamp(date)
+        times = (base + pd.to_timedelta(np.round(frame['Time'].ravel() * 60), unit='s')).strftime('%Y-%m-%d %H:%M:%S')
+        times = np.asarray(times).reshape(frame['Time'].shape)
+        snapshots = []
+        for minute in minutes:
+            result = [
+                {'Lines': line, 'Lon': float(lon), 'VehicleNumber': number, 'Time': time, 'Lat': float(lat),
+                 'Brigade': brigade}
+                for line, lon, number, time, lat, brigade in zip(
+                    frame['Lines'][minute], np.round(frame['Lon'][minute], 6), frame['VehicleNumber'][minute],
+                    times[minute], np.round(frame['Lat'][minute], 6), frame['Brigade'][minute]
+                )
+            ]
+            request = base + pd.Timedelta(minutes=hour * 60 + int(minute), seconds=30)
+            snapshots.append({'request_time': request.strftime('%Y-%m-%d %H:%M:%S'), 'result': result})
+        return snapshots
+
+    def live_data(self, hours: list[int], **params) -> pd.DataFrame:
+        """
+        Generates live data in the format returned by LiveParser.
+        :param hours: hours of the day.
+        :param params: parameters of snapshots.
+        :return: dataframe with live bus data.
+        """
+        return LiveParser.to_frame([s for hour in hours for s in self.snapshots(hour, **params)])
+
+    def write_archive(self, filename: str, hours: list[int], indent: int = 4, **params):
+        """
+        Writes a live data archive in the format written by RequestHandler.
+        :param filename: path to the output file.
+        :param hours: hours of the day.
+        :param indent: indentation of the json file.
+        :param params: parameters of snapshots.
+        :return: None
+        """
+        with open(filename, 'w') as f:
+            json.dump([s for hour in hours for s in self.snapshots(hour, **params)], f, indent=indent)
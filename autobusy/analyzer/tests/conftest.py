@@ -0,0 +1,64 @@
+"""
+Fixtures shared by the tests of the analyzer.
+"""
+from autobusy.analyzer.analyzer import RouteData
+import pandas as pd
+import json
+import pytest
+
+
+@pytest.fixture
+def make_line_data():
+    def make(lines: list[str]) -> tuple[pd.DataFrame, RouteData]:
+        stops = {}
+        line_route_info = {}
+        line_timetable_info = {}
+        rows = []
+        for line_number, line in enumerate(lines):
+            route = [f'{line_number}{stop}0001' for stop in range(5)]
+            for stop_number, stop in enumerate(route):
+                stops[stop] = {'Name': stop, 'Lon': 21.0 + 0.01 * stop_number, 'Lat': 52.2 + 0.01 * line_number}
+            line_route_info[line] = [route]
+            line_timetable_info[line] = {stop: [f'7:{10 + 5 * stop_number}'] for stop_number, stop in enumerate(route)}
+            for minute in range(10, 35):
+                position = min((minute - 10) / 5, 4)
+                rows.append({
+                    'Lines': line,
+                    'VehicleNumber': f'{line_number}00',
+                    'Lon': 21.0 + 0.01 * position,
+                    'Lat': 52.2 + 0.01 * line_number,
+                    'Time': pd.Timestamp(f'2024-01-29 07:{minute + line_number % 2}:00'),
+                    'RequestTime': pd.Timestamp(f'2024-01-29 07:{minute}:30'),
+                })
+        stop_info = pd.DataFrame.from_dict(stops, orient='index')
+        return pd.DataFrame(rows), RouteData(stop_info, line_route_info, line_timetable_info)
+
+    return make
+
+
+@pytest.fixture
+def archive(tmp_path) -> tuple[list[str], pd.DataFrame]:
+    # 10 minutes of snapshots of 5 vehicles of line 1 on one day, split into two files,
+    # and the live data in the files
+    rows = []
+    snapshots = []
+    for minute in range(10):
+        request_time = f'2024-01-29 07:{minute:02d}:30'
+        result = [{
+            'Lines': '1',
+            'VehicleNumber': str(vehicle),
+            'Brigade': '1',
+            'Lon': 21.0 + 0.01 * vehicle * minute,
+            'Lat': 52.2 + 0.001 * vehicle,
+            'Time': f'2024-01-29 07:{minute:02d}:00',
+        } for vehicle in range(1, 6)]
+        snapshots.append({'request_time': request_time, 'result': result})
+        rows += [dict(record, RequestTime=request_time) for record in result]
+    filenames = [str(tmp_path / 'day1.json'), str(tmp_path / 'day2.json')]
+    for filename, part in zip(filenames, [snapshots[:4], snapshots[4:]]):
+        with open(filename, 'w') as f:
+            json.dump(part, f, indent=4)
+    live_bus_df = pd.DataFrame(rows)
+    live_bus_df['Time'] = pd.to_datetime(live_bus_df['Time'])
+    live_bus_df['RequestTime'] = pd.to_datetime(live_bus_df['RequestTime'])
+    return filenames, live_bus_df
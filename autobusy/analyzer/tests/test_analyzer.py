@@ -1,4 +1,6 @@
 from autobusy.analyzer.analyzer import Analyzer, Results
+from autobusy.analyzer.synthetic import SyntheticNetwork, SCALES
+import numpy as np
 import pytest
 
 
@@ -23,3 +25,15 @@ import pytest
 ])
 def test_get_max_opposite_routes(routes, expectation):
     assert Analyzer.get_max_opposite_routes(routes) == expectation
+
+
+def test_punctuality_on_synthetic_network():
+    # delays of the vehicles of the generator have a standard deviation of 2 minutes
+    network = SyntheticNetwork(**SCALES['small'])
+    analyzer = Analyzer(8)
+    analyzer.create_punctuality_data(network.live_data([8]), network.route_data())
+    punctuality_data = analyzer.results.punctuality_data
+    dropped = analyzer.results.boundary_inaccuracy_count
+    signed = np.where(punctuality_data['Comment'] == 'Early', -1, 1) * punctuality_data['Difference']
+    assert punctuality_data.shape[0] >= 0.9 * (punctuality_data.shape[0] + dropped)
+    assert signed.std() < 2.5
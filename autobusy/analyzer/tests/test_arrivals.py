@@ -0,0 +1,100 @@
+from autobusy.analyzer.arrivals import ArrivalTable
+import pandas as pd
+import numpy as np
+import pytest
+
+
+def trip(line, vehicle, stops, times, direction=0):
+    times = pd.to_datetime([f'2024-01-29 {x}' for x in times]).to_numpy().astype(np.int64)
+    return line, direction, vehicle, 'b' + vehicle, np.array(stops, dtype=object), times, np.arange(len(stops)) * 0.5
+
+
+@pytest.fixture
+def table():
+    return ArrivalTable.from_trips([
+        trip('1', 'v2', ['a', 'b'], ['07:10:00', '07:12:00']),
+        trip('1', 'v1', ['a', 'b'], ['07:00:00', '07:02:00']),
+        trip('1', 'v3', ['a', 'b'], ['07:11:00', '07:13:00']),
+        trip('2', 'v4', ['a'], ['07:05:00']),
+        trip('1', 'v5', ['a'], ['07:20:00']),
+    ], lines=['1', '2', '3'])
+
+
+def test_sorted_and_indexed(table):
+    assert table.events['Stop'].is_monotonic_increasing
+    assert table.lines == ['1', '2', '3']
+    arrivals = table.arrivals('1', 'a')
+    assert arrivals['VehicleNumber'].tolist() == ['v1', 'v2', 'v3', 'v5']
+    assert arrivals['Brigade'].tolist() == ['bv1', 'bv2', 'bv3', 'bv5']
+    assert table.arrivals('3', 'a').empty
+    assert table.to_stop_arrival_info() == {
+        '1': {'a': ['07:00', '07:10', '07:11', '07:20'], 'b': ['07:02', '07:12', '07:13']},
+        '2': {'a': ['07:05']},
+        '3': {},
+    }
+
+
+def test_headways(table):
+    headways = table.headways()
+    assert headways.loc[(headways['Line'] == '1') & (headways['Stop'] == 'a'), 'Headway'].tolist()[1:] == \
+        [10, 1, 9]
+    # the first arrival of every line at every stop has no headway
+    assert headways['Headway'].isna().sum() == 3
+
+
+@pytest.mark.parametrize(
+    "ratio,min_headway,expected",
+    [
+        (0.25, None, [('a', 'v3'), ('b', 'v3')]),
+        (0.01, None, []),
+        (0.25, 10, [('a', 'v3'), ('a', 'v5'), ('b', 'v3')]),
+    ],
+)
+def test_bunching(table, ratio, min_headway, expected):
+    bunched = table.bunching(ratio, min_headway)
+    assert list(zip(bunched['Stop'], bunched['VehicleNumber'])) == expected
+
+
+@pytest.mark.parametrize(
+    "line,stop,minute,expected",
+    [
+        ('1', 'a', 7 * 60 + 4, 'v1'),
+        ('1', 'a', 7 * 60 + 15, 'v3'),
+        ('1', 'a', 7 * 60 + 16, 'v5'),
+        ('1', 'a', 23 * 60, 'v5'),
+        ('1', 'a', 0, 'v1'),
+        # ties go to the earlier arrival
+        ('1', 'a', 7 * 60 + 5, 'v1'),
+        ('2', 'a', 7 * 60 + 30, 'v4'),
+        ('2', 'b', 7 * 60, None),
+        ('3', 'a', 7 * 60, None),
+    ],
+)
+def test_closest(table, line, stop, minute, expected):
+    index = table.closest([line], [stop], np.array([minute]))[0]
+    assert (table.events['VehicleNumber'].iloc[index] if index >= 0 else None) == expected
+
+
+def test_closest_on_days():
+    day = [trip('1', 'v1', ['a'], ['07:00:00']), trip('1', 'v2', ['a'], ['07:30:00'])]
+    next_day = (('1', 0, 'v3', 'bv3', np.array(['a'], dtype=object),
+                 pd.to_datetime(['2024-01-30 07:10:00']).to_numpy().astype(np.int64), np.zeros(1)),)
+    table = ArrivalTable.from_trips(day + list(next_day))
+    first, second = table.days()
+    assert second - first == 1
+    index = table.closest(['1'] * 4, ['a'] * 4, np.array([7 * 60 + 10, 7 * 60 + 10, 7 * 60 + 25, 0]),
+                          np.array([first, second, second, second + 5]))
+    assert table.events['VehicleNumber'].iloc[index].tolist() == ['v1', 'v3', 'v3', 'v3']
+    # without days the arrival of the next day is the closest in the time of day
+    assert table.events['VehicleNumber'].iloc[table.closest(['1'], ['a'], np.array([7 * 60 + 10]))].tolist() == \
+        ['v3']
+
+
+def test_concat():
+    first = ArrivalTable.from_trips([trip('1', 'v1', ['a'], ['07:00:00'])], lines=['1'])
+    second = ArrivalTable.from_trips([trip('1', 'v2', ['a'], ['06:59:00'])], lines=['2'])
+    merged = ArrivalTable.concat([first, second, ArrivalTable()])
+    assert merged.lines == ['1', '2']
+    assert merged.arrivals('1', 'a')['VehicleNumber'].tolist() == ['v2', 'v1']
+    assert merged == ArrivalTable.concat([second, first])
+    assert len(ArrivalTable.concat([])) == 0
@@ -0,0 +1,52 @@
+from autobusy.analyzer.cache import ResultsCache, MISSING
+from autobusy.analyzer.analyzer import Analyzer
+import pandas as pd
+import os
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = ResultsCache(str(tmp_path))
+    assert cache.get('key') is MISSING
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    cache.put('key', (df, 5))
+    value = cache.get('key')
+    assert value[0].equals(df) and value[1] == 5
+    assert ResultsCache(str(tmp_path), version='other').get('key') is MISSING
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultsCache(str(tmp_path), max_bytes=10 ** 9)
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, b'x' * 1000)
+        os.utime(cache.path(key), (i, i))
+    cache.get('a')
+    cache.max_bytes = 2500
+    cache.evict()
+    assert cache.get('b') is MISSING
+    assert cache.get('a') is not MISSING
+    assert cache.get('c') is not MISSING
+
+
+def test_analyzer_loads_cached_results(tmp_path):
+    live_bus_df = pd.DataFrame({
+        'VehicleNumber': ['1', '1', '1'],
+        'Lon': [21.0, 21.01, 21.02],
+        'Lat': [52.2, 52.2, 52.2],
+        'Time': pd.to_datetime(['2024-01-29 07:00:00', '2024-01-29 07:01:00', '2024-01-29 08:02:00']),
+        'RequestTime': pd.to_datetime(['2024-01-29 07:00:30', '2024-01-29 07:01:30', '2024-01-29 08:02:30']),
+    })
+    analyzer = Analyzer(7, ResultsCache(str(tmp_path)))
+    analyzer.create_distance_data(live_bus_df)
+
+    other_hour = pd.DataFrame({
+        'VehicleNumber': ['2'],
+        'Lon': [21.0],
+        'Lat': [52.2],
+        'Time': pd.to_datetime(['2024-01-29 09:00:00']),
+        'RequestTime': pd.to_datetime(['2024-01-29 09:00:30']),
+    })
+    analyzer = Analyzer(7, ResultsCache(str(tmp_path)))
+    # the stage must not be computed again
+    analyzer.executor.stages['distance'].func = None
+    analyzer.create_distance_data(pd.concat([live_bus_df, other_hour]))
+    assert list(analyzer.results.distance_data['VehicleNumber']) == ['1']
@@ -0,0 +1,77 @@
+from autobusy.analyzer.analyzer import Analyzer
+from autobusy.analyzer.chunked import ChunkedAnalyzer
+from autobusy.analyzer.arrivals import ArrivalTable
+from autobusy.analyzer.synthetic import SyntheticNetwork
+import pandas as pd
+import numpy as np
+
+
+def test_analyze_matches_batch(archive):
+    filenames, live_bus_df = archive
+    batch = Analyzer(7)
+    batch.create_places_speed_data(live_bus_df)
+    batch.create_longest_routes(live_bus_df, 2)
+
+    results = ChunkedAnalyzer(7, partitions=3, snapshots_per_chunk=3).analyze(filenames, count=2,
+                                                                              keep_speed_data=True)
+    assert results.speed_data.equals(batch.results.speed_data)
+    assert results.places_speed_data.equals(batch.results.places_speed_data)
+    assert results.distance_data['VehicleNumber'].tolist() == batch.results.distance_data['VehicleNumber'].tolist()
+    assert np.allclose(results.distance_data['Distance'], batch.results.distance_data['Distance'])
+    longest = results.longest_routes.sort_values(['VehicleNumber', 'Time']).reset_index(drop=True)
+    assert longest.equals(batch.results.longest_routes.sort_values(['VehicleNumber', 'Time']).reset_index(drop=True))
+
+
+def test_stream(archive):
+    filenames, live_bus_df = archive
+    batch = Analyzer(7)
+    batch.create_distance_data(live_bus_df)
+    results = ChunkedAnalyzer(7, snapshots_per_chunk=3).stream(filenames)
+    assert np.allclose(results.distance_data['Distance'], batch.results.distance_data['Distance'])
+
+
+def test_concat_arrival_tables():
+    def table(line, stop, times):
+        return ArrivalTable.from_trips([(line, 0, 'v', None, np.array([stop] * len(times)),
+                                         pd.to_datetime(times).to_numpy().astype(np.int64), np.zeros(len(times)))])
+
+    merged = ArrivalTable.concat([
+        ArrivalTable.concat([table('2', 'a', ['2024-01-01 07:01']), table('1', 'a', ['2024-01-01 07:03'])]),
+        table('1', 'a', ['2024-01-01 07:02']),
+        table('1', 'b', ['2024-01-01 07:04']),
+    ])
+    assert merged.to_stop_arrival_info() == {'1': {'a': ['07:02', '07:03'], 'b': ['07:04']}, '2': {'a': ['07:01']}}
+    assert list(merged.to_stop_arrival_info()) == ['1', '2']
+
+
+def test_days_are_analyzed_separately(tmp_path):
+    network = SyntheticNetwork(lines=3, stops=60, vehicles=9)
+    route_data = network.route_data()
+    filenames, days = [], []
+    for date, delay in [('2024-01-29', 2.0), ('2024-01-30', 4.0)]:
+        filenames.append(str(tmp_path / f'{date}.json'))
+        network.write_archive(filenames[-1], [8], delay=delay, date=date)
+        day = Analyzer(8)
+        live_bus_df = network.live_data([8], delay=delay, date=date)
+        day.create_speed_data(live_bus_df)
+        day.create_distance_data(live_bus_df)
+        day.create_punctuality_data(live_bus_df, route_data)
+        days.append(day.results)
+
+    distance = pd.concat([day.distance_data for day in days]).groupby('VehicleNumber')['Distance'].sum()
+    speeds = np.sort(pd.concat([day.speed_data['Speed'] for day in days]))
+    punctuality = pd.concat([day.punctuality_data for day in days], ignore_index=True)
+    results = ChunkedAnalyzer(8, partitions=3, snapshots_per_chunk=7).analyze(filenames, route_data,
+                                                                              keep_speed_data=True)
+    assert np.allclose(results.distance_data.set_index('VehicleNumber')['Distance'], distance)
+    assert np.allclose(np.sort(results.speed_data['Speed']), speeds)
+    assert results.punctuality_data.equals(punctuality)
+    assert results.boundary_inaccuracy_count == sum(day.boundary_inaccuracy_count for day in days)
+
+    streamed = [ChunkedAnalyzer(8, snapshots_per_chunk=7).stream([filename], route_data) for filename in filenames]
+    results = ChunkedAnalyzer(8, snapshots_per_chunk=7).stream(filenames, route_data)
+    assert np.allclose(results.distance_data.set_index('VehicleNumber')['Distance'],
+                       pd.concat([day.distance_data for day in streamed]).groupby('VehicleNumber')['Distance'].sum())
+    assert np.allclose(np.sort(results.speed_data['Speed']),
+                       np.sort(pd.concat([day.speed_data['Speed'] for day in streamed])))
+    assert results.punctuality_data.equals(pd.concat([day.punctuality_data for day in streamed], ignore_index=True))
@@ -0,0 +1,85 @@
+from autobusy.analyzer import columnar
+from autobusy.analyzer.synthetic import SyntheticNetwork
+from autobusy.analyzer.analyzer import Analyzer, Results
+import pandas as pd
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope='module')
+def results():
+    network = SyntheticNetwork(lines=5, stops=100, vehicles=20)
+    live_bus_df = network.live_data([8])
+    route_data = network.route_data()
+    analyzer = Analyzer(8, trace=True, trace_memory=False)
+    analyzer.create_places_speed_data(live_bus_df)
+    analyzer.create_places_speed_pyramid(live_bus_df, (0.01, 0.02))
+    analyzer.create_stop_punctuality_data(live_bus_df, route_data, 3)
+    analyzer.create_sketches(live_bus_df, route_data, k=100)
+    analyzer.create_longest_routes(live_bus_df, 2)
+    return analyzer.results
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_roundtrip(results, tmp_path, mmap):
+    results.save(str(tmp_path), 'npy')
+    loaded = Results.load(str(tmp_path), mmap)
+    for attribute in columnar.FRAMES:
+        if getattr(results, attribute) is None:
+            assert getattr(loaded, attribute) is None
+        else:
+            pd.testing.assert_frame_equal(getattr(loaded, attribute), getattr(results, attribute))
+    assert list(loaded.speed_data.columns).count('Time') == 2
+    assert loaded.stop_info.index.name == 'ID'
+    assert loaded.places_grid.resolution == results.places_grid.resolution
+    assert list(loaded.places_speed_pyramid) == [0.01, 0.02]
+    assert loaded.places_speed_pyramid[0.02][0].equals(results.places_speed_pyramid[0.02][0])
+    assert loaded.boundary_inaccuracy_count == results.boundary_inaccuracy_count
+    assert loaded.punctuality_cube == results.punctuality_cube
+    assert loaded.get_punctuality_cube() is loaded.punctuality_cube
+    assert loaded.arrival_data.events.equals(results.arrival_data.events)
+    assert loaded.arrival_data.lines == results.arrival_data.lines
+    assert loaded.bunching().equals(results.bunching())
+    assert loaded.delay_sketches.quantiles([0.5], 'line').equals(results.delay_sketches.quantiles([0.5], 'line'))
+    assert loaded.trace.summary().equals(results.trace.summary())
+    assert loaded.punctuality_counts([1, 3], hours=[8]).equals(results.punctuality_counts([1, 3], hours=[8]))
+    assert loaded.speed_data['Speed'].to_numpy().flags.writeable != mmap
+
+
+def test_feather_roundtrip(results, tmp_path):
+    pytest.importorskip('pyarrow')
+    results.save(str(tmp_path), 'feather')
+    loaded = Results.load(str(tmp_path))
+    pd.testing.assert_frame_equal(loaded.speed_data, results.speed_data)
+    pd.testing.assert_frame_equal(loaded.stop_info, results.stop_info)
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        pd.DataFrame({'Line': ['1', None, '523'], 'Time': pd.to_datetime(['2024-01-29 08:00'] * 3),
+                      'Count': [1, 2, 3], 'Late': [True, False, True]}),
+        pd.DataFrame({'Stop': pd.Series([], dtype=object), 'Total': pd.Series([], dtype=np.int64)}),
+        pd.DataFrame({'Lon': [1.5, 2.5]}, index=pd.Index(['a', 'b'], name='ID')),
+        pd.DataFrame({'Lon': [1.5, 2.5]}, index=[3, 7]),
+        pd.DataFrame(index=range(4)),
+    ],
+)
+def test_frame_roundtrip(frame, tmp_path):
+    description = columnar.write_frame(frame, str(tmp_path), 'frame', 'npy')
+    pd.testing.assert_frame_equal(columnar.read_frame(str(tmp_path), description, 'npy'), frame)
+
+
+def test_missing_strings(tmp_path):
+    frame = pd.DataFrame({'Line': ['1', None, np.nan]})
+    description = columnar.write_frame(frame, str(tmp_path), 'frame', 'npy')
+    assert columnar.read_frame(str(tmp_path), description, 'npy')['Line'].tolist() == ['1', None, None]
+
+
+def test_unsupported_data(tmp_path):
+    with pytest.raises(TypeError):
+        columnar.write_frame(pd.DataFrame({'Value': ['a', 1]}), str(tmp_path), 'frame', 'npy')
+    with pytest.raises(ValueError):
+        Results().save(str(tmp_path), 'csv')
+    Results().save(str(tmp_path), 'npy')
+    assert Results.load(str(tmp_path)).speed_data is None
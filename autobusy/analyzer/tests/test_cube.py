@@ -0,0 +1,104 @@
+from autobusy.analyzer.cube import PunctualityCube
+from autobusy.analyzer.analyzer import Results
+import pandas as pd
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def punctuality_data():
+    rng = np.random.default_rng(0)
+    size = 500
+    signed = rng.integers(-8, 12, size)
+    return pd.DataFrame({
+        'Line': rng.choice(['1', '2', '10', '523'], size),
+        'Stop': rng.choice(['100101', '100102', '200201'], size),
+        'Departure': [f'{hour}:{minute:02d}' for hour, minute in zip(rng.choice([7, 8], size),
+                                                                    rng.integers(0, 60, size))],
+        'Closest': '00:00',
+        'Difference': np.abs(signed).astype(float),
+        'Comment': np.where(signed < 0, 'Early', np.where(signed > 0, 'Late', 'On time')),
+    })
+
+
+def results_of(punctuality_data):
+    results = Results()
+    results.punctuality_data = punctuality_data
+    return results
+
+
+@pytest.mark.parametrize("tol", [-1, 0, 3, 5, 20])
+def test_stop_punctuality(punctuality_data, tol):
+    expected = punctuality_data.groupby('Stop').apply(
+        lambda x: pd.Series([x.shape[0], x[(x['Difference'] > tol) & (x['Comment'] == 'Late')].shape[0]],
+                            index=['Total', 'Late']), include_groups=False).reset_index()
+    stop_punctuality = PunctualityCube.from_punctuality(punctuality_data).stop_punctuality(tol)
+    pd.testing.assert_frame_equal(stop_punctuality, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize(
+    "lines,stops,hours",
+    [
+        (None, None, None),
+        (['1'], None, None),
+        (['10', '523'], ['100101'], None),
+        (None, ['200201'], [8]),
+        (['unknown'], None, None),
+    ],
+)
+def test_punctuality_counts(punctuality_data, lines, stops, hours):
+    cube = PunctualityCube.from_punctuality(punctuality_data)
+    hour = punctuality_data['Departure'].str.split(':').str[0].astype(int)
+    selected = punctuality_data[
+        (punctuality_data['Line'].isin(lines) if lines is not None else np.ones(hour.shape[0], dtype=bool)) &
+        (punctuality_data['Stop'].isin(stops) if stops is not None else np.ones(hour.shape[0], dtype=bool)) &
+        (hour.isin(hours) if hours is not None else np.ones(hour.shape[0], dtype=bool))
+    ]
+    expected = results_of(selected.reset_index(drop=True)).punctuality_counts([1, 3, 5])
+    pd.testing.assert_frame_equal(cube.punctuality_counts([1, 3, 5], lines, stops, hours), expected,
+                                  check_dtype=False)
+    assert results_of(punctuality_data).punctuality_counts([1, 3, 5], lines, stops, hours).equals(
+        cube.punctuality_counts([1, 3, 5], lines, stops, hours))
+
+
+def test_summary(punctuality_data):
+    signed = punctuality_data['Difference'].where(punctuality_data['Comment'] != 'Early',
+                                                  -punctuality_data['Difference'])
+    expected = punctuality_data.assign(
+        Signed=signed, Early=punctuality_data['Comment'] == 'Early', Late=punctuality_data['Comment'] == 'Late'
+    ).groupby('Line').agg(
+        Total=('Signed', 'size'), Early=('Early', 'sum'), Late=('Late', 'sum'), MeanDifference=('Signed', 'mean')
+    ).reset_index()
+    summary = PunctualityCube.from_punctuality(punctuality_data).summary('Line')
+    pd.testing.assert_frame_equal(summary, expected, check_dtype=False)
+    hours = PunctualityCube.from_punctuality(punctuality_data).summary('Hour', lines=['1'])
+    assert hours['Hour'].tolist() == [7, 8]
+    assert hours['Total'].sum() == (punctuality_data['Line'] == '1').sum()
+
+
+def test_merge_and_save(punctuality_data, tmp_path):
+    first = PunctualityCube.from_punctuality(punctuality_data.iloc[:200])
+    second = PunctualityCube.from_punctuality(punctuality_data.iloc[200:])
+    merged = PunctualityCube.merge([first, second, PunctualityCube.empty()])
+    assert merged == PunctualityCube.from_punctuality(punctuality_data)
+    assert merged.counts.sum() == punctuality_data.shape[0]
+    merged.save(str(tmp_path / 'cube.npz'))
+    assert PunctualityCube.load(str(tmp_path / 'cube.npz')) == merged
+    assert PunctualityCube.merge([]) == PunctualityCube.empty()
+
+
+def test_empty_cube():
+    cube = PunctualityCube.empty()
+    assert cube.stop_punctuality(5).empty
+    assert cube.summary('Line').empty
+    assert cube.punctuality_counts([1, 3])['Count'].tolist() == [0] * 5
+
+
+def test_results_cube_cache(punctuality_data):
+    results = results_of(punctuality_data)
+    cube = results.get_punctuality_cube()
+    assert results.get_punctuality_cube() is cube
+    results.punctuality_data = punctuality_data.iloc[:10]
+    assert results.get_punctuality_cube().counts.sum() == 10
+    with pytest.raises(ValueError, match='Punctuality data not created'):
+        Results().get_punctuality_cube()
@@ -0,0 +1,55 @@
+from autobusy.analyzer.analyzer import RouteData
+from autobusy.analyzer.delay import DelayEstimator, LineModel
+import pandas as pd
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def route_data():
+    stop_info = pd.DataFrame({'Lon': [21.0, 21.03, 21.06, 21.06, 21.03, 21.0],
+                              'Lat': [52.2, 52.2, 52.2, 52.2001, 52.2001, 52.2001]},
+                             index=['000101', '000201', '000301', '000302', '000202', '000102'])
+    line_route_info = {'1': [['000101', '000201', '000301'], ['000302', '000202', '000102']]}
+    line_timetable_info = {'1': {'000201': ['7:03', '7:30'], '000301': ['7:05'], '000202': ['7:12'],
+                                 '000102': ['23:59']}}
+    return RouteData(stop_info, line_route_info, line_timetable_info)
+
+
+def poll(lon: float, time: str) -> dict:
+    return {
+        'request_time': time,
+        'result': [
+            {'Lines': '1', 'VehicleNumber': '10', 'Lon': lon, 'Lat': 52.2, 'Time': time},
+            {'Lines': '99', 'VehicleNumber': '11', 'Lon': lon, 'Lat': 52.2, 'Time': time},
+        ]
+    }
+
+
+@pytest.mark.parametrize("stop, minute_of_day, expectation", [
+    ('000201', 7 * 60 + 5, 2),
+    ('000201', 7 * 60 + 20, -10),
+    ('000102', 1, 2),
+    ('000101', 0, np.nan),
+])
+def test_closest_departure(route_data, stop, minute_of_day, expectation):
+    result = LineModel('1', route_data).closest_departure(stop, minute_of_day)
+    assert result == expectation or (np.isnan(result) and np.isnan(expectation))
+
+
+def test_delay_estimator(route_data):
+    estimator = DelayEstimator(route_data)
+    for minute, lon in [(0, 21.0), (2, 21.02), (4, 21.04), (4, 21.04), (6, 21.06), (10, 21.04), (14, 21.0)]:
+        estimator.update(poll(lon, f'2024-01-29 07:{minute:02d}:00'))
+
+    snapshot = estimator.snapshot().set_index('Stop')
+    assert snapshot.loc['000201', 'Delay'] == pytest.approx(0)
+    assert snapshot.loc['000301', 'Delay'] == pytest.approx(1)
+    assert snapshot.loc['000202', 'Delay'] == pytest.approx(-1)
+    assert list(estimator.snapshot(stops=['000301'])['Stop']) == ['000301']
+
+    vehicles = estimator.vehicle_snapshot()
+    assert list(vehicles['VehicleNumber']) == ['10']
+    assert vehicles['Direction'].iloc[0] == 1
+    assert vehicles['LastStop'].iloc[0] == '000202'
+    assert list(estimator.line_delays()['Line']) == ['1']
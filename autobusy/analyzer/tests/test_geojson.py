@@ -0,0 +1,56 @@
+import autobusy.analyzer.geojson as geojson
+from autobusy.analyzer.grid import Grid
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize('lon, lat, tolerance, expected', [
+    ([21.0, 21.001, 21.002], [52.2, 52.2, 52.2], 0.001, [True, False, True]),
+    ([21.0, 21.001, 21.002], [52.2, 52.201, 52.2], 0.001, [True, True, True]),
+    ([21.0, 21.001, 21.002], [52.2, 52.201, 52.2], 1, [True, False, True]),
+    ([21.0, 21.001], [52.2, 52.2], 1, [True, True]),
+    ([21.0, 21.0, 21.0], [52.2, 52.2, 52.2], 0.001, [True, False, True]),
+])
+def test_simplify(lon, lat, tolerance, expected):
+    assert geojson.simplify(lon, lat, tolerance).tolist() == expected
+
+
+def test_simplify_tolerance():
+    rng = np.random.default_rng(0)
+    lon = 21 + np.cumsum(rng.normal(0, 1e-4, 1000))
+    lat = 52.2 + np.cumsum(rng.normal(0, 1e-4, 1000))
+    keep = geojson.simplify(lon, lat, 0.01)
+    assert keep[0] and keep[-1] and keep.sum() < 1000
+    # every removed point is within the tolerance of the segment between its kept neighbours
+    kept = np.flatnonzero(keep)
+    x = np.radians(lon) * np.cos(np.radians(lat.mean())) * 6373.0
+    y = np.radians(lat) * 6373.0
+    for a, b in zip(kept[:-1], kept[1:]):
+        for i in range(a + 1, b):
+            d = np.array([x[b] - x[a], y[b] - y[a]])
+            p = np.array([x[i] - x[a], y[i] - y[a]])
+            t = np.clip(p @ d / (d @ d), 0, 1)
+            assert np.hypot(*(p - t * d)) <= 0.01 + 1e-12
+
+
+def test_lines():
+    collection = geojson.lines([21.0, 21.001, 21.002, 21.1, 21.2], [52.2, 52.2, 52.2, 52.3, 52.3],
+                               ['a', 'a', 'a', 'b', 'b'], pd.DataFrame({'Lines': ['1', '2']}), tolerance=0.001)
+    assert [f['geometry']['coordinates'] for f in collection['features']] == [
+        [[21.0, 52.2], [21.002, 52.2]], [[21.1, 52.3], [21.2, 52.3]]
+    ]
+    assert [f['properties'] for f in collection['features']] == [{'Lines': '1'}, {'Lines': '2'}]
+    assert len(geojson.lines([21.0, 21.001, 21.002], [52.2] * 3, ['a'] * 3)['features'][0]['geometry']
+               ['coordinates']) == 3
+    assert geojson.lines([], [], [])['features'] == []
+
+
+@pytest.mark.parametrize('hexagonal', [False, True])
+def test_polygons(hexagonal):
+    cell_grid = Grid(0.01, hexagonal)
+    collection = geojson.polygons(cell_grid.polygons([21.0, 21.1], [52.2, 52.3]),
+                                  pd.DataFrame({'Total': [3, 4]}))
+    ring = collection['features'][1]['geometry']['coordinates'][0]
+    np.testing.assert_allclose([[lat, lon] for lon, lat in ring], cell_grid.polygon(21.1, 52.3))
+    assert collection['features'][1]['properties'] == {'Total': 4}
@@ -0,0 +1,51 @@
+from autobusy.analyzer.grid import Grid
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize("i, j", [
+    ([0, 1, -1, 2 ** 31 - 1, -2 ** 31], [0, -1, 1, -2 ** 31, 2 ** 31 - 1]),
+])
+def test_encode_decode(i, j):
+    decoded = Grid.decode(Grid.encode(np.array(i), np.array(j)))
+    assert list(decoded[0]) == i and list(decoded[1]) == j
+
+
+def test_square_cells_match_rounding():
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(20.8, 21.2, 1000)
+    lat = rng.uniform(52.1, 52.4, 1000)
+    cell_lon, cell_lat = Grid(0.01).centers(Grid(0.01).cells(lon, lat))
+    assert np.allclose(cell_lon, np.round(lon, 2)) and np.allclose(cell_lat, np.round(lat, 2))
+
+
+def test_hexagonal_cells_contain_points():
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(20.8, 21.2, 1000)
+    lat = rng.uniform(52.1, 52.4, 1000)
+    grid = Grid(0.01, hexagonal=True)
+    cell_lon, cell_lat = grid.centers(grid.cells(lon, lat))
+    # distance to the center of the cell is at most the circumradius
+    dist = np.hypot((cell_lon - lon) * grid.scale, cell_lat - lat)
+    assert dist.max() <= grid.radius + 1e-12
+    # and no other cell center is closer
+    neighbours = [(1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)]
+    i, j = Grid.decode(grid.cells(lon, lat))
+    for di, dj in neighbours:
+        other_lon, other_lat = grid.centers(Grid.encode(i + di, j + dj))
+        assert (np.hypot((other_lon - lon) * grid.scale, other_lat - lat) >= dist - 1e-12).all()
+
+
+@pytest.mark.parametrize("hexagonal, vertices", [(False, 5), (True, 7)])
+def test_polygon(hexagonal, vertices):
+    polygon = Grid(0.01, hexagonal).polygon(21.0, 52.2)
+    assert len(polygon) == vertices and polygon[0] == polygon[-1]
+
+
+def test_count():
+    result = Grid(0.01).count(np.array([21.0, 21.001, 21.02, 20.999]), np.array([52.2, 52.2, 52.2, 52.2]),
+                              {'Fast': np.array([True, False, True, True])})
+    expectation = pd.DataFrame({'Lon': [21.0, 21.02], 'Lat': [52.2, 52.2], 'Total': [3, 1], 'Fast': [2, 1]})
+    assert np.allclose(result[['Lon', 'Lat']], expectation[['Lon', 'Lat']])
+    assert (result[['Total', 'Fast']].values == expectation[['Total', 'Fast']].values).all()
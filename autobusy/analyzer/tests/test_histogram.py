@@ -0,0 +1,65 @@
+from autobusy.analyzer.histogram import Histogram
+from autobusy.analyzer.analyzer import Results
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize('values, delimiters, expected', [
+    ([5, 15, 25, 60], [0, 10, 50], [1, 2, 1]),
+    ([0, 10, 10, 50, np.nan], [0, 10, 50], [1, 2, 1]),
+    ([-1, 3, 100], [5], [1]),
+    ([], [0, 1], [0, 0]),
+])
+def test_histogram_counts(values, delimiters, expected):
+    assert Histogram(values).counts(delimiters).tolist() == expected
+
+
+def test_histogram_matches_masks():
+    values = np.random.default_rng(0).exponential(20, 10000)
+    delimiters = [0, 5, 10, 30, 50]
+    expected = [((values >= delimiters[i]) & (values < delimiters[i + 1])).sum() for i in range(len(delimiters) - 1)]
+    expected.append((values >= delimiters[-1]).sum())
+    assert Histogram(values).counts(delimiters).tolist() == expected
+
+
+def test_weighted_histogram():
+    values = np.array([1, 5, np.nan, 3, 12])
+    weights = np.array([2, 1, 7, 4, 3])
+    histogram = Histogram(values, weights)
+    assert histogram.counts([0, 4, 10]).tolist() == Histogram(np.repeat(values, weights)).counts([0, 4, 10]).tolist()
+    assert histogram.below(4) == 6
+    assert histogram.total() == 10
+
+
+def test_histogram_invalid_delimiters():
+    with pytest.raises(ValueError):
+        Histogram([1, 2]).counts([10, 5])
+
+
+def test_results_histogram_cache():
+    results = Results()
+    results.speed_data = pd.DataFrame({'Speed': [5, 15, 25, 60]})
+    histogram = results.histogram('speed_data', 'Speed')
+    assert results.histogram('speed_data', 'Speed') is histogram
+    results.speed_data = pd.DataFrame({'Speed': [5]})
+    assert results.histogram('speed_data', 'Speed') is not histogram
+    assert results.speed_counts([0, 10])['Count'].tolist() == [1, 0]
+
+
+def test_results_histogram_missing_data():
+    with pytest.raises(ValueError, match='Distance data not created'):
+        Results().distance_counts([0, 10])
+
+
+def test_punctuality_counts():
+    results = Results()
+    results.punctuality_data = pd.DataFrame({
+        'Comment': ['Early', 'Early', 'Early', 'On time', 'Late', 'Late', 'Late', 'Late'],
+        'Difference': [1, 3, 5, 0, 1, 2, 3, 5],
+    })
+    counts = results.punctuality_counts([2, 3, 5])
+    assert counts['Comment'].tolist() == ['Early'] * 3 + ['On time'] + ['Late'] * 3
+    assert counts['From'].tolist() == [5, 3, 2, 0, 2, 3, 5]
+    assert counts['Count'].tolist() == [1, 1, 0, 3, 1, 1, 1]
+    assert counts['Count'].sum() == results.punctuality_data.shape[0]
@@ -0,0 +1,135 @@
+from autobusy.analyzer.analyzer import Analyzer, RouteData
+from autobusy.analyzer.incremental import IncrementalState
+from autobusy.analyzer.synthetic import SyntheticNetwork
+from autobusy.analyzer.parser import LiveParser
+import pandas as pd
+import numpy as np
+import pickle
+
+
+def make_live_data() -> pd.DataFrame:
+    rows = []
+    for minute in range(10):
+        for vehicle, speed in [('1', 0.01), ('2', 0.02)]:
+            rows.append({
+                'Lines': '1',
+                'VehicleNumber': vehicle,
+                'Lon': 21.0 + speed * minute,
+                'Lat': 52.2,
+                'Time': pd.Timestamp(f'2024-01-29 07:{minute:02d}:00'),
+                'RequestTime': pd.Timestamp(f'2024-01-29 07:{minute:02d}:30'),
+            })
+    return pd.DataFrame(rows)
+
+
+def test_ingest_matches_batch():
+    live_bus_df = make_live_data()
+    batch = Analyzer(7)
+    batch.create_places_speed_data(live_bus_df)
+    batch.create_distance_data(live_bus_df)
+
+    analyzer = Analyzer(7)
+    for _, snapshot_df in live_bus_df.groupby('RequestTime'):
+        analyzer.ingest(snapshot_df)
+
+    assert np.allclose(np.sort(analyzer.results.speed_data['Speed']), np.sort(batch.results.speed_data['Speed']))
+    assert analyzer.results.distance_data['VehicleNumber'].tolist() == ['1', '2']
+    assert np.allclose(analyzer.results.distance_data['Distance'], batch.results.distance_data['Distance'])
+    places = analyzer.results.places_speed_data.sort_values(['Lon', 'Lat']).reset_index(drop=True)
+    batch_places = batch.results.places_speed_data.sort_values(['Lon', 'Lat']).reset_index(drop=True)
+    assert (places[['Total', 'Fast']].values == batch_places[['Total', 'Fast']].values).all()
+
+
+def test_old_and_repeated_pings_are_ignored():
+    live_bus_df = make_live_data()
+    state = IncrementalState()
+    state.update(live_bus_df[live_bus_df['VehicleNumber'] == '1'])
+    distance = state.distance_data()['Distance'].iloc[0]
+    speed_data = state.update(live_bus_df[live_bus_df['VehicleNumber'] == '1'].iloc[::2])
+    assert speed_data.empty
+    assert state.distance_data()['Distance'].iloc[0] == distance
+
+
+def test_stop_arrivals():
+    stop_info = pd.DataFrame({'Lon': [21.0, 21.03, 21.06], 'Lat': [52.2, 52.2, 52.2]},
+                             index=['000001', '000101', '000201'])
+    route_data = RouteData(stop_info, {'1': [['000001', '000101', '000201']]}, {'1': {}})
+    live_bus_df = make_live_data()
+    live_bus_df = live_bus_df[live_bus_df['VehicleNumber'] == '1']
+    analyzer = Analyzer(7)
+    for _, snapshot_df in live_bus_df.groupby('RequestTime'):
+        analyzer.ingest(snapshot_df, route_data)
+    # the vehicle leaves the first stop at its first ping
+    assert analyzer.results.arrival_data.to_stop_arrival_info() == {
+        '1': {'000001': ['07:00'], '000101': ['07:03'], '000201': ['07:06']}
+    }
+
+
+def test_stop_arrivals_after_jump():
+    stop_info = pd.DataFrame({'Lon': [21.0, 21.03, 21.06, 21.09], 'Lat': [52.2, 52.2, 52.2, 52.2]},
+                             index=['000001', '000101', '000201', '000301'])
+    route_data = RouteData(stop_info, {'1': [['000001', '000101', '000201', '000301']]}, {'1': {}})
+    live_bus_df = make_live_data()
+    live_bus_df = live_bus_df[live_bus_df['VehicleNumber'] == '1'].copy()
+    # a ping a few km off the route between the pings before and after the second stop
+    live_bus_df.loc[live_bus_df['Time'].dt.minute == 3, 'Lat'] += 0.05
+    state = IncrementalState()
+    for _, snapshot_df in live_bus_df.groupby('RequestTime'):
+        state.update(snapshot_df, route_data)
+    assert state.arrival_table().to_stop_arrival_info() == {
+        '1': {'000001': ['07:00'], '000101': ['07:03'], '000201': ['07:06'], '000301': ['07:09']}
+    }
+
+
+def test_ingest_arrivals_match_batch():
+    network = SyntheticNetwork(lines=5, stops=100, vehicles=20)
+    route_data = network.route_data()
+    snapshots = network.snapshots(8, jump_probability=0.01)
+    batch = Analyzer(8)
+    batch.create_punctuality_data(LiveParser.to_frame(snapshots), route_data)
+    analyzer = Analyzer(8)
+    for snapshot in snapshots:
+        analyzer.ingest(LiveParser.to_frame([snapshot]), route_data)
+    expected = batch.results.arrival_data.events
+    events = analyzer.results.arrival_data.events
+
+    def matched(events: pd.DataFrame, other: pd.DataFrame) -> pd.Series:
+        # whether the vehicle arrived at the stop in the other events within 6 minutes: the batch path times
+        # the last stop of a route at the departure after the 5 minute layover, ingest at the arrival
+        key = ['Line', 'Direction', 'VehicleNumber', 'Stop']
+        pairs = events.reset_index().merge(other[key + ['Time']], on=key, how='left', suffixes=('', 'Other'))
+        return ((pairs['TimeOther'] - pairs['Time']).abs() <= pd.Timedelta(minutes=6)).groupby(pairs['index']).any()
+
+    # the batch path also times stops just outside the pings of the first and last minute of the hour
+    inner = expected['Time'].between(pd.Timestamp('2024-01-29 08:01'), pd.Timestamp('2024-01-29 08:59'))
+    assert matched(expected[inner], events).mean() >= 0.98
+    assert matched(events, expected).mean() >= 0.98
+
+
+def test_ingest_defers_concatenation():
+    live_bus_df = make_live_data()
+    analyzer = Analyzer(7)
+    snapshots = [snapshot_df for _, snapshot_df in live_bus_df.groupby('RequestTime')]
+    for snapshot_df in snapshots[:5]:
+        analyzer.ingest(snapshot_df)
+    # updates only append the new records
+    assert len(analyzer.incremental_state.speed_records) == 5
+    assert 'speed_data' not in vars(analyzer.results)
+    speed_data = analyzer.results.speed_data
+    assert analyzer.results.speed_data is speed_data
+    for snapshot_df in snapshots[5:]:
+        analyzer.ingest(snapshot_df)
+    assert len(analyzer.incremental_state.speed_records) == 6
+    assert analyzer.results.speed_data.shape[0] == 18
+    analyzer.ingest(snapshots[-1])
+    restored = pickle.loads(pickle.dumps(analyzer.results))
+    assert restored.speed_data.equals(analyzer.results.speed_data)
+    assert not restored.deferred
+
+
+def test_results_set_over_deferred():
+    analyzer = Analyzer(7)
+    analyzer.ingest(make_live_data())
+    analyzer.results.speed_data = None
+    assert analyzer.results.speed_data is None
+    assert not analyzer.results.deferred
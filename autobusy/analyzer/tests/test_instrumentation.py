@@ -0,0 +1,65 @@
+from autobusy.analyzer.analyzer import Analyzer
+from autobusy.analyzer.parser import LiveParser
+import autobusy.analyzer.instrumentation as instrumentation
+import numpy as np
+import json
+import pickle
+import tracemalloc
+import pytest
+
+
+@instrumentation.traced
+def allocate(values: np.ndarray) -> np.ndarray:
+    return np.ones(1_000_000)[:values.shape[0]]
+
+
+def test_disabled():
+    assert instrumentation.current() is None
+    assert allocate(np.zeros(3)).shape == (3,)
+    assert not tracemalloc.is_tracing()
+    assert Analyzer(7).results.trace is None
+
+
+@pytest.mark.parametrize('memory', [True, False])
+def test_span(memory):
+    tracer = instrumentation.Tracer(memory)
+    with tracer:
+        with tracer.span('outer', 5) as span:
+            allocate(np.zeros(3))
+            span.rows_out = 2
+    assert not tracemalloc.is_tracing()
+    frame = tracer.to_frame()
+    assert frame['name'].tolist() == ['outer', 'allocate']
+    assert frame['rows_in'].tolist() == [5, 3] and frame['rows_out'].tolist() == [2, 3]
+    assert frame['depth'].tolist() == [0, 1] and frame['parent'].tolist() == [None, 'outer']
+    assert (frame['wall'] >= 0).all() and (frame['cpu'] >= 0).all()
+    if memory:
+        assert (frame['peak_memory'] >= 8_000_000).all()
+    else:
+        assert frame['peak_memory'].isna().all()
+
+
+def test_analyzer_trace(tmp_path, archive):
+    filenames, _ = archive
+    analyzer = Analyzer(7, trace=True)
+    with analyzer.tracer:
+        live_bus_df = LiveParser(filenames[0]).parse()
+    analyzer.create_distance_data(live_bus_df)
+    analyzer.longest_routes(live_bus_df, analyzer.results.distance_data, 1)
+
+    frame = analyzer.results.trace.to_frame()
+    assert frame['name'].tolist() == [
+        'LiveParser.__init__', 'LiveParser.parse', 'LiveParser.to_frame',
+        'Analyzer.require', 'Analyzer.distance_data', 'Analyzer.vehicle_pings', 'Analyzer.longest_routes'
+    ]
+    assert frame.loc[frame['name'] == 'LiveParser.parse', 'rows_out'].item() == live_bus_df.shape[0]
+    assert frame.loc[frame['name'] == 'Analyzer.distance_data', 'rows_out'].item() == 5
+    assert analyzer.results.trace.summary().loc['Analyzer.require', 'calls'] == 1
+
+    events = json.loads(analyzer.results.trace.to_json(str(tmp_path / 'trace.json')))['events']
+    assert [event['name'] for event in events] == frame['name'].tolist()
+    chrome = analyzer.results.trace.to_chrome_trace(str(tmp_path / 'trace.chrome.json'))
+    assert {event['ph'] for event in chrome['traceEvents']} == {'X'}
+    with open(tmp_path / 'trace.chrome.json') as f:
+        assert len(json.load(f)['traceEvents']) == len(events)
+    assert len(pickle.loads(pickle.dumps(analyzer.results.trace)).events) == len(events)
@@ -0,0 +1,65 @@
+from autobusy.analyzer.analyzer import Analyzer
+from autobusy.analyzer.linref import RouteGeometry
+import autobusy.analyzer.jit as jit
+import autobusy.analyzer.util as util
+import numpy as np
+import pytest
+
+
+@pytest.fixture(params=['interpreted', 'compiled'])
+def backends(request):
+    # loop implementations are interpreted if Numba is not installed, so the parity tests always run,
+    # and compiled with Numba if it is installed
+    if request.param == 'compiled':
+        pytest.importorskip('numba')
+        return jit.Backend('numpy'), jit.Backend('numba')
+    return jit.Backend('numpy'), jit.Backend('numba', require_numba=False)
+
+
+def test_inversions(backends):
+    rng = np.random.default_rng(0)
+    for size in [0, 1, 2, 10, 30]:
+        permutation = rng.permutation(size)
+        expectation = util.inversions(list(range(size)), list(permutation))
+        assert [backend.inversions(permutation) for backend in backends] == [expectation, expectation]
+
+
+def test_project(backends):
+    rng = np.random.default_rng(1)
+    geometry = RouteGeometry(21.0 + np.cumsum(rng.uniform(0, 0.01, 20)), 52.2 + np.cumsum(rng.normal(0, 0.005, 20)))
+    lon = rng.uniform(20.99, 21.2, 200)
+    lat = rng.uniform(52.15, 52.25, 200)
+    (position, offset), (loop_position, loop_offset) = [backend.project(geometry, lon, lat) for backend in backends]
+    assert np.allclose(position, loop_position) and np.allclose(offset, loop_offset)
+
+
+def test_segment_trips(backends):
+    rng = np.random.default_rng(2)
+    group = np.repeat(np.arange(20), rng.integers(1, 40, 20))
+    position = np.abs(np.cumsum(rng.normal(0, 0.3, group.shape[0])))
+    position[rng.random(group.shape[0]) < 0.2] += rng.normal(0, 0.05)
+    (trip, direction), (loop_trip, loop_direction) = [backend.segment_trips(group, position) for backend in backends]
+    assert (trip == loop_trip).all() and (direction == loop_direction).all()
+
+
+def test_punctuality_does_not_depend_on_backend(backends, make_line_data):
+    live_bus_df, route_data = make_line_data(['1', '2', '3'])
+    results = []
+    for backend in backends:
+        analyzer = Analyzer(7)
+        analyzer.backend = backend
+        analyzer.create_punctuality_data(live_bus_df, route_data)
+        results.append(analyzer.results.punctuality_data)
+    assert not results[0].empty and results[0].equals(results[1])
+
+
+def test_get_backend():
+    assert jit.get_backend('numpy').name == 'numpy'
+    assert jit.get_backend('auto').name in jit.available_backends()
+    with pytest.raises(ValueError):
+        jit.get_backend('fortran')
+    if jit.numba is None:
+        with pytest.warns(RuntimeWarning):
+            assert jit.get_backend('numba').name == 'numpy'
+    else:
+        assert jit.get_backend('numba').name == 'numba'
@@ -0,0 +1,73 @@
+import autobusy.analyzer.kernels as kernels
+import autobusy.analyzer.util as util
+from autobusy.analyzer.analyzer import Analyzer
+import pandas as pd
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    return rng.uniform(20.85, 21.25, 50), rng.uniform(52.1, 52.35, 50)
+
+
+@pytest.mark.parametrize("dtype, tol", [(np.float64, 1e-9), (np.float32, 1e-3)])
+def test_haversine(points, dtype, tol):
+    lon, lat = points
+    out = np.empty(49, dtype=dtype)
+    result = kernels.haversine(lon[:-1], lat[:-1], lon[1:], lat[1:], out=out, dtype=dtype)
+    assert result is out and result.dtype == dtype
+    assert np.abs(result - util.distance(lon[:-1], lat[:-1], lon[1:], lat[1:])).max() < tol
+
+
+def test_equirectangular_error_bound(points):
+    lon, lat = points
+    exact = kernels.many_to_many(lon, lat, lon, lat)
+    approximate = kernels.many_to_many(lon, lat, lon, lat, approximate=True)
+    assert np.all(np.abs(approximate - exact) <= 1e-5 * exact + 1e-9)
+
+
+def test_pair_distances(points):
+    lon, lat = points
+    group_start = np.zeros(50, dtype=bool)
+    group_start[[0, 10, 11]] = True
+    result = kernels.pair_distances(lon, lat, group_start)
+    assert np.isnan(result[[0, 10, 11]]).all()
+    assert np.allclose(result[1:10], util.distance(lon[:9], lat[:9], lon[1:10], lat[1:10]))
+    assert np.allclose(result[12:], util.distance(lon[11:-1], lat[11:-1], lon[12:], lat[12:]))
+    assert kernels.pair_distances(np.zeros(0), np.zeros(0)).shape == (0,)
+
+
+def test_point_to_many_and_many_to_many(points):
+    lon, lat = points
+    matrix = kernels.many_to_many(lon[:7], lat[:7], lon, lat, chunk_size=3)
+    assert matrix.shape == (7, 50)
+    assert np.allclose(matrix[4], kernels.point_to_many(lon[4], lat[4], lon, lat))
+    with pytest.raises(ValueError):
+        kernels.many_to_many(lon, lat, lon, lat, out=np.empty((2, 2)))
+
+
+def test_nearest(points):
+    lon, lat = points
+    index, distance = kernels.nearest(lon, lat, lon[:20], lat[:20], chunk_size=8)
+    matrix = kernels.many_to_many(lon, lat, lon[:20], lat[:20])
+    assert (index == matrix.argmin(axis=1)).all()
+    assert np.allclose(distance, matrix.min(axis=1))
+    assert (index[:20] == np.arange(20)).all()
+
+
+def test_moved():
+    live_bus_df = pd.DataFrame({
+        'Lines': ['1'] * 3 + ['2'] * 3 + ['3'] * 3,
+        'VehicleNumber': ['1'] * 9,
+        # line 1: far from the first ping, line 2: within 0.8 km of the first ping but 1.6 km across,
+        # line 3: standing
+        'Lon': [21.0, 21.02, 21.0, 21.0, 20.988, 21.012, 21.0, 21.0001, 21.0],
+        'Lat': [52.2] * 9,
+        'Time': pd.Timestamp('2024-01-29 07:00'),
+    })
+    assert Analyzer.moved(live_bus_df, 1).tolist() == [True] * 6 + [False] * 3
+    # pings of different days are different buses
+    live_bus_df['Time'] = pd.to_datetime(['2024-01-29 07:00', '2024-01-30 07:00', '2024-01-29 07:01'] * 3)
+    assert Analyzer.moved(live_bus_df, 1).tolist() == [False] * 9
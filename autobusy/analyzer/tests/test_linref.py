@@ -0,0 +1,69 @@
+from autobusy.analyzer.linref import RouteGeometry, passage_times, fill_zeros, segment_trips
+import autobusy.analyzer.util as util
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def geometry():
+    # stops along a parallel, then along a meridian
+    return RouteGeometry(np.array([21.0, 21.01, 21.02, 21.02]), np.array([52.2, 52.2, 52.2, 52.21]))
+
+
+def test_cumulative_distance(geometry):
+    expected = np.cumsum([0, util.distance(21.0, 52.2, 21.01, 52.2), util.distance(21.01, 52.2, 21.02, 52.2),
+                          util.distance(21.02, 52.2, 21.02, 52.21)])
+    assert np.abs(geometry.cumulative - expected).max() < 0.001
+
+
+def test_project(geometry):
+    position, offset = geometry.project(np.array([21.0, 21.005, 21.02, 21.03, 20.99]),
+                                        np.array([52.2, 52.201, 52.205, 52.21, 52.2]))
+    step = geometry.cumulative[1]
+    assert np.abs(position - [0, step / 2, geometry.cumulative[2] + 0.556, geometry.cumulative[3], 0]).max() < 0.01
+    assert np.abs(offset - [0, 0.111, 0, 0.68, 0.68]).max() < 0.01
+
+
+def test_project_in_chunks(geometry):
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(20.99, 21.03, 100)
+    lat = rng.uniform(52.19, 52.22, 100)
+    position, offset = geometry.project(lon, lat)
+    chunked_position, chunked_offset = geometry.project(lon, lat, chunk_size=7)
+    assert np.allclose(position, chunked_position) and np.allclose(offset, chunked_offset)
+
+
+def test_closest_stops(geometry):
+    step = geometry.cumulative[1]
+    assert list(geometry.closest_stops(np.array([0, 0.4 * step, 0.6 * step, 10 * step]))) == [0, 0, 1, 3]
+
+
+@pytest.mark.parametrize("position, time, stop_position, forward, expectation", [
+    ([0, 1, 2], [0, 10, 20], [0.5, 1.5, 3], True, [5, 15, np.nan]),
+    ([0, 1, 1, 1, 2], [0, 10, 20, 30, 40], [1, 1.5], True, [30, 35]),
+    ([0, 2, 1.9, 3], [0, 10, 20, 30], [2.5], True, [25]),
+    ([3, 2, 1], [0, 10, 20], [2.5, 0.5], False, [5, np.nan]),
+    ([0], [0], [0], True, [np.nan]),
+])
+def test_passage_times(position, time, stop_position, forward, expectation):
+    result = passage_times(np.array(position), np.array(time), np.array(stop_position), forward)
+    assert np.allclose(result, expectation, equal_nan=True)
+
+
+def test_passage_times_tolerance():
+    result = passage_times(np.array([1, 2]), np.array([0, 10]), np.array([0.9, 0.5, 2.05]), tolerance=0.2)
+    assert np.allclose(result, [0, np.nan, 10], equal_nan=True)
+
+
+def test_fill_zeros():
+    group_start = np.array([True, False, False, False, True, False, True])
+    values = np.array([0, 1, 0, -1, 0, 0, 0])
+    assert list(fill_zeros(group_start, values)) == [1, 1, 1, -1, 0, 0, 0]
+
+
+def test_segment_trips():
+    group = np.array([0] * 12 + [1] * 4)
+    position = np.array([0, 0, 0.5, 1, 1.5, 1.45, 2, 2, 1.5, 1, 0.5, 0.55, 0, 0.01, 0, 0.01])
+    trip, direction = segment_trips(group, position)
+    assert list(trip) == [0] * 7 + [1] * 5 + [2] * 4
+    assert list(direction) == [0] * 7 + [1] * 5 + [-1] * 4
@@ -0,0 +1,98 @@
+from autobusy.analyzer.analyzer import Analyzer
+from autobusy.analyzer.parallel import SharedFrame, shard_bounds, balanced_bounds
+from multiprocessing import shared_memory
+import pandas as pd
+import pytest
+
+
+def test_shared_frame_roundtrip():
+    df = pd.DataFrame({
+        'Lines': ['1', '1', '2', '3'],
+        'Lon': [21.0, 21.1, 21.2, 21.3],
+        'Count': [1, 2, 3, 4],
+        'Time': pd.to_datetime(['2024-01-29 07:00:00', '2024-01-29 07:01:00',
+                                '2024-01-29 07:02:00', '2024-01-29 07:03:00']),
+    })
+    with SharedFrame(df) as shared:
+        assert SharedFrame.attach(shared.spec()).equals(df)
+        assert SharedFrame.attach(shared.spec(), 1, 3).equals(df.iloc[1:3].reset_index(drop=True))
+
+
+def test_shared_frame_missing_values():
+    df = pd.DataFrame({'Brigade': ['a', None, 'b', None], 'Lines': ['1', '2', '2', '1']})
+    with SharedFrame(df) as shared:
+        attached = SharedFrame.attach(shared.spec())
+        assert attached['Brigade'].tolist() == ['a', None, 'b', None]
+        assert attached.equals(df)
+        assert SharedFrame.attach(shared.spec(), 1, 2)['Brigade'].tolist() == [None]
+
+
+def test_shared_frame_executor():
+    df = pd.DataFrame({'VehicleNumber': [str(x) for x in range(100)], 'Lon': range(100)})
+    with SharedFrame(df) as shared, shared.executor(2) as executor:
+        futures = [executor.submit(SharedFrame.worker_slice, start, start + 10) for start in range(0, 100, 10)]
+        assert pd.concat([future.result() for future in futures], ignore_index=True).equals(df)
+    with pytest.raises(RuntimeError):
+        SharedFrame.worker_slice()
+
+
+def test_shared_frame_cleanup_on_failure(monkeypatch):
+    created = []
+    original = shared_memory.SharedMemory
+
+    def failing(*args, **kwargs):
+        if kwargs.get('create') and created:
+            raise OSError('no space left')
+        block = original(*args, **kwargs)
+        created.append(block.name)
+        return block
+
+    monkeypatch.setattr(shared_memory, 'SharedMemory', failing)
+    with pytest.raises(OSError):
+        SharedFrame(pd.DataFrame({'Lon': [21.0], 'Lat': [52.2]}))
+    monkeypatch.undo()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=created[0])
+
+
+@pytest.mark.parametrize("keys, expectation", [
+    ([], {}),
+    (['1'], {'1': (0, 1)}),
+    (['1', '1', '2', '3', '3', '3'], {'1': (0, 2), '2': (2, 3), '3': (3, 6)}),
+])
+def test_shard_bounds(keys, expectation):
+    assert shard_bounds(pd.Series(keys, dtype=object)) == expectation
+
+
+@pytest.mark.parametrize("keys, shards, expectation", [
+    ([], 4, []),
+    (['1', '1', '1'], 4, [(0, 3)]),
+    (['1', '2', '3', '4'], 2, [(0, 2), (2, 4)]),
+    (['1', '1', '1', '2', '3', '3'], 3, [(0, 3), (3, 4), (4, 6)]),
+])
+def test_balanced_bounds(keys, shards, expectation):
+    assert balanced_bounds(pd.Series(keys, dtype=object), shards) == expectation
+
+
+def test_parallel_punctuality_matches_serial(make_line_data):
+    live_bus_df, route_data = make_line_data(['2', '1', '3'])
+    serial = Analyzer(7)
+    serial.create_punctuality_data(live_bus_df, route_data)
+    parallel = Analyzer(7)
+    parallel.create_punctuality_data(live_bus_df, route_data, workers=2)
+    assert not serial.results.punctuality_data.empty
+    assert parallel.results.punctuality_data.equals(serial.results.punctuality_data)
+    assert parallel.results.boundary_inaccuracy_count == serial.results.boundary_inaccuracy_count
+
+
+def test_parallel_vehicle_stages_match_serial(make_line_data):
+    live_bus_df, _ = make_line_data(['1', '2', '3', '4', '5'])
+    serial = Analyzer(7)
+    serial.create_places_speed_data(live_bus_df)
+    serial.create_distance_data(live_bus_df)
+    parallel = Analyzer(7)
+    parallel.create_places_speed_data(live_bus_df, workers=2)
+    parallel.create_distance_data(live_bus_df, workers=2)
+    assert parallel.results.speed_data.equals(serial.results.speed_data)
+    assert parallel.results.places_speed_data.equals(serial.results.places_speed_data)
+    assert parallel.results.distance_data.equals(serial.results.distance_data)
@@ -1,6 +1,8 @@
 import pandas as pd
+import json
 
 from autobusy.analyzer.parser import TimetableParser, LiveParser
+from autobusy.downloader.storage import SQLiteStorage
 import unittest.mock
 import pytest
 
@@ -196,3 +198,61 @@ def test_live_parser_parse(file_contents, expectation):
         expectation['Time'] = pd.to_datetime(expectation['Time'])
         expectation['RequestTime'] = pd.to_datetime(expectation['RequestTime'])
         assert result.equals(expectation)
+
+
+@pytest.mark.parametrize('block_size', [7, 2 ** 20])
+def test_live_parser_stream(tmp_path, block_size):
+    snapshots = [{
+        'request_time': f'2024-01-29 03:00:{second:02d}',
+        'result': [{'Lines': '1', 'VehicleNumber': str(second), 'Lon': 1, 'Lat': 1,
+                    'Time': f'2024-01-29 03:00:{second:02d}'}] if second != 2 else []
+    } for second in range(5)]
+    filename = tmp_path / 'live.json'
+    filename.write_text(json.dumps(snapshots, indent=4))
+    chunks = list(LiveParser.stream(str(filename), snapshots_per_chunk=2, block_size=block_size))
+    assert [chunk['VehicleNumber'].tolist() for chunk in chunks] == [['0', '1'], ['3', '4']]
+    assert pd.concat(chunks, ignore_index=True).equals(LiveParser.to_frame(snapshots))
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'vehicle': '1'},
+    {'line': '1', 'start': '2024-01-29 03:00:02'},
+    {'start': pd.Timestamp('2024-01-29 03:00:01'), 'end': pd.Timestamp('2024-01-29 03:00:04')},
+    {'vehicle': '9'},
+])
+def test_live_parser_query(tmp_path, params):
+    snapshots = [{
+        'request_time': f'2024-01-29 03:00:{second:02d}',
+        'result': [{'Lines': str(vehicle % 2), 'Lon': 21.0 + second, 'VehicleNumber': str(vehicle),
+                    'Time': f'2024-01-29 03:00:{second:02d}', 'Lat': 52.0, 'Brigade': '1'} for vehicle in range(3)]
+    } for second in range(5)]
+    (tmp_path / 'live.json').write_text(json.dumps(snapshots, indent=4))
+    with SQLiteStorage(str(tmp_path / 'live.db')) as storage:
+        for snapshot in snapshots:
+            storage.save(snapshot)
+    from_json = LiveParser(str(tmp_path / 'live.json')).query(**params)
+    from_sqlite = LiveParser(str(tmp_path / 'live.db')).query(**params)
+    assert from_sqlite.equals(from_json)
+    if not params:
+        assert from_sqlite.equals(LiveParser(str(tmp_path / 'live.db')).parse())
+        assert from_sqlite.shape[0] == 15
+
+
+@pytest.mark.parametrize('block_size', [1, 4, 2 ** 20])
+def test_live_parser_stream_sqlite(tmp_path, block_size):
+    snapshots = [{
+        'request_time': f'2024-01-29 03:00:{second:02d}',
+        'result': [{'Lines': str(vehicle % 2), 'Lon': 21.0 + second, 'VehicleNumber': str(vehicle),
+                    'Time': f'2024-01-29 03:00:{second:02d}', 'Lat': 52.0, 'Brigade': '1'}
+                   for vehicle in range(3)] if second != 2 else []
+    } for second in range(6)]
+    (tmp_path / 'live.json').write_text(json.dumps(snapshots, indent=4))
+    with SQLiteStorage(str(tmp_path / 'live.db')) as storage:
+        for snapshot in snapshots:
+            storage.save(snapshot)
+    from_json = list(LiveParser.stream(str(tmp_path / 'live.json'), snapshots_per_chunk=2, block_size=block_size))
+    from_sqlite = list(LiveParser.stream(str(tmp_path / 'live.db'), snapshots_per_chunk=2, block_size=block_size))
+    assert len(from_sqlite) == len(from_json) == 3
+    for chunk, expectation in zip(from_sqlite, from_json):
+        pd.testing.assert_frame_equal(chunk, expectation)
@@ -0,0 +1,61 @@
+from autobusy.analyzer.analyzer import Results
+from autobusy.analyzer.grid import Grid
+import pandas as pd
+import pytest
+import subprocess
+import sys
+
+
+def test_analyzer_does_not_import_plotting_libraries():
+    code = ('import sys, autobusy.analyzer.analyzer, autobusy.analyzer.chunked, autobusy.analyzer.delay; '
+            'print(sorted(m for m in sys.modules if m.split(".")[0] in ("plotly", "folium", "branca")))')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
+
+
+def test_results_plot():
+    results = Results()
+    results.speed_data = pd.DataFrame({'Speed': [5, 15, 25, 60]})
+    figure = results.plot_speeds([0, 10, 50])
+    assert list(figure.data[0].y) == [1, 2, 1]
+
+
+def test_results_plot_punctuality():
+    results = Results()
+    results.punctuality_data = pd.DataFrame({
+        'Comment': ['Early', 'On time', 'Late', 'Late'],
+        'Difference': [4, 0, 1, 4],
+    })
+    figure = results.plot_punctuality([2, 4])
+    assert list(figure.data[0].y) == [1, 0, 2, 0, 1]
+
+
+@pytest.mark.parametrize('layer', ['markers', 'cluster', 'heatmap'])
+def test_results_plot_bad_stops(layer):
+    results = Results()
+    results.stop_punctuality_data = pd.DataFrame({'Stop': ['1', '2'], 'Total': [10, 10], 'Late': [9, 1]})
+    results.stop_info = pd.DataFrame({'Name': ['Centrum', 'Wilanów'], 'Lon': [21.0, 21.1], 'Lat': [52.2, 52.3]},
+                                     index=['1', '2'])
+    html = results.plot_bad_stops(1, 0.5, layer=layer).get_root().render()
+    assert '52.2' in html and '52.3' not in html
+
+
+def test_results_plot_longest_routes():
+    results = Results()
+    results.longest_routes = pd.DataFrame({
+        'VehicleNumber': ['1', '1', '1', '2', '2'], 'Lines': ['180', '180', '180', '520', '520'],
+        'Lon': [21.0, 21.001, 21.002, 21.1, 21.2], 'Lat': [52.2, 52.2, 52.2, 52.3, 52.3],
+        'Distance': [0.14, 0.14, 0.14, 6.8, 6.8],
+    })
+    assert '21.001' in results.plot_longest_routes(tolerance=0).get_root().render()
+    assert '21.001' not in results.plot_longest_routes(tolerance=0.001).get_root().render()
+
+
+@pytest.mark.parametrize('layer', ['cells', 'heatmap'])
+def test_results_plot_fast_places(layer):
+    results = Results()
+    results.places_speed_data = pd.DataFrame({'Lon': [21.0, 21.1], 'Lat': [52.2, 52.3], 'Total': [10, 10],
+                                              'Fast': [9, 1]})
+    results.places_grid = Grid(0.01)
+    html = results.plot_fast_places(1, 0.5, layer=layer).get_root().render()
+    assert '52.2' in html and '52.3' not in html
@@ -0,0 +1,46 @@
+import autobusy.report as report
+import json
+import os
+import pytest
+
+
+def test_report(tmp_path, archive):
+    filenames, _ = archive
+    output = tmp_path / 'report'
+    argv = ['--live', *filenames, '--hours', '7', '--output', str(output), '--workers', '1']
+    report.cli(argv)
+    directory = report.window_directory(str(output), filenames[0], 7)
+    with open(os.path.join(directory, report.MANIFEST)) as f:
+        manifest = json.load(f)
+    assert {'speeds.html', 'speeds.csv', 'fast_places.html', 'distance.csv', 'longest_routes.html'} <= set(
+        manifest['files'])
+    assert all(os.path.exists(os.path.join(directory, name)) for name in manifest['files'])
+
+    # unchanged inputs are skipped, changed inputs are regenerated
+    speeds = os.path.join(directory, 'speeds.html')
+    os.utime(speeds, ns=(0, 0))
+    report.cli(argv)
+    assert os.stat(speeds).st_mtime_ns == 0
+    os.utime(filenames[0])
+    report.cli(argv)
+    assert os.stat(speeds).st_mtime_ns != 0
+    assert os.path.exists(report.window_directory(str(output), filenames[1], 7))
+
+
+@pytest.mark.parametrize('tasks, workers, expectation', [
+    ({'a': [6, 7, 8, 9]}, 1, [('a', [6, 7, 8, 9])]),
+    ({'a': [6, 7, 8, 9]}, 3, [('a', [6, 9]), ('a', [7]), ('a', [8])]),
+    ({'a': [6, 7], 'b': [8]}, 4, [('a', [6]), ('a', [7]), ('b', [8])]),
+    ({'a': [6], 'b': [7], 'c': [8]}, 2, [('a', [6]), ('b', [7]), ('c', [8])]),
+    ({}, 4, []),
+])
+def test_split_windows(tasks, workers, expectation):
+    assert report.split_windows(tasks, workers) == expectation
+
+
+def test_report_windows_in_parallel(tmp_path, archive):
+    filenames, _ = archive
+    output = tmp_path / 'report'
+    report.cli(['--live', filenames[0], '--hours', '6', '7', '--output', str(output), '--workers', '2'])
+    with open(os.path.join(report.window_directory(str(output), filenames[0], 7), report.MANIFEST)) as f:
+        assert json.load(f)['hour'] == 7
@@ -0,0 +1,132 @@
+from autobusy.analyzer.synthetic import SyntheticNetwork
+from autobusy.analyzer.analyzer import Analyzer
+from autobusy.analyzer.parser import LiveParser
+import autobusy.report as report
+import autobusy.service as service
+import pytest
+import requests
+import json
+import os
+
+
+@pytest.fixture(scope='module')
+def network():
+    return SyntheticNetwork(lines=5, stops=100, vehicles=20)
+
+
+@pytest.fixture(scope='module')
+def report_directory(network, tmp_path_factory):
+    directory = tmp_path_factory.mktemp('service')
+    network.write_timetable(str(directory / 'RA.TXT'))
+    network.write_archive(str(directory / 'day1.json'), [7, 8])
+    report.cli(['--live', str(directory / 'day1.json'), '--timetable', str(directory / 'RA.TXT'),
+                '--hours', '7', '8', '--output', str(directory / 'report'), '--workers', '1'])
+    return directory
+
+
+@pytest.fixture
+def store(network, report_directory):
+    return service.ResultsStore(str(report_directory / 'report'), network.route_data())
+
+
+def query(store, path, **params):
+    status, payload = store.query(path, params)
+    return status, json.loads(payload)
+
+
+def test_windows(store):
+    status, body = query(store, '/windows')
+    assert status == 200
+    assert [window['window'] for window in body] == ['day1-07', 'day1-08']
+    assert 'punctuality_data' in body[0]['results']
+
+
+def test_punctuality_matches_analyzer(network, store, report_directory):
+    live_bus_df = LiveParser(str(report_directory / 'day1.json')).parse()
+    analyzer = Analyzer(8)
+    analyzer.create_punctuality_data(live_bus_df, network.route_data())
+    punctuality_data = analyzer.results.punctuality_data
+    line, stop = punctuality_data[['Line', 'Stop']].iloc[0]
+
+    # the latest window is the default one
+    status, body = query(store, '/punctuality')
+    assert status == 200
+    assert body['window'] == 'day1-08'
+    assert body['total'] == punctuality_data.shape[0]
+    assert [row['Count'] for row in body['counts']] == \
+        analyzer.results.punctuality_counts(report.PUNCTUALITY_DELIMITERS)['Count'].tolist()
+
+    status, body = query(store, '/punctuality', line=line, stop=stop, delimiters='1,3')
+    expected = punctuality_data[(punctuality_data['Line'] == line) & (punctuality_data['Stop'] == stop)]
+    assert body['total'] == expected.shape[0]
+    assert body['late'] == (expected['Comment'] == 'Late').sum()
+    assert [row['From'] for row in body['counts']] == [3, 1, 0, 1, 3]
+    assert body['counts'][-1]['To'] is None
+
+    status, body = query(store, '/lines', hour='8')
+    assert {row['Line'] for row in body} == set(punctuality_data['Line'])
+    assert sum(row['Total'] for row in body) == punctuality_data.shape[0]
+
+
+def test_history(store):
+    status, body = query(store, '/history')
+    assert status == 200
+    assert body['windows'] == 2
+    assert body['total'] == sum(window['total'] for window in [query(store, '/punctuality', window=name)[1]
+                                                               for name in ['day1-07', 'day1-08']])
+    assert [row['Hour'] for row in body['hours']] == [7, 8]
+    status, body = query(store, '/history', hour='8', line='100')
+    assert body['total'] == query(store, '/punctuality', hour='8', line='100')[1]['total']
+    assert [row['Hour'] for row in body['hours']] == [8]
+
+
+@pytest.mark.parametrize(
+    "path,params,status",
+    [
+        ('/speeds', {'window': 'day1-07'}, 200),
+        ('/distance', {'delimiters': '0,10'}, 200),
+        ('/stops', {'min_buses': '0', 'min_ratio': '0'}, 200),
+        ('/fast_places', {}, 200),
+        ('/punctuality', {'line': 'unknown'}, 404),
+        ('/punctuality', {'window': 'day2-07'}, 404),
+        ('/punctuality', {'hour': '9'}, 404),
+        ('/history', {'hour': 'x'}, 400),
+        ('/speeds', {'delimiters': 'a,b'}, 400),
+        ('/speeds', {'delimiters': '5,0'}, 400),
+        ('/stops', {'min_buses': 'x'}, 400),
+        ('/unknown', {}, 404),
+    ],
+)
+def test_query_status(store, path, params, status):
+    assert query(store, path, **params)[0] == status
+
+
+def test_cache_and_reload(store, report_directory):
+    store.query('/punctuality', {'line': '100'})
+    store.query('/punctuality', {'line': '100'})
+    assert store.cached_answer.cache_info().hits == 1
+    assert not store.refresh()
+
+    # a new window lands
+    directory = report_directory / 'report'
+    os.makedirs(directory / 'day2-08')
+    with open(directory / 'day1-08' / report.MANIFEST) as f:
+        manifest = json.load(f)
+    for name in manifest['files']:
+        with open(directory / 'day1-08' / name, 'rb') as source, open(directory / 'day2-08' / name, 'wb') as target:
+            target.write(source.read())
+    with open(directory / 'day2-08' / report.MANIFEST, 'w') as f:
+        json.dump(manifest, f)
+    assert store.refresh()
+    assert store.cached_answer.cache_info().currsize == 0
+    assert query(store, '/punctuality', line='100')[1]['window'] == 'day2-08'
+
+
+def test_server(store):
+    with service.QueryServer(store, reload_interval=60) as server:
+        response = requests.get(server.url + '/speeds', params={'hour': 7, 'delimiters': '0,20'})
+        missing = requests.get(server.url + '/punctuality', params={'window': 'missing'})
+    assert response.status_code == 200
+    assert [row['From'] for row in response.json()] == [0, 20]
+    assert missing.status_code == 404
+    assert 'error' in missing.json()
@@ -0,0 +1,106 @@
+from autobusy.analyzer.sketch import KLLSketch, SketchSet
+from autobusy.analyzer.synthetic import SyntheticNetwork
+from autobusy.analyzer.analyzer import Analyzer
+import pandas as pd
+import numpy as np
+import pickle
+import pytest
+
+
+def rank_error(sketch, values, fractions):
+    return np.abs(np.searchsorted(np.sort(values), sketch.quantiles(fractions)) / values.shape[0] - fractions).max()
+
+
+@pytest.mark.parametrize("k,bound", [(200, 0.02), (50, 0.08)])
+def test_quantile_error(k, bound):
+    values = np.random.default_rng(0).exponential(20, 200000)
+    sketch = KLLSketch(k, seed=1)
+    for chunk in np.array_split(values, 100):
+        sketch.update(chunk)
+    fractions = np.linspace(0.01, 0.99, 99)
+    assert rank_error(sketch, values, fractions) < bound
+    assert sketch.count == values.shape[0]
+    assert sketch.quantiles([0, 1]).tolist() == [values.min(), values.max()]
+    assert sum(level.shape[0] for level in sketch.levels) < 3 * k
+
+
+def test_merge():
+    values = np.random.default_rng(0).normal(0, 5, 100000)
+    sketches = [KLLSketch(seed=i) for i in range(8)]
+    for sketch, chunk in zip(sketches, np.array_split(values, 8)):
+        sketch.update(chunk)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(pickle.loads(pickle.dumps(sketch)))
+    assert merged.count == values.shape[0]
+    assert rank_error(merged, values, np.linspace(0.01, 0.99, 99)) < 0.02
+    estimated = merged.counts([-5, 0, 5])
+    expected = [((values >= -5) & (values < 0)).sum(), ((values >= 0) & (values < 5)).sum(), (values >= 5).sum()]
+    assert np.allclose(estimated, expected, atol=0.02 * values.shape[0])
+    with pytest.raises(ValueError):
+        merged.merge(KLLSketch(100))
+
+
+def test_small_and_empty_sketches():
+    sketch = KLLSketch()
+    assert np.isnan(sketch.quantiles([0.5])).all()
+    assert sketch.counts([0, 1]).tolist() == [0, 0]
+    sketch.update([3, np.nan, 1, 2])
+    # below the capacity values are kept exactly
+    assert sketch.quantiles([0, 0.5, 1]).tolist() == [1, 2, 3]
+    assert sketch.count == 3
+    with pytest.raises(ValueError):
+        sketch.quantiles([1.5])
+    restored = KLLSketch.from_dict(sketch.to_dict())
+    assert restored.quantiles([0.25, 0.75]).tolist() == sketch.quantiles([0.25, 0.75]).tolist()
+
+
+def test_sketch_set(tmp_path):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({
+        'Value': rng.normal(30, 10, 5000),
+        'Line': rng.choice(['1', '2', '523'], 5000),
+        'Lon': rng.uniform(20.9, 21.1, 5000),
+        'Lat': rng.uniform(52.1, 52.3, 5000),
+        'Hour': rng.choice([7, 8], 5000),
+    })
+    data.loc[:10, 'Lon'] = np.nan
+    halves = []
+    for half in [data.iloc[:2500], data.iloc[2500:]]:
+        sketches = SketchSet(seed=0)
+        sketches.update(half['Value'], half['Line'], half['Lon'], half['Lat'], half['Hour'])
+        halves.append(sketches)
+    merged = SketchSet.merge_all(halves)
+
+    lines = merged.quantiles([0.5], 'line')
+    assert lines['Line'].tolist() == ['1', '2', '523']
+    assert lines['Count'].tolist() == data.groupby('Line').size().tolist()
+    assert np.allclose(lines['P50'], data.groupby('Line')['Value'].median(), atol=1)
+    assert merged.quantiles([0.5], 'hour')['Hour'].tolist() == [7, 8]
+    cells = merged.quantiles([0.1, 0.9], 'cell')
+    assert cells['Count'].sum() == data['Lon'].notna().sum()
+    assert list(cells.columns) == ['Cell', 'Lon', 'Lat', 'Count', 'P10', 'P90']
+    assert merged.quantiles([0.5])['Count'].tolist() == [5000]
+
+    merged.save(str(tmp_path / 'sketches.json'))
+    loaded = SketchSet.load(str(tmp_path / 'sketches.json'))
+    pd.testing.assert_frame_equal(loaded.quantiles([0.5], 'cell'), merged.quantiles([0.5], 'cell'))
+    with pytest.raises(ValueError):
+        merged.merge(SketchSet(resolution=0.1))
+    with pytest.raises(ValueError):
+        merged.quantiles([0.5], 'vehicle')
+
+
+def test_analyzer_sketches():
+    network = SyntheticNetwork(lines=5, stops=100, vehicles=20)
+    live_bus_df = network.live_data([8])
+    route_data = network.route_data()
+    analyzer = Analyzer(8)
+    analyzer.create_sketches(live_bus_df, route_data, k=100)
+    results = analyzer.results
+    assert results.speed_sketches.quantiles([0.5])['Count'].tolist() == [results.speed_data.shape[0]]
+    assert results.speed_sketches.quantiles([0.5], 'line')['Count'].sum() == results.speed_data.shape[0]
+    delays = results.delay_sketches.quantiles([0, 1], 'line')
+    assert delays['Count'].sum() == results.punctuality_data.shape[0]
+    assert delays['P100'].max() == results.punctuality_data.loc[
+        results.punctuality_data['Comment'] == 'Late', 'Difference'].max()
@@ -0,0 +1,66 @@
+from autobusy.analyzer.stages import Stage, StageExecutor, fingerprint
+from autobusy.analyzer.analyzer import Analyzer
+import pandas as pd
+import pytest
+
+
+def make_executor(calls: list[str]) -> StageExecutor:
+    def total(x):
+        calls.append('total')
+        return sum(x)
+
+    def scaled(x, factor):
+        calls.append('scaled')
+        return x * factor
+
+    return StageExecutor({
+        'total': Stage(total, ('numbers',)),
+        'scaled': Stage(scaled, ('total',), ('factor',)),
+    }, {'hour': 7})
+
+
+def test_executor_memoises_stages():
+    calls = []
+    executor = make_executor(calls)
+    assert executor.run('scaled', {'numbers': [1, 2, 3]}, {'factor': 2}) == 12
+    assert executor.run('scaled', {'numbers': [1, 2, 3]}, {'factor': 2}) == 12
+    assert calls == ['total', 'scaled']
+    assert executor.run('scaled', {'numbers': [1, 2, 3]}, {'factor': 3}) == 18
+    assert calls == ['total', 'scaled', 'scaled']
+    assert executor.run('total', {'numbers': [1, 2]}) == 3
+    assert calls == ['total', 'scaled', 'scaled', 'total']
+
+
+def test_executor_dependencies():
+    assert make_executor([]).dependencies('scaled') == ['total', 'scaled']
+
+
+def test_executor_missing_inputs():
+    executor = make_executor([])
+    with pytest.raises(ValueError):
+        executor.run('scaled', {'numbers': [1]})
+    with pytest.raises(ValueError):
+        executor.run('scaled', {}, {'factor': 1})
+
+
+def test_fingerprint():
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    assert fingerprint(df) == fingerprint(df.copy())
+    assert fingerprint(df) != fingerprint(df.rename(columns={'b': 'c'}))
+    assert fingerprint(df) != fingerprint(df.iloc[::-1])
+
+
+def test_filtered_distance_data():
+    live_bus_df = pd.DataFrame({
+        'VehicleNumber': ['1', '1', '1', '2', '2', '2'],
+        'Lon': [21.0, 21.01, 21.02, 21.0, 21.0, 22.0],
+        'Lat': [52.2, 52.2, 52.2, 52.2, 52.2, 52.2],
+        'Time': pd.to_datetime(['2024-01-29 07:00:00', '2024-01-29 07:01:00', '2024-01-29 07:02:00'] * 2),
+        'RequestTime': pd.to_datetime(['2024-01-29 07:00:30', '2024-01-29 07:01:30', '2024-01-29 07:02:30'] * 2),
+    })
+    analyzer = Analyzer(7)
+    analyzer.create_distance_data(live_bus_df, filter_measurement_errors=True)
+    assert analyzer.results.distance_data is None
+    assert list(analyzer.results.filtered_distance_data['VehicleNumber']) == ['1']
+    analyzer.create_distance_data(live_bus_df)
+    assert list(analyzer.results.distance_data['VehicleNumber']) == ['1', '2']
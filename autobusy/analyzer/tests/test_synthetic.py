@@ -0,0 +1,54 @@
+from autobusy.analyzer.synthetic import SyntheticNetwork
+from autobusy.analyzer.parser import TimetableParser, LiveParser
+from autobusy.analyzer.analyzer import Analyzer
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope='module')
+def network():
+    return SyntheticNetwork(lines=5, stops=100, vehicles=20)
+
+
+def test_timetable_round_trip(network, tmp_path):
+    network.write_timetable(str(tmp_path / 'RA.TXT'))
+    stop_info, line_route_info, line_timetable_info = TimetableParser(str(tmp_path / 'RA.TXT')).parse()
+    route_data = network.route_data()
+    assert stop_info.equals(route_data.stop_info)
+    assert line_route_info == route_data.line_route_info
+    assert line_timetable_info == route_data.line_timetable_info
+
+
+def test_archive_round_trip(network, tmp_path):
+    network.write_archive(str(tmp_path / 'live.json'), [7])
+    live_bus_df = LiveParser(str(tmp_path / 'live.json')).parse()
+    assert live_bus_df.equals(network.live_data([7]))
+    assert live_bus_df.shape[0] == 20 * 60
+    assert (live_bus_df['RequestTime'].dt.hour == 7).all()
+    assert (live_bus_df['RequestTime'].dt.date.astype(str) == '2024-01-29').all()
+
+
+def test_date(network):
+    live_bus_df = network.live_data([7], date='2024-01-30')
+    assert (live_bus_df['RequestTime'].dt.date.astype(str) == '2024-01-30').all()
+    shifted = network.live_data([7])[['Time', 'RequestTime']] + pd.Timedelta(days=1)
+    assert live_bus_df[['Time', 'RequestTime']].equals(shifted)
+
+
+def test_live_data_follows_timetable(network):
+    live_bus_df = network.live_data([7], stall_probability=0.1, jump_probability=0.01)
+    analyzer = Analyzer(7)
+    analyzer.create_speed_data(live_bus_df)
+    analyzer.create_punctuality_data(live_bus_df, network.route_data())
+    speeds = analyzer.results.speed_data['Speed']
+    assert 10 < speeds.median() < 30
+    # jumps give unrealistic speeds, stalls repeat pings
+    assert (speeds > 100).any()
+    assert live_bus_df.duplicated(['VehicleNumber', 'Time']).any()
+    assert analyzer.results.punctuality_data['Difference'].median() <= 5
+
+
+def test_deterministic():
+    first = SyntheticNetwork(lines=3, stops=50, vehicles=6, seed=1)
+    second = SyntheticNetwork(lines=3, stops=50, vehicles=6, seed=1)
+    assert first.live_data([8]).equals(second.live_data([8]))
@@ -1,25 +1,22 @@
-import numpy as np
+import pandas as pd
+import autobusy.analyzer.kernels as kernels
 
 
 def distance(lon1, lat1, lon2, lat2):
     """
     Calculate distance between two points on Earth. Also works for dataframe parameters.
+    Batched variants are in the kernels module
     :param lon1: Longitude of the first point
     :param lat1: Latitude of the first point
     :param lon2: Longitude of the second point
     :param lat2: Latitude of the second point
     :return: Distance in km
     """
-    r = 6373.0  # Earth radius in km
-    lon1 = np.radians(lon1)
-    lat1 = np.radians(lat1)
-    lon2 = np.radians(lon2)
-    lat2 = np.radians(lat2)
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-    return r * c
+    result = kernels.haversine(lon1, lat1, lon2, lat2)
+    for x in (lon1, lat1, lon2, lat2):
+        if isinstance(x, pd.Series):
+            return pd.Series(result, index=x.index)
+    return result
 
 
 def speed(dist, time):
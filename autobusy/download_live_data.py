@@ -1,4 +1,7 @@
 from autobusy.downloader.downloader import RequestConfig, RequestHandler
+from autobusy.analyzer.parser import TimetableParser
+from autobusy.analyzer.analyzer import RouteData
+from autobusy.analyzer.delay import DelayEstimator
 import argparse
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.combining import OrTrigger
@@ -21,26 +24,35 @@ def check_list_of_hours(hours: list[int]):
 call_count = 0
 
 
-def job(request_handler: RequestHandler):
+def job(request_handler: RequestHandler, delay_estimator: DelayEstimator = None):
     global call_count
     call_count += 1
     try:
         request_handler.get_locations_to_json()
         logging.info("Added new data to file")
+        if delay_estimator is not None:
+            vehicles = delay_estimator.vehicle_snapshot()['Delay'].dropna()
+            logging.info("Vehicles with estimated delay: %d, mean delay: %.1f min", len(vehicles), vehicles.mean())
     except Exception as e:
         logging.error('Exception occurred: %s', repr(e))
 
 
 def main(args):
     check_list_of_hours(args.hours)
-    config = RequestConfig(args.key)
-    request_handler = RequestHandler(config, args.file)
+    config = RequestConfig(args.key, args.url)
+    delay_estimator = None
+    if args.timetable is not None:
+        stop_info, line_route_info, line_timetable_info = TimetableParser(args.timetable).parse()
+        delay_estimator = DelayEstimator(RouteData(stop_info, line_route_info, line_timetable_info))
+    request_handler = RequestHandler(config, args.file,
+                                     [delay_estimator.update] if delay_estimator is not None else None,
+                                     args.batch_size)
 
     scheduler = BackgroundScheduler()
     trigger = OrTrigger([
         CronTrigger(hour=str(hour), minute='*', second='30') for hour in args.hours
     ])
-    scheduler.add_job(job, trigger, args=[request_handler])
+    scheduler.add_job(job, trigger, args=[request_handler, delay_estimator])
 
     scheduler.start()
 
@@ -49,6 +61,7 @@ def main(args):
             time.sleep(5)
     finally:
         scheduler.shutdown()
+        request_handler.close()
 
 
 if __name__ == '__main__':
@@ -60,7 +73,7 @@ if __name__ == '__main__':
     )
     parser.add_argument(
         '--file',
-        help='File to save data to',
+        help='File to save data to, in SQLite if it ends with .db, .sqlite or .sqlite3, otherwise in JSON',
         required=True
     )
     parser.add_argument(
@@ -70,5 +83,21 @@ if __name__ == '__main__':
         nargs="+",
         type=int
     )
+    parser.add_argument(
+        '--timetable',
+        help='Timetable file, if given delays are estimated in real time',
+        required=False
+    )
+    parser.add_argument(
+        '--batch-size',
+        help='Number of requests saved in one transaction in SQLite',
+        default=1,
+        type=int
+    )
+    parser.add_argument(
+        '--url',
+        help='URL of the API, e.g. of a local replay server, the city API by default',
+        required=False
+    )
     program_args = parser.parse_args()
     main(program_args)
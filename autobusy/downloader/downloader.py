@@ -1,33 +1,48 @@
+from autobusy.downloader.storage import SQLiteStorage, is_sqlite
 import requests
 import time
 import ftplib
 import json
+from typing import Callable
 
 
 class RequestConfig:
     """
     Configuration for the request to the API
     """
-    def __init__(self, apikey: str):
-        self.url = 'https://api.um.warszawa.pl/api/action/busestrams_get'
+    def __init__(self, apikey: str, url: str = None, request_timeout: float = None):
+        """
+        Constructor
+        :param apikey: API key
+        :param url: URL of the API, the city API by default (e.g. a local ReplayServer for load tests)
+        :param request_timeout: Time in seconds after which the request is abandoned, no limit by default
+        """
+        self.url = url or 'https://api.um.warszawa.pl/api/action/busestrams_get'
         self.resource_id = 'f2e5503e-927d-4ad3-9500-4ab9e55deb59'
         self.timeout = 10
         self.type = 1
         self.apikey = apikey
+        self.request_timeout = request_timeout
 
 
 class RequestHandler:
     """
     Class for handling requests to the API
     """
-    def __init__(self, config: RequestConfig, output_file: str):
+    def __init__(self, config: RequestConfig, output_file: str, listeners: list[Callable[[dict], None]] = None,
+                 batch_size: int = 1):
         """
         Constructor
         :param config: Configuration for the request
-        :param output_file: Name of the file to save the data to
+        :param output_file: Name of the file to save the data to, files with SQLite suffixes (e.g. .db)
+                            are saved in SQLite (see SQLiteStorage) and other files in JSON
+        :param listeners: Functions called with the data of each successful request after it is saved
+        :param batch_size: Number of requests saved in one transaction in SQLite
         """
         self.config = config
         self.output_file = output_file
+        self.listeners = listeners or []
+        self.storage = SQLiteStorage(output_file, batch_size) if is_sqlite(output_file) else None
 
     def get_bus_locations(self) -> dict:
         """
@@ -41,7 +56,7 @@ class RequestHandler:
             'timeout': self.config.timeout
         }
 
-        r = requests.post(self.config.url, params=params)
+        r = requests.post(self.config.url, params=params, timeout=self.config.request_timeout)
         r.raise_for_status()
 
         # sometimes the response has error information in the result field,
@@ -57,9 +72,23 @@ class RequestHandler:
         """
         Get bus locations and save them to a JSON file
         If the file already exists, append the data to it
+        Then pass the data to the listeners
         :return: None
         """
         data = self.get_bus_locations()
+        self.save(data)
+        for listener in self.listeners:
+            listener(data)
+
+    def save(self, data: dict):
+        """
+        Append the data of a request to the SQLite database or to the JSON file
+        :param data: dict with request time and result field of response
+        :return: None
+        """
+        if self.storage is not None:
+            self.storage.save(data)
+            return
         try:
             with open(self.output_file, 'r+') as f:
                 curr_data = json.load(f)
@@ -70,6 +99,14 @@ class RequestHandler:
             with open(self.output_file, 'w') as f:
                 f.write(json.dumps([data], indent=4))
 
+    def close(self):
+        """
+        Write the data buffered in SQLite and close the database
+        :return: None
+        """
+        if self.storage is not None:
+            self.storage.close()
+
 
 class FTPConfig:
     """
@@ -0,0 +1,116 @@
+from autobusy.downloader.downloader import RequestHandler
+import os
+import statistics
+import time
+
+
+def percentile(values: list[float], q: int) -> float:
+    """
+    Get a percentile of values
+    :param values: List of values
+    :param q: Percentile between 1 and 99
+    :return: percentile, None for no values
+    """
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+class LoadTest:
+    """
+    Class for load testing RequestHandler, e.g. against a local ReplayServer.
+    Polls are scheduled at a fixed interval like in download_live_data.py and run one at a time,
+    so a poll taking longer than the interval delays the next ones.
+    For each poll the lateness with respect to the schedule (poll jitter), the time of the request,
+    the time of saving the data to the file and of the listeners, and the size of the file are measured.
+    """
+    def __init__(self, request_handler: RequestHandler, interval: float, polls: int):
+        """
+        Constructor
+        :param request_handler: Request handler to be tested
+        :param interval: Time in seconds between scheduled polls
+        :param polls: Number of polls
+        """
+        self.request_handler = request_handler
+        self.interval = interval
+        self.polls = polls
+
+    def poll(self, scheduled: float) -> dict:
+        """
+        Run one poll: request, save and pass the data to the listeners
+        :param scheduled: Scheduled start of the poll (time.perf_counter)
+        :return: dict with the measurements of the poll
+        """
+        handler = self.request_handler
+        started = time.perf_counter()
+        record = {'lateness': started - scheduled, 'duration': None, 'request': None, 'write': None,
+                  'listeners': None, 'records': 0, 'file_size': None, 'error': None}
+        try:
+            data = handler.get_bus_locations()
+            saved = time.perf_counter()
+            record['request'] = saved - started
+            record['records'] = len(data['result'])
+            handler.save(data)
+            notified = time.perf_counter()
+            record['write'] = notified - saved
+            for listener in handler.listeners:
+                listener(data)
+            record['listeners'] = time.perf_counter() - notified
+            # SQLite keeps recent transactions in the write-ahead log
+            files = [handler.output_file, handler.output_file + '-wal']
+            record['file_size'] = sum(os.path.getsize(name) for name in files if os.path.exists(name))
+        except Exception as e:
+            record['error'] = type(e).__name__
+        record['duration'] = time.perf_counter() - started
+        return record
+
+    def run(self) -> list[dict]:
+        """
+        Run the polls
+        :return: list of dicts with the measurements of the polls
+        """
+        start = time.perf_counter()
+        records = []
+        for i in range(self.polls):
+            scheduled = start + i * self.interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            records.append(self.poll(scheduled))
+        return records
+
+    def summary(self, records: list[dict]) -> dict:
+        """
+        Summarize the measurements of the polls
+        :param records: Measurements returned by run, at least one
+        :return: dict with poll jitter (lateness percentiles), request and write times, errors by type,
+                 throughput in records per second and file growth per successful poll
+        """
+        ok = [r for r in records if r['error'] is None]
+        lateness = [r['lateness'] for r in records]
+        requests = [r['request'] for r in ok]
+        writes = [r['write'] for r in ok]
+        errors = {}
+        for r in records:
+            if r['error'] is not None:
+                errors[r['error']] = errors.get(r['error'], 0) + 1
+        elapsed = self.interval * (len(records) - 1) + records[-1]['lateness'] + records[-1]['duration']
+        sizes = [r['file_size'] for r in ok]
+        return {
+            'interval': self.interval,
+            'polls': len(records),
+            'successful': len(ok),
+            'errors': errors,
+            'jitter_p50': percentile(lateness, 50),
+            'jitter_p95': percentile(lateness, 95),
+            'jitter_max': max(lateness, default=None),
+            'request_p50': percentile(requests, 50),
+            'request_p95': percentile(requests, 95),
+            'write_mean': statistics.mean(writes) if writes else None,
+            'write_p95': percentile(writes, 95),
+            'write_max': max(writes, default=None),
+            'records_per_second': sum(r['records'] for r in ok) / elapsed if elapsed > 0 else None,
+            'bytes_per_poll': (sizes[-1] - sizes[0]) / (len(sizes) - 1) if len(sizes) > 1 else None,
+        }
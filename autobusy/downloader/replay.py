@@ -0,0 +1,218 @@
+from autobusy.downloader.downloader import RequestConfig
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import json
+import random
+import threading
+import time
+
+PATH = '/api/action/busestrams_get'
+
+# error payloads returned by the city API in the result field instead of a list of vehicles
+ERROR_RESULTS = [
+    'Błędna metoda lub parametry wywołania',
+    'Błędny apikey lub jego brak',
+]
+
+
+class ReplayConfig:
+    """
+    Configuration of the behaviour of the replay server
+    """
+    def __init__(self, latency: float = 0.0, latency_jitter: float = 0.0, error_rate: float = 0.0,
+                 http_error_rate: float = 0.0, timeout_rate: float = 0.0, timeout_delay: float = 15.0,
+                 payload_size: int = None, seed: int = None):
+        """
+        Constructor
+        :param latency: Minimum time in seconds before a response is sent
+        :param latency_jitter: Maximum random time in seconds added to the latency
+        :param error_rate: Probability of a response with an error message instead of a list in the result field
+        :param http_error_rate: Probability of a response with status 500
+        :param timeout_rate: Probability of a response delayed by timeout_delay (so that the client times out)
+        :param timeout_delay: Delay in seconds of responses simulating timeouts
+        :param payload_size: Number of vehicles in each response, snapshots are truncated or repeated
+                             with changed vehicle numbers to match it, as recorded by default
+        :param seed: Seed of the random generator deciding about errors and latency
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+        self.payload_size = payload_size
+        self.seed = seed
+
+
+class ReplayServer:
+    """
+    Local HTTP server emulating the busestrams_get endpoint of the city API, for tests and load tests
+    of RequestHandler without network access or rate limits.
+    It accepts the same request parameters as the API and answers each request with the next snapshot
+    of an archive (recorded or synthetic), starting over after the last one, in the same response shape.
+    Requests with wrong parameters get the error payload of the API.
+    """
+    def __init__(self, snapshots: list[dict], config: ReplayConfig = None, apikey: str = None,
+                 host: str = '127.0.0.1', port: int = 0):
+        """
+        Constructor
+        :param snapshots: List of dicts with request time and result field of responses (the archive format)
+        :param config: Configuration of latency and errors, no latency and no errors by default
+        :param apikey: API key accepted by the server, any key by default
+        :param host: Host to listen on
+        :param port: Port to listen on, a free port by default
+        """
+        if not snapshots:
+            raise ValueError('No snapshots to replay')
+        self.snapshots = snapshots
+        self.config = config or ReplayConfig()
+        self.apikey = apikey
+        self.resource_id = RequestConfig('').resource_id
+        self.random = random.Random(self.config.seed)
+        self.lock = threading.Lock()
+        self.position = 0
+        self.stats = {'requests': 0, 'snapshots': 0, 'errors': 0, 'http_errors': 0, 'timeouts': 0,
+                      'bad_requests': 0}
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @staticmethod
+    def from_archive(filename: str, config: ReplayConfig = None, **kwargs) -> 'ReplayServer':
+        """
+        Create a server replaying an archive written by RequestHandler
+        :param filename: Name of the archive
+        :param config: Configuration of latency and errors
+        :param kwargs: Other arguments of the constructor
+        :return: server
+        """
+        with open(filename, 'r') as f:
+            return ReplayServer(json.load(f), config, **kwargs)
+
+    @property
+    def url(self) -> str:
+        """
+        URL of the emulated endpoint, to be passed to RequestConfig
+        :return: URL
+        """
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}{PATH}'
+
+    def start(self) -> 'ReplayServer':
+        """
+        Start serving in a background thread
+        :return: self
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and close the socket
+        :return: None
+        """
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def next_result(self) -> list[dict]:
+        """
+        Get the result field of the next snapshot, resized to the configured payload size
+        :return: list of vehicles
+        """
+        with self.lock:
+            snapshot = self.snapshots[self.position]
+            self.position = (self.position + 1) % len(self.snapshots)
+        result = snapshot['result']
+        size = self.config.payload_size
+        if size is None or size == len(result):
+            return result
+        if size < len(result) or not result:
+            return result[:size]
+        copies = []
+        for i in range(len(result), size):
+            vehicle = result[i % len(result)]
+            copies.append(dict(vehicle, VehicleNumber=f'{vehicle["VehicleNumber"]}-{i // len(result)}'))
+        return result + copies
+
+    def respond(self, query: dict) -> tuple[int, dict, float]:
+        """
+        Decide about the response to a request
+        :param query: Query parameters of the request
+        :return: tuple of status code, JSON body and delay in seconds
+        """
+        config = self.config
+        with self.lock:
+            self.stats['requests'] += 1
+            draw = self.random.random()
+            delay = config.latency + self.random.random() * config.latency_jitter
+        if (query.get('resource_id') != self.resource_id or query.get('type') not in ('1', '2') or
+                (self.apikey is not None and query.get('apikey') != self.apikey)):
+            kind = 'bad_requests'
+            response = (200, {'result': ERROR_RESULTS[0] if query.get('apikey') else ERROR_RESULTS[1]}, delay)
+        elif draw < config.timeout_rate:
+            kind = 'timeouts'
+            response = (200, {'result': self.next_result()}, config.timeout_delay)
+        elif draw < config.timeout_rate + config.http_error_rate:
+            kind = 'http_errors'
+            response = (500, {'error': 'Internal Server Error'}, delay)
+        elif draw < config.timeout_rate + config.http_error_rate + config.error_rate:
+            kind = 'errors'
+            response = (200, {'result': self.random.choice(ERROR_RESULTS)}, delay)
+        else:
+            kind = 'snapshots'
+            response = (200, {'result': self.next_result()}, delay)
+        with self.lock:
+            self.stats[kind] += 1
+        return response
+
+    def handler_class(self):
+        """
+        Create the request handler class of the HTTP server, bound to this replay server
+        :return: request handler class
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def reply(self):
+                url = urlsplit(self.path)
+                if url.path != PATH:
+                    self.send_error(404)
+                    return
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                status, body, delay = server.respond(query)
+                if delay > 0:
+                    time.sleep(delay)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json; charset=utf-8')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                self.reply()
+
+            def do_GET(self):
+                self.reply()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,163 @@
+import pathlib
+import sqlite3
+import threading
+from datetime import datetime
+
+# suffixes of files saved in SQLite instead of JSON
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+# fields of the vehicles in the responses of the API, in the order of the API
+FIELDS = ['Lines', 'Lon', 'VehicleNumber', 'Time', 'Lat', 'Brigade']
+COLUMNS = FIELDS + ['RequestTime']
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS pings (
+        Lines TEXT, Lon REAL, VehicleNumber TEXT, Time TEXT, Lat REAL, Brigade TEXT, RequestTime TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS pings_vehicle_time ON pings (VehicleNumber, Time)',
+    'CREATE INDEX IF NOT EXISTS pings_line_time ON pings (Lines, Time)',
+]
+
+
+def is_sqlite(filename: str) -> bool:
+    """
+    Check whether a file is saved in SQLite
+    :param filename: Name of the file
+    :return: True if the file has one of the SQLite suffixes
+    """
+    return filename.lower().endswith(SQLITE_SUFFIXES)
+
+
+def format_time(value) -> str:
+    """
+    Format a time in the format of the API
+    :param value: datetime (or pandas Timestamp) or string in the format of the API
+    :return: string in the format of the API
+    """
+    return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+
+
+class SQLiteStorage:
+    """
+    Storage of the data of requests in an SQLite database, one row per vehicle,
+    with indexes on (VehicleNumber, Time) and (Lines, Time) for range queries.
+    The database is in WAL mode, so it can be queried while data is being saved.
+    Data is buffered and written in one transaction per batch of requests
+    """
+    def __init__(self, filename: str, batch_size: int = 1, read_only: bool = False):
+        """
+        Constructor
+        :param filename: Name of the database file, created if it does not exist (unless read only)
+        :param batch_size: Number of requests saved in one transaction
+        :param read_only: Whether the database is only queried
+        """
+        self.filename = filename
+        self.batch_size = batch_size
+        self.buffer = []
+        self.buffered = 0
+        self.lock = threading.Lock()
+        if read_only:
+            uri = pathlib.Path(filename).resolve().as_uri() + '?mode=ro'
+            self.connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return
+        # requests may be saved from the threads of the scheduler
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def save(self, data: dict):
+        """
+        Add the data of a request to the buffer and write the buffer if it is full
+        :param data: dict with request time and result field of response
+        :return: None
+        """
+        with self.lock:
+            self.buffer.extend(tuple(vehicle.get(field) for field in FIELDS) + (data['request_time'],)
+                               for vehicle in data['result'])
+            self.buffered += 1
+            if self.buffered >= self.batch_size:
+                self.write()
+
+    def write(self):
+        """
+        Write the buffer in one transaction, the lock must be held
+        :return: None
+        """
+        if self.buffer:
+            with self.connection:
+                self.connection.executemany(f'INSERT INTO pings VALUES ({", ".join("?" * len(COLUMNS))})',
+                                            self.buffer)
+        self.buffer = []
+        self.buffered = 0
+
+    def flush(self):
+        """
+        Write the buffered data
+        :return: None
+        """
+        with self.lock:
+            self.write()
+
+    def close(self):
+        """
+        Write the buffered data and close the database
+        :return: None
+        """
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def query(self, vehicle: str = None, line: str = None, start=None, end=None) -> list[tuple]:
+        """
+        Get the saved vehicles matching all the given conditions, in the order in which they were saved
+        :param vehicle: Vehicle number
+        :param line: Line number
+        :param start: Minimum time of the vehicles (inclusive), datetime or string in the format of the API
+        :param end: Maximum time of the vehicles (exclusive), datetime or string in the format of the API
+        :return: list of tuples of values of COLUMNS
+        """
+        conditions = []
+        params = []
+        for condition, value in [('VehicleNumber = ?', vehicle), ('Lines = ?', line),
+                                 ('Time >= ?', format_time(start)), ('Time < ?', format_time(end))]:
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self.lock:
+            self.write()
+            return self.connection.execute(
+                f'SELECT {", ".join(COLUMNS)} FROM pings{where} ORDER BY rowid', params
+            ).fetchall()
+
+    def iter_requests(self, batch_size: int = 2 ** 16):
+        """
+        Get the saved vehicles grouped by request, in the order in which they were saved (that of request time),
+        reading the rows in batches without sorting the table
+        :param batch_size: Number of rows read from the database at once
+        :return: generator of dicts with request time and result field of response, as saved
+        """
+        with self.lock:
+            self.write()
+        cursor = self.connection.execute(f'SELECT {", ".join(COLUMNS)} FROM pings ORDER BY rowid')
+        request_time, result = None, []
+        rows = cursor.fetchmany(batch_size)
+        while rows:
+            for row in rows:
+                if row[-1] != request_time and result:
+                    yield {'request_time': request_time, 'result': result}
+                    result = []
+                request_time = row[-1]
+                result.append(dict(zip(FIELDS, row[:-1])))
+            rows = cursor.fetchmany(batch_size)
+        if result:
+            yield {'request_time': request_time, 'result': result}
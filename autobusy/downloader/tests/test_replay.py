@@ -0,0 +1,127 @@
+import pytest
+from autobusy.downloader.downloader import RequestHandler, RequestConfig
+from autobusy.downloader.replay import ReplayServer, ReplayConfig, ERROR_RESULTS
+from autobusy.downloader.loadtest import LoadTest, percentile
+from requests import HTTPError, Timeout
+import json
+import requests
+
+snapshots = [
+    {
+        'request_time': '2024-01-29 08:00:30',
+        'result': [
+            {'Lines': '1', 'Lon': 21.011, 'VehicleNumber': '1234', 'Time': '2024-01-29 08:00:20', 'Lat': 52.123,
+             'Brigade': '1'},
+            {'Lines': '2', 'Lon': 21.012, 'VehicleNumber': '1235', 'Time': '2024-01-29 08:00:25', 'Lat': 52.124,
+             'Brigade': '2'},
+        ]
+    },
+    {
+        'request_time': '2024-01-29 08:01:30',
+        'result': [
+            {'Lines': '1', 'Lon': 21.013, 'VehicleNumber': '1234', 'Time': '2024-01-29 08:01:20', 'Lat': 52.125,
+             'Brigade': '1'},
+        ]
+    },
+]
+
+
+def handler(server, tmp_path, request_timeout=None):
+    return RequestHandler(RequestConfig('test_key', server.url, request_timeout), str(tmp_path / 'live.json'))
+
+
+def test_replay(tmp_path):
+    with ReplayServer(snapshots) as server:
+        request_handler = handler(server, tmp_path)
+        results = [request_handler.get_bus_locations()['result'] for _ in range(3)]
+    assert results == [snapshots[0]['result'], snapshots[1]['result'], snapshots[0]['result']]
+    assert server.stats['requests'] == 3
+    assert server.stats['snapshots'] == 3
+
+
+@pytest.mark.parametrize(
+    "config,expectation,stat",
+    [
+        (ReplayConfig(error_rate=1), TypeError, 'errors'),
+        (ReplayConfig(http_error_rate=1), HTTPError, 'http_errors'),
+        (ReplayConfig(timeout_rate=1, timeout_delay=0.5), Timeout, 'timeouts'),
+    ],
+)
+def test_replay_errors(config, expectation, stat, tmp_path):
+    with ReplayServer(snapshots, config) as server:
+        with pytest.raises(expectation):
+            handler(server, tmp_path, request_timeout=0.1).get_bus_locations()
+    assert server.stats[stat] == 1
+
+
+@pytest.mark.parametrize(
+    "params,apikey,expectation",
+    [
+        ({'resource_id': 'wrong', 'type': 1}, 'test_key', ERROR_RESULTS[0]),
+        ({'type': 1}, 'test_key', ERROR_RESULTS[0]),
+        ({'type': 1}, None, ERROR_RESULTS[1]),
+    ],
+)
+def test_replay_bad_requests(params, apikey, expectation):
+    with ReplayServer(snapshots) as server:
+        if apikey is not None:
+            params['apikey'] = apikey
+        response = requests.post(server.url, params=params)
+    assert response.json() == {'result': expectation}
+    assert server.stats['bad_requests'] == 1
+
+
+def test_replay_apikey(tmp_path):
+    with ReplayServer(snapshots, apikey='other_key') as server:
+        with pytest.raises(TypeError, match=ERROR_RESULTS[0]):
+            handler(server, tmp_path).get_bus_locations()
+
+
+@pytest.mark.parametrize(
+    "payload_size,expectation",
+    [
+        (1, ['1234']),
+        (2, ['1234', '1235']),
+        (5, ['1234', '1235', '1234-1', '1235-1', '1234-2']),
+    ],
+)
+def test_replay_payload_size(payload_size, expectation, tmp_path):
+    with ReplayServer(snapshots, ReplayConfig(payload_size=payload_size)) as server:
+        result = handler(server, tmp_path).get_bus_locations()['result']
+    assert [vehicle['VehicleNumber'] for vehicle in result] == expectation
+
+
+def test_replay_from_archive(tmp_path):
+    archive = tmp_path / 'archive.json'
+    archive.write_text(json.dumps(snapshots))
+    server = ReplayServer.from_archive(str(archive))
+    server.stop()
+    assert server.snapshots == snapshots
+
+
+def test_load_test(tmp_path):
+    with ReplayServer(snapshots, ReplayConfig(error_rate=0.5, seed=1)) as server:
+        request_handler = handler(server, tmp_path)
+        load_test = LoadTest(request_handler, 0.05, 8)
+        records = load_test.run()
+    summary = load_test.summary(records)
+    assert len(records) == 8
+    assert summary['successful'] + summary['errors'].get('TypeError', 0) == 8
+    assert summary['successful'] == server.stats['snapshots']
+    with open(request_handler.output_file) as f:
+        assert len(json.load(f)) == summary['successful']
+    assert summary['jitter_max'] >= 0
+    assert summary['records_per_second'] > 0
+
+
+@pytest.mark.parametrize(
+    "values,q,expectation",
+    [
+        ([], 50, None),
+        ([3.0], 95, 3.0),
+        ([1.0, 2.0, 3.0], 50, 2.0),
+        ([float(x) for x in range(101)], 95, 95.0),
+    ],
+)
+def test_percentile(values, q, expectation):
+    assert percentile(values, q) == expectation
@@ -136,3 +136,11 @@ def test_get_locations_to_json(request_handler, fs):
                 ]
             }
         ]
+
+
+@mock.patch.object(RequestHandler, 'get_bus_locations', mock_get_bus_locations)
+def test_get_locations_to_json_listeners(fs):
+    listener = mock.Mock()
+    request_handler = RequestHandler(RequestConfig('test_key'), 'test_file.json', [listener])
+    request_handler.get_locations_to_json()
+    listener.assert_called_once_with(mock_get_bus_locations.return_value)
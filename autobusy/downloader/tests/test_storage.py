@@ -0,0 +1,85 @@
+import pytest
+from autobusy.downloader.downloader import RequestHandler, RequestConfig
+from autobusy.downloader.storage import SQLiteStorage, COLUMNS, is_sqlite
+from unittest import mock
+from datetime import datetime
+import sqlite3
+
+
+def snapshot(minute: int) -> dict:
+    return {
+        'request_time': f'2024-01-29 07:{minute:02d}:30',
+        'result': [
+            {'Lines': str(line), 'Lon': 21.0 + minute / 100, 'VehicleNumber': str(1000 + line), 'Brigade': '1',
+             'Time': f'2024-01-29 07:{minute:02d}:{10 * line:02d}', 'Lat': 52.2}
+            for line in range(1, 4)
+        ]
+    }
+
+
+@pytest.mark.parametrize(
+    "filename,expectation",
+    [
+        ('live.db', True),
+        ('live.SQLITE', True),
+        ('live.sqlite3', True),
+        ('live.json', False),
+        ('db', False),
+    ],
+)
+def test_is_sqlite(filename, expectation):
+    assert is_sqlite(filename) == expectation
+
+
+def test_storage_batches(tmp_path):
+    filename = str(tmp_path / 'live.db')
+    storage = SQLiteStorage(filename, batch_size=2)
+    assert storage.connection.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    reader = sqlite3.connect(filename)
+    storage.save(snapshot(0))
+    assert reader.execute('SELECT COUNT(*) FROM pings').fetchone() == (0,)
+    storage.save(snapshot(1))
+    assert reader.execute('SELECT COUNT(*) FROM pings').fetchone() == (6,)
+    storage.save(snapshot(2))
+    storage.close()
+    assert reader.execute('SELECT COUNT(*) FROM pings').fetchone() == (9,)
+
+
+@pytest.mark.parametrize(
+    "params,expectation",
+    [
+        ({}, 9),
+        ({'vehicle': '1001'}, 3),
+        ({'line': '2', 'start': '2024-01-29 07:01:00'}, 2),
+        ({'line': '2', 'start': datetime(2024, 1, 29, 7, 1), 'end': datetime(2024, 1, 29, 7, 2)}, 1),
+        ({'vehicle': '1001', 'line': '2'}, 0),
+    ],
+)
+def test_storage_query(params, expectation, tmp_path):
+    with SQLiteStorage(str(tmp_path / 'live.db'), batch_size=10) as storage:
+        for minute in range(3):
+            storage.save(snapshot(minute))
+        rows = storage.query(**params)
+    assert len(rows) == expectation
+    assert all(len(row) == len(COLUMNS) for row in rows)
+    assert rows == sorted(rows, key=lambda row: row[COLUMNS.index('RequestTime')])
+
+
+def test_storage_plan(tmp_path):
+    with SQLiteStorage(str(tmp_path / 'live.db')) as storage:
+        for columns, index in [('VehicleNumber = ? AND Time >= ?', 'pings_vehicle_time'),
+                               ('Lines = ? AND Time < ?', 'pings_line_time')]:
+            plan = storage.connection.execute(f'EXPLAIN QUERY PLAN SELECT * FROM pings WHERE {columns}',
+                                              ('1', '2024')).fetchall()
+            assert index in plan[0][-1]
+
+
+def test_request_handler_sqlite(tmp_path):
+    filename = str(tmp_path / 'live.db')
+    request_handler = RequestHandler(RequestConfig('test_key'), filename, batch_size=2)
+    with mock.patch.object(RequestHandler, 'get_bus_locations', side_effect=[snapshot(0), snapshot(1), snapshot(2)]):
+        for _ in range(3):
+            request_handler.get_locations_to_json()
+    request_handler.close()
+    with SQLiteStorage(filename, read_only=True) as storage:
+        assert len(storage.query()) == 9
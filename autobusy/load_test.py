@@ -0,0 +1,156 @@
+from autobusy.downloader.downloader import RequestConfig, RequestHandler
+from autobusy.downloader.replay import ReplayConfig, ReplayServer
+from autobusy.downloader.loadtest import LoadTest
+from autobusy.analyzer.synthetic import SCALES, SyntheticNetwork
+import argparse
+import json
+import logging
+import os
+import tempfile
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+
+def check_intervals(intervals: list[float]):
+    if not all(0 < x <= 3600 for x in intervals):
+        raise ValueError('Intervals must be positive and at most 3600 seconds')
+
+
+def load_snapshots(args) -> list[dict]:
+    if args.archive is not None:
+        with open(args.archive, 'r') as f:
+            return json.load(f)
+    return SyntheticNetwork(**SCALES[args.scale]).snapshots(args.hour)
+
+
+def main(args):
+    check_intervals(args.intervals)
+    snapshots = load_snapshots(args)
+    config = ReplayConfig(args.latency, args.latency_jitter, args.error_rate, args.http_error_rate,
+                          args.timeout_rate, args.timeout_delay, args.payload_size, args.seed)
+    summaries = []
+    with ReplayServer(snapshots, config) as server, tempfile.TemporaryDirectory() as directory:
+        for interval in args.intervals:
+            output_file = os.path.join(directory, f'live-{interval:g}.{args.storage}')
+            request_handler = RequestHandler(RequestConfig('load-test', server.url, args.request_timeout),
+                                             output_file, batch_size=args.batch_size)
+            load_test = LoadTest(request_handler, interval, args.polls)
+            summary = load_test.summary(load_test.run())
+            request_handler.close()
+            logging.info('Interval %gs: %s', interval, summary)
+            summaries.append(summary)
+        summary_stats = dict(server.stats)
+    logging.info('Server: %s', summary_stats)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'server': summary_stats, 'intervals': summaries}, f, indent=4)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Polls a local replay of the live data API at given intervals and measures poll jitter, '
+                    'throughput and the cost of saving the data'
+    )
+    parser.add_argument(
+        '--intervals',
+        help='List of intervals between polls in seconds',
+        nargs='+',
+        type=float,
+        default=[1, 5, 15, 30, 60]
+    )
+    parser.add_argument(
+        '--polls',
+        help='Number of polls per interval',
+        type=int,
+        default=10
+    )
+    parser.add_argument(
+        '--archive',
+        help='Live data file to replay, synthetic data is replayed if not given',
+        required=False
+    )
+    parser.add_argument(
+        '--scale',
+        help='Scale of the synthetic data',
+        choices=list(SCALES),
+        default='warsaw'
+    )
+    parser.add_argument(
+        '--hour',
+        help='Hour of the synthetic data',
+        type=int,
+        default=8
+    )
+    parser.add_argument(
+        '--latency',
+        help='Minimum latency of the server in seconds',
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--latency-jitter',
+        help='Maximum random latency added by the server in seconds',
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--error-rate',
+        help='Probability of an error message in the result field',
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--http-error-rate',
+        help='Probability of a response with status 500',
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--timeout-rate',
+        help='Probability of a response delayed by the timeout delay',
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--timeout-delay',
+        help='Delay of responses simulating timeouts in seconds',
+        type=float,
+        default=15.0
+    )
+    parser.add_argument(
+        '--request-timeout',
+        help='Time in seconds after which the client abandons a request',
+        type=float,
+        default=10.0
+    )
+    parser.add_argument(
+        '--payload-size',
+        help='Number of vehicles in each response, as recorded if not given',
+        type=int,
+        required=False
+    )
+    parser.add_argument(
+        '--seed',
+        help='Seed of the random errors and latency',
+        type=int,
+        required=False
+    )
+    parser.add_argument(
+        '--storage',
+        help='Format in which the data is saved',
+        choices=['json', 'db'],
+        default='json'
+    )
+    parser.add_argument(
+        '--batch-size',
+        help='Number of requests saved in one transaction in SQLite',
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        '--output',
+        help='File to save the summaries to (JSON)',
+        required=False
+    )
+    program_args = parser.parse_args()
+    main(program_args)
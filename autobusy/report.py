@@ -0,0 +1,301 @@
+from autobusy.analyzer.parser import LiveParser, TimetableParser
+from autobusy.analyzer.analyzer import Analyzer, RouteData, Results
+from autobusy.analyzer.cache import code_version
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+
+# parameters of the report, the same as in analyze.ipynb
+SPEED_DELIMITERS = [0, 5, 25, 50, 70, 100]
+PUNCTUALITY_DELIMITERS = [2, 5, 10]
+DISTANCE_DELIMITERS = [0, 1, 5, 10, 15, 20, 30]
+FAST_PLACES = {'min_buses': 10, 'min_ratio': 0.2}
+BAD_STOPS = {'min_buses': 2, 'min_ratio': 0.2}
+STOP_TOLERANCE = 5
+LONGEST_ROUTES = 5
+
+MANIFEST = 'manifest.json'
+# punctuality cube written with the report (see cube.PunctualityCube)
+CUBE = 'punctuality_cube.npz'
+
+# columns of speed data written with the report (the speed data has two Time columns)
+SPEED_COLUMNS = ['VehicleNumber', 'Lon', 'Lat', 'Speed']
+
+# route data of a worker process, parsed once per process
+_route_data = None
+
+
+def options() -> dict:
+    """
+    Gets the parameters of the report, which are a part of the fingerprints of the windows.
+    :return: dictionary of parameters.
+    """
+    return {
+        'speed_delimiters': SPEED_DELIMITERS, 'punctuality_delimiters': PUNCTUALITY_DELIMITERS,
+        'distance_delimiters': DISTANCE_DELIMITERS, 'fast_places': FAST_PLACES, 'bad_stops': BAD_STOPS,
+        'stop_tolerance': STOP_TOLERANCE, 'longest_routes': LONGEST_ROUTES,
+    }
+
+
+def file_signature(filename: str) -> list:
+    """
+    Gets a signature of a file which changes when the file is modified, without reading it.
+    :param filename: path to the file.
+    :return: list of the absolute path, the size and the modification time of the file.
+    """
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+
+def window_fingerprint(archive: str, timetable: str, hour: int, version: str) -> str:
+    """
+    Gets the fingerprint of the inputs of a window.
+    :param archive: path to the live data archive.
+    :param timetable: path to the timetable or None.
+    :param hour: hour of the window.
+    :param version: code version of the analyzer package.
+    :return: hex digest.
+    """
+    description = {
+        'archive': file_signature(archive),
+        'timetable': file_signature(timetable) if timetable is not None else None,
+        'hour': hour,
+        'options': options(),
+        'version': version,
+    }
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def window_directory(output: str, archive: str, hour: int) -> str:
+    """
+    Gets the output directory of a window.
+    :param output: output directory of the report.
+    :param archive: path to the live data archive.
+    :param hour: hour of the window.
+    :return: path to the directory.
+    """
+    return os.path.join(output, f'{os.path.splitext(os.path.basename(archive))[0]}-{hour:02d}')
+
+
+def is_up_to_date(directory: str, fingerprint: str) -> bool:
+    """
+    Checks whether the report of a window was written for the same inputs.
+    :param directory: output directory of the window.
+    :param fingerprint: fingerprint of the inputs of the window.
+    :return: True if the manifest has the same fingerprint and all the files listed in it exist.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    return (manifest.get('fingerprint') == fingerprint and
+            all(os.path.exists(os.path.join(directory, name)) for name in manifest.get('files', [])))
+
+
+def write_figure(figure, directory: str, name: str) -> list[str]:
+    """
+    Writes a plotly figure as HTML and, if kaleido is installed, as a PNG image.
+    :param figure: plotly figure.
+    :param directory: output directory.
+    :param name: name of the files without extension.
+    :return: list of the names of the written files.
+    """
+    figure.write_html(os.path.join(directory, name + '.html'))
+    if importlib.util.find_spec('kaleido') is None:
+        return [name + '.html']
+    figure.write_image(os.path.join(directory, name + '.png'))
+    return [name + '.html', name + '.png']
+
+
+def write_table(table, directory: str, name: str) -> list[str]:
+    """
+    Writes a dataframe as CSV.
+    :param table: dataframe.
+    :param directory: output directory.
+    :param name: name of the file without extension.
+    :return: list with the name of the written file.
+    """
+    table.to_csv(os.path.join(directory, name + '.csv'), index=False)
+    return [name + '.csv']
+
+
+def write_report(results: Results, directory: str) -> list[str]:
+    """
+    Writes the plots and the tables of the results of a window, including the speed and punctuality data
+    and the punctuality cube read by the query service (see autobusy.service).
+    :param results: results with speed, places speed, distance data and longest routes,
+                    and optionally punctuality data and punctuality per stop.
+    :param directory: output directory of the window.
+    :return: list of the names of the written files.
+    """
+    files = []
+    files += write_figure(results.plot_speeds(SPEED_DELIMITERS), directory, 'speeds')
+    files += write_table(results.speed_counts(SPEED_DELIMITERS), directory, 'speeds')
+    files += write_table(results.speed_data[SPEED_COLUMNS], directory, 'speed_data')
+    results.plot_fast_places(**FAST_PLACES).save(os.path.join(directory, 'fast_places.html'))
+    files += ['fast_places.html'] + write_table(results.places_speed_data, directory, 'fast_places')
+    files += write_figure(results.plot_distance(DISTANCE_DELIMITERS), directory, 'distance')
+    files += write_table(results.distance_data, directory, 'distance')
+    results.plot_longest_routes().save(os.path.join(directory, 'longest_routes.html'))
+    files += ['longest_routes.html'] + write_table(results.longest_routes, directory, 'longest_routes')
+    if results.punctuality_data is not None:
+        files += write_figure(results.plot_punctuality(PUNCTUALITY_DELIMITERS), directory, 'punctuality')
+        files += write_table(results.punctuality_counts(PUNCTUALITY_DELIMITERS), directory, 'punctuality')
+        files += write_table(results.punctuality_data, directory, 'punctuality_data')
+        results.get_punctuality_cube().save(os.path.join(directory, CUBE))
+        files.append(CUBE)
+        results.plot_bad_stops(**BAD_STOPS).save(os.path.join(directory, 'bad_stops.html'))
+        files += ['bad_stops.html'] + write_table(results.stop_punctuality_data, directory, 'bad_stops')
+    return files
+
+
+def init_worker(timetable: str):
+    """
+    Parses the timetable once per worker process.
+    :param timetable: path to the timetable or None.
+    :return: None
+    """
+    global _route_data
+    _route_data = RouteData(*TimetableParser(timetable).parse()) if timetable is not None else None
+
+
+def report_archive(archive: str, windows: list[tuple[int, str]], output: str) -> list[int]:
+    """
+    Analyzes the windows of one archive and writes their reports. The archive is parsed once for all windows.
+    :param archive: path to the live data archive.
+    :param windows: list of (hour, fingerprint) of the windows to be analyzed.
+    :param output: output directory of the report.
+    :return: list of the hours of the windows written.
+    """
+    live_bus_df = LiveParser(archive).parse()
+    written = []
+    for hour, fingerprint in windows:
+        directory = window_directory(output, archive, hour)
+        os.makedirs(directory, exist_ok=True)
+        analyzer = Analyzer(hour)
+        try:
+            analyzer.create_speed_data(live_bus_df)
+            analyzer.create_places_speed_data(live_bus_df)
+            analyzer.create_distance_data(live_bus_df)
+            analyzer.create_longest_routes(live_bus_df, LONGEST_ROUTES)
+            if _route_data is not None:
+                analyzer.create_punctuality_data(live_bus_df, _route_data)
+                analyzer.create_stop_punctuality_data(live_bus_df, _route_data, STOP_TOLERANCE)
+            files = write_report(analyzer.results, directory)
+        except Exception as e:
+            logging.error('Window %s failed: %s', directory, repr(e))
+            continue
+        with open(os.path.join(directory, MANIFEST), 'w') as f:
+            json.dump({'archive': archive, 'hour': hour, 'fingerprint': fingerprint, 'files': files}, f, indent=2)
+        written.append(hour)
+    return written
+
+
+def split_windows(tasks: dict[str, list], workers: int) -> list[tuple[str, list]]:
+    """
+    Splits the windows of archives into tasks for worker processes. The windows of an archive are spread over
+    about workers / archives tasks, so that one archive with many windows still uses all workers,
+    while an archive is parsed only once per task.
+    :param tasks: dictionary of archive -> list of windows.
+    :param workers: number of worker processes.
+    :return: list of (archive, windows), the windows of each task in order.
+    """
+    parts = -(-workers // max(len(tasks), 1))
+    return [(archive, windows[i::min(parts, len(windows))])
+            for archive, windows in tasks.items() for i in range(min(parts, len(windows)))]
+
+
+def main(args):
+    version = code_version()
+    tasks = {}
+    for archive in args.live:
+        windows = []
+        for hour in args.hours:
+            fingerprint = window_fingerprint(archive, args.timetable, hour, version)
+            if not args.force and is_up_to_date(window_directory(args.output, archive, hour), fingerprint):
+                logging.info('Skipping %s, hour %d: inputs unchanged', archive, hour)
+                continue
+            windows.append((hour, fingerprint))
+        if windows:
+            tasks[archive] = windows
+
+    parts = split_windows(tasks, args.workers)
+    if args.workers <= 1 or len(parts) <= 1:
+        init_worker(args.timetable)
+        for archive, windows in tasks.items():
+            logging.info('Written %s, hours %s', archive, report_archive(archive, windows, args.output))
+        return
+    with ProcessPoolExecutor(min(args.workers, len(parts)), initializer=init_worker,
+                             initargs=(args.timetable,)) as executor:
+        futures = {executor.submit(report_archive, archive, windows, args.output): archive
+                   for archive, windows in parts}
+        for future in as_completed(futures):
+            logging.info('Written %s, hours %s', futures[future], future.result())
+
+
+def check_hours(hours: list[int]) -> list[int]:
+    """
+    Checks the hours of the windows.
+    :param hours: list of hours.
+    :return: sorted list of different hours.
+    """
+    if not all(0 <= x < 24 for x in hours):
+        raise ValueError('List of hours must only contain integers between 0 and 23')
+    return sorted(set(hours))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='Writes plots and tables of the analysis of live data archives for given hours'
+    )
+    parser.add_argument(
+        '--live',
+        help='Live data files (one archive per day)',
+        required=True,
+        nargs='+'
+    )
+    parser.add_argument(
+        '--timetable',
+        help='Timetable file, if given punctuality is analyzed',
+        required=False
+    )
+    parser.add_argument(
+        '--hours',
+        help='List of hours to analyze',
+        required=True,
+        nargs='+',
+        type=int
+    )
+    parser.add_argument(
+        '--output',
+        help='Output directory',
+        required=True
+    )
+    parser.add_argument(
+        '--workers',
+        help='Number of worker processes',
+        default=os.cpu_count() or 1,
+        type=int
+    )
+    parser.add_argument(
+        '--force',
+        help='Regenerate windows whose inputs have not changed',
+        action='store_true'
+    )
+    return parser
+
+
+def cli(argv: list[str] = None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = build_parser().parse_args(argv)
+    args.hours = check_hours(args.hours)
+    main(args)
+
+
+if __name__ == '__main__':
+    cli()
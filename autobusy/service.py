@@ -0,0 +1,542 @@
+from autobusy.analyzer.parser import TimetableParser
+from autobusy.analyzer.analyzer import RouteData, Results
+from autobusy.analyzer.cube import PunctualityCube
+from autobusy.report import MANIFEST, CUBE, SPEED_DELIMITERS, PUNCTUALITY_DELIMITERS, DISTANCE_DELIMITERS, \
+    FAST_PLACES, BAD_STOPS
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import pandas as pd
+import numpy as np
+import argparse
+import functools
+import json
+import logging
+import os
+import threading
+
+# table of the report -> (attribute of Results, columns, columns read as strings)
+TABLES = {
+    'speed_data.csv': ('speed_data', ['VehicleNumber', 'Lon', 'Lat', 'Speed'], ['VehicleNumber']),
+    'distance.csv': ('distance_data', ['VehicleNumber', 'Distance'], ['VehicleNumber']),
+    'punctuality_data.csv': ('punctuality_data', ['Line', 'Stop', 'Departure', 'Closest', 'Difference', 'Comment'],
+                             ['Line', 'Stop', 'Departure', 'Closest', 'Comment']),
+    'bad_stops.csv': ('stop_punctuality_data', ['Stop', 'Total', 'Late'], ['Stop']),
+    'fast_places.csv': ('places_speed_data', ['Lon', 'Lat', 'Total', 'Fast'], []),
+}
+
+
+def read_table(filename: str, columns: list[str], strings: list[str]) -> pd.DataFrame:
+    """
+    Reads a table written by the report.
+    :param filename: path to the CSV file.
+    :param columns: columns of the table, used if the table is empty.
+    :param strings: columns read as strings (line numbers, stop and vehicle IDs).
+    :return: dataframe.
+    """
+    try:
+        return pd.read_csv(filename, dtype={column: str for column in strings})
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=columns)
+
+
+def records(table: pd.DataFrame) -> list:
+    """
+    Converts a dataframe to JSON records.
+    :param table: dataframe.
+    :return: list of dictionaries, with missing and infinite values as None.
+    """
+    return json.loads(table.to_json(orient='records'))
+
+
+def punctuality_summary(cube: PunctualityCube, line: str = None, stop: str = None, hour: int = None,
+                        delimiters: list[float] = PUNCTUALITY_DELIMITERS) -> dict:
+    """
+    Summarizes the punctuality of all arrivals or of the arrivals of a line, at a stop or in an hour.
+    :param cube: punctuality cube.
+    :param line: line number, all lines if not given.
+    :param stop: stop ID, all stops if not given.
+    :param hour: hour of the timetable departures, all hours if not given.
+    :param delimiters: list of punctuality category delimiters (see histogram.punctuality_buckets).
+    :return: dictionary with the numbers of arrivals (total, early, on time, late), the mean difference in minutes
+             (negative for early arrivals) and the counts of the punctuality categories.
+    """
+    lines, stops, hours = [[x] if x is not None else None for x in (line, stop, hour)]
+    counts = cube.difference_counts(lines, stops, hours)
+    total = int(counts.sum())
+    categories = cube.punctuality_counts(delimiters, lines, stops, hours)
+    return {
+        'line': line,
+        'stop': stop,
+        'total': total,
+        'early': int(counts[cube.differences < 0].sum()),
+        'on_time': int(counts[cube.differences == 0].sum()),
+        'late': int(counts[cube.differences > 0].sum()),
+        'mean_difference': float(counts @ cube.differences / total) if total else None,
+        'counts': [{'Comment': comment, 'From': lower, 'To': upper if upper != np.inf else None,
+                    'Count': int(count)} for comment, lower, upper, count in categories.itertuples(index=False)],
+    }
+
+
+class Window:
+    """
+    Class for the results of one window of the report (see autobusy.report), loaded into a Results object,
+    with the punctuality data aggregated into a punctuality cube (see cube.PunctualityCube).
+    """
+
+    def __init__(self, directory: str, route_data: RouteData = None):
+        """
+        Constructor for the Window class.
+        :param directory: output directory of the window, with the manifest written by the report.
+        :param route_data: route data, used for stop names and positions and to recognize unknown lines.
+        """
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.name = os.path.basename(os.path.normpath(directory))
+        self.archive = manifest['archive']
+        self.hour = manifest['hour']
+        self.fingerprint = manifest['fingerprint']
+        self.route_data = route_data
+        self.results = Results()
+        for filename, (attribute, columns, strings) in TABLES.items():
+            if filename in manifest['files']:
+                setattr(self.results, attribute, read_table(os.path.join(directory, filename), columns, strings))
+        self.results.stop_info = route_data.stop_info if route_data is not None else None
+
+        self.cube = None
+        if CUBE in manifest['files']:
+            self.cube = PunctualityCube.load(os.path.join(directory, CUBE))
+        elif self.results.punctuality_data is not None:
+            self.cube = PunctualityCube.from_punctuality(self.results.punctuality_data)
+
+    def describe(self) -> dict:
+        """
+        Describes the window.
+        :return: dictionary with the name, the archive, the hour and the results loaded.
+        """
+        return {
+            'window': self.name,
+            'archive': self.archive,
+            'hour': self.hour,
+            'results': [attribute for attribute, _, _ in TABLES.values()
+                        if getattr(self.results, attribute) is not None],
+        }
+
+    def require(self, attribute: str) -> pd.DataFrame:
+        """
+        Gets a result of the window.
+        :param attribute: name of the result.
+        :return: dataframe.
+        """
+        data = getattr(self.results, attribute)
+        if data is None:
+            raise LookupError(f'{attribute.replace("_", " ").capitalize()} not available in window {self.name}')
+        return data
+
+    def punctuality(self, line: str = None, stop: str = None,
+                    delimiters: list[float] = PUNCTUALITY_DELIMITERS) -> dict:
+        """
+        Gets the punctuality of the window, of a line, at a stop or of a line at a stop.
+        :param line: line number, all lines if not given.
+        :param stop: stop ID, all stops if not given.
+        :param delimiters: list of punctuality category delimiters (see histogram.punctuality_buckets).
+        :return: dictionary with the numbers of arrivals (total, early, on time, late), the mean difference in minutes
+                 (negative for early arrivals) and the counts of the punctuality categories.
+        """
+        self.require('punctuality_data')
+        if line is not None and self.route_data is not None and line not in self.route_data.line_route_info:
+            raise LookupError(f'Unknown line {line}')
+        return {'window': self.name, **punctuality_summary(self.cube, line, stop, delimiters=delimiters)}
+
+    def lines(self) -> list[dict]:
+        """
+        Gets the punctuality of each line.
+        :return: list of dictionaries with the line number and the numbers of arrivals (Total, Early, Late)
+                 and the mean difference in minutes (MeanDifference).
+        """
+        self.require('punctuality_data')
+        return records(self.cube.summary('Line'))
+
+    def stops(self, line: str = None, min_buses: int = BAD_STOPS['min_buses'],
+              min_ratio: float = BAD_STOPS['min_ratio']) -> list[dict]:
+        """
+        Gets the stops with many late buses (as in Results.plot_bad_stops), with the tolerance of the report.
+        :param line: line number, only the stops where the line arrived are returned if given.
+        :param min_buses: minimum number of buses.
+        :param min_ratio: minimum ratio of late buses to total buses.
+        :return: list of dictionaries with the stop ID (Stop), the numbers of buses (Total, Late),
+                 the ratio of late buses (Ratio) and the name and position of the stop if known.
+        """
+        data = self.require('stop_punctuality_data')
+        data = data[(data['Total'] > min_buses) & (data['Late'] / data['Total'] > min_ratio)]
+        if line is not None:
+            line_stops = self.cube.summary('Stop', lines=[line])['Stop'] if self.cube is not None else []
+            data = data[data['Stop'].isin(line_stops)]
+        data = data.assign(Ratio=data['Late'] / data['Total'])
+        if self.results.stop_info is not None:
+            data = data.join(self.results.stop_info[['Name', 'Lon', 'Lat']], on='Stop')
+        return records(data.sort_values('Ratio', ascending=False, kind='stable'))
+
+    def counts(self, attribute: str, column: str, delimiters: list[float]) -> list[dict]:
+        """
+        Counts the values of a column of a result in buckets (see Results.counts).
+        :param attribute: name of the result.
+        :param column: name of the column.
+        :param delimiters: non-decreasing list of delimiters.
+        :return: list of dictionaries with the bounds of the buckets (From, To) and the counts (Count).
+        """
+        self.require(attribute)
+        return records(self.results.counts(attribute, column, delimiters))
+
+    def fast_places(self, min_buses: int = FAST_PLACES['min_buses'],
+                    min_ratio: float = FAST_PLACES['min_ratio']) -> list[dict]:
+        """
+        Gets the places with many fast buses (as in Results.plot_fast_places).
+        :param min_buses: minimum number of buses.
+        :param min_ratio: minimum ratio of fast buses.
+        :return: list of dictionaries with the corner of the cell (Lon, Lat) and the numbers of buses (Total, Fast).
+        """
+        data = self.require('places_speed_data')
+        return records(data[(data['Total'] > min_buses) & (data['Fast'] / data['Total'] > min_ratio)])
+
+
+def delimiters_param(params: dict, default: list[float]) -> list[float]:
+    """
+    Parses a comma-separated list of delimiters.
+    :param params: query parameters.
+    :param default: delimiters used if the parameter is not given.
+    :return: list of delimiters.
+    """
+    if 'delimiters' not in params:
+        return default
+    try:
+        return [float(x) for x in params['delimiters'].split(',')]
+    except ValueError:
+        raise ValueError(f'Invalid delimiters: {params["delimiters"]}')
+
+
+def number_param(params: dict, key: str, default: float, kind: type = float) -> float:
+    """
+    Parses a number.
+    :param params: query parameters.
+    :param key: name of the parameter.
+    :param default: value used if the parameter is not given.
+    :param kind: int or float.
+    :return: number.
+    """
+    if key not in params:
+        return default
+    try:
+        return kind(params[key])
+    except ValueError:
+        raise ValueError(f'Invalid {key}: {params[key]}')
+
+
+class ResultsStore:
+    """
+    Class for answering queries over the windows of a report directory (see autobusy.report).
+    Windows are loaded once and reloaded when their manifest changes (the manifest is written after all
+    the files of a window). Answers are encoded once and kept in a least recently used cache,
+    which is invalidated by reloads.
+    """
+
+    def __init__(self, directory: str, route_data: RouteData = None, cache_size: int = 1024):
+        """
+        Constructor for the ResultsStore class.
+        :param directory: output directory of the report.
+        :param route_data: route data, used for stop names and positions and to recognize unknown lines.
+        :param cache_size: maximum number of cached answers.
+        """
+        self.directory = directory
+        self.route_data = route_data
+        self.windows = {}
+        self.signatures = {}
+        self.generation = 0
+        self.history_cube = None
+        self.lock = threading.Lock()
+        self.cached_answer = functools.lru_cache(maxsize=cache_size)(self.answer)
+        self.refresh()
+
+    def scan(self) -> dict[str, int]:
+        """
+        Lists the windows of the report directory.
+        :return: dictionary of window name -> modification time of its manifest.
+        """
+        signatures = {}
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return signatures
+        for name in names:
+            try:
+                signatures[name] = os.stat(os.path.join(self.directory, name, MANIFEST)).st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+        return signatures
+
+    def refresh(self) -> bool:
+        """
+        Loads new and changed windows and forgets removed ones.
+        :return: True if any window changed.
+        """
+        with self.lock:
+            signatures = self.scan()
+            if signatures == self.signatures:
+                return False
+            windows = {}
+            for name, signature in signatures.items():
+                if self.signatures.get(name) == signature and name in self.windows:
+                    windows[name] = self.windows[name]
+                    continue
+                try:
+                    windows[name] = Window(os.path.join(self.directory, name), self.route_data)
+                except (OSError, ValueError, KeyError) as e:
+                    logging.error('Window %s not loaded: %s', name, repr(e))
+            self.windows = windows
+            self.signatures = signatures
+            self.generation += 1
+            self.history_cube = None
+            self.cached_answer.cache_clear()
+            logging.info('Loaded %d windows', len(windows))
+            return True
+
+    def window(self, params: dict) -> Window:
+        """
+        Gets the window of a query: the window given by name, the latest window of the given hour
+        or the latest window.
+        :param params: query parameters.
+        :return: window.
+        """
+        windows = self.windows
+        if 'window' in params:
+            if params['window'] not in windows:
+                raise LookupError(f'Unknown window {params["window"]}')
+            return windows[params['window']]
+        names = sorted(windows)
+        if 'hour' in params:
+            hour = number_param(params, 'hour', None, int)
+            names = [name for name in names if windows[name].hour == hour]
+        if not names:
+            raise LookupError('No window')
+        return windows[names[-1]]
+
+    def history(self, params: dict) -> dict:
+        """
+        Gets the punctuality over all the windows, e.g. several weeks of reports. The punctuality cubes
+        of the windows are merged once per reload.
+        :param params: query parameters: line, stop, hour and delimiters, all optional.
+        :return: dictionary with the number of windows, the punctuality (see punctuality_summary)
+                 and the punctuality per hour.
+        """
+        generation, windows, cube = self.generation, self.windows, self.history_cube
+        windows = [window for window in windows.values() if window.cube is not None]
+        if cube is None:
+            cube = PunctualityCube.merge([window.cube for window in windows])
+            with self.lock:
+                if self.generation == generation:
+                    self.history_cube = cube
+        hour = number_param(params, 'hour', None, int)
+        summary = punctuality_summary(cube, params.get('line'), params.get('stop'), hour,
+                                      delimiters_param(params, PUNCTUALITY_DELIMITERS))
+        lines, stops = [[params[x]] if x in params else None for x in ('line', 'stop')]
+        hours = cube.summary('Hour', lines, stops, [hour] if hour is not None else None)
+        return {'windows': len(windows), 'hour': hour, **summary, 'hours': records(hours)}
+
+    def query(self, path: str, params: dict) -> tuple[int, bytes]:
+        """
+        Answers a query, from the cache if possible.
+        :param path: path of the query, e.g. '/punctuality'.
+        :param params: query parameters.
+        :return: tuple of status code and JSON body.
+        """
+        return self.cached_answer(self.generation, path, tuple(sorted(params.items())))
+
+    def answer(self, generation: int, path: str, params: tuple[tuple[str, str], ...]) -> tuple[int, bytes]:
+        """
+        Answers a query.
+        :param generation: number of the reload the answer is valid for (a part of the cache key).
+        :param path: path of the query.
+        :param params: sorted query parameters.
+        :return: tuple of status code and JSON body.
+        """
+        params = dict(params)
+        try:
+            if path == '/windows':
+                body = [self.windows[name].describe() for name in sorted(self.windows)]
+            elif path == '/punctuality':
+                body = self.window(params).punctuality(params.get('line'), params.get('stop'),
+                                                       delimiters_param(params, PUNCTUALITY_DELIMITERS))
+            elif path == '/history':
+                body = self.history(params)
+            elif path == '/lines':
+                body = self.window(params).lines()
+            elif path == '/stops':
+                body = self.window(params).stops(params.get('line'),
+                                                 number_param(params, 'min_buses', BAD_STOPS['min_buses'], int),
+                                                 number_param(params, 'min_ratio', BAD_STOPS['min_ratio']))
+            elif path == '/speeds':
+                body = self.window(params).counts('speed_data', 'Speed', delimiters_param(params, SPEED_DELIMITERS))
+            elif path == '/distance':
+                body = self.window(params).counts('distance_data', 'Distance',
+                                                  delimiters_param(params, DISTANCE_DELIMITERS))
+            elif path == '/fast_places':
+                body = self.window(params).fast_places(number_param(params, 'min_buses', FAST_PLACES['min_buses'], int),
+                                                       number_param(params, 'min_ratio', FAST_PLACES['min_ratio']))
+            else:
+                return 404, json.dumps({'error': f'Unknown path {path}'}).encode()
+        except LookupError as e:
+            return 404, json.dumps({'error': e.args[0]}).encode()
+        except ValueError as e:
+            return 400, json.dumps({'error': str(e)}).encode()
+        return 200, json.dumps(body).encode()
+
+
+class QueryServer:
+    """
+    HTTP server answering GET queries with JSON from a ResultsStore, reloading the store in a background thread.
+    """
+
+    def __init__(self, store: ResultsStore, host: str = '127.0.0.1', port: int = 0, reload_interval: float = 5.0):
+        """
+        Constructor for the QueryServer class.
+        :param store: store of results.
+        :param host: host to listen on.
+        :param port: port to listen on, a free port by default.
+        :param reload_interval: time in seconds between checks for new results.
+        """
+        self.store = store
+        self.reload_interval = reload_interval
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.stopped = threading.Event()
+        self.threads = []
+
+    @property
+    def url(self) -> str:
+        """
+        Gets the base URL of the server.
+        :return: URL.
+        """
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def watch(self):
+        """
+        Reloads the store periodically until the server is stopped.
+        :return: None
+        """
+        while not self.stopped.wait(self.reload_interval):
+            try:
+                self.store.refresh()
+            except Exception as e:
+                logging.error('Reload failed: %s', repr(e))
+
+    def start(self) -> 'QueryServer':
+        """
+        Starts serving and watching for new results in background threads.
+        :return: self.
+        """
+        self.threads = [threading.Thread(target=self.server.serve_forever, daemon=True),
+                        threading.Thread(target=self.watch, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+        :return: None
+        """
+        self.stopped.set()
+        if self.threads:
+            self.server.shutdown()
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def handler_class(self):
+        """
+        Creates the request handler class of the HTTP server, bound to the store.
+        :return: request handler class.
+        """
+        store = self.store
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                status, payload = store.query(url.path, params)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='Serves queries over the results of the report as JSON, reloading them when new results land'
+    )
+    parser.add_argument(
+        '--results',
+        help='Output directory of the report',
+        required=True
+    )
+    parser.add_argument(
+        '--timetable',
+        help='Timetable file, if given stop names and positions are returned',
+        required=False
+    )
+    parser.add_argument(
+        '--host',
+        help='Host to listen on',
+        default='127.0.0.1'
+    )
+    parser.add_argument(
+        '--port',
+        help='Port to listen on',
+        default=8000,
+        type=int
+    )
+    parser.add_argument(
+        '--reload-interval',
+        help='Time in seconds between checks for new results',
+        default=5.0,
+        type=float
+    )
+    parser.add_argument(
+        '--cache-size',
+        help='Maximum number of cached answers',
+        default=1024,
+        type=int
+    )
+    return parser
+
+
+def cli(argv: list[str] = None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = build_parser().parse_args(argv)
+    route_data = RouteData(*TimetableParser(args.timetable).parse()) if args.timetable is not None else None
+    store = ResultsStore(args.results, route_data, args.cache_size)
+    with QueryServer(store, args.host, args.port, args.reload_interval) as server:
+        logging.info('Serving on %s', server.url)
+        try:
+            server.stopped.wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    cli()